@@ -1,17 +1,20 @@
 #!/usr/bin/env python3
 
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+import temporal_cube
+import figures
+import instrument
 
 sns.set()
 
 
+@instrument.timed('accidents/data_exploration')
 def main():
     path = '../data/accidents'
-    data = pd.read_csv(f'{path}/accident_data_clean.csv', header=0)
-
-    data.info()
+    with instrument.stage('temporal_cube'):
+        cube = temporal_cube.load(f'{path}/accident_data_clean')
+    print(f'{cube.counts.sum():,} accident records over years {", ".join(map(str, cube.years))}')
 
     hours_conversion = {0: '12AM - 1AM', 1: '1AM - 2AM', 2: '2AM - 3AM', 3: '3AM - 4AM',
                         4: '4AM - 5AM', 5: '5AM - 6AM', 6: '6AM - 7AM', 7: '7AM - 8AM',
@@ -25,16 +28,12 @@ def main():
                         'May': 5, 'June': 6, 'July': 7, 'August': 8,
                         'September': 9, 'October': 10, 'November': 11, 'December': 12}
 
-    data['hour_text'] = data['hour_of_day'].map(hours_conversion)
-    data['day_number'] = data['day_of_week'].map(day_conversion)
-    data['month_number'] = data['month'].map(month_conversion)
-
     hour_title = 'Percentage of Fatal Accidents by Hour of Day'
     hour_xlab = 'Hour of Day'
     hour_ylab = '% of Fatal Accidents'
     hour_fname = 'accidents_by_hour.png'
 
-    bar_line_dual_plot(data, 'hour_of_day', 'hour_text',
+    bar_line_dual_plot(cube.total(['hour_of_day']), None, hours_conversion,
                        hour_title, hour_xlab, hour_ylab, hour_fname, align='edge')
 
     day_title = 'Percentage of Fatal Accidents by Day of Week'
@@ -42,7 +41,7 @@ def main():
     day_ylab = '% of Fatal Accidents'
     day_fname = 'accidents_by_day.png'
 
-    bar_line_dual_plot(data, 'day_number', 'day_of_week',
+    bar_line_dual_plot(cube.total(['day_of_week']), day_conversion, None,
                        day_title, day_xlab, day_ylab, day_fname)
 
     month_title = 'Percentage of Fatal Accidents by Month'
@@ -50,25 +49,34 @@ def main():
     month_ylab = '% of Fatal Accidents'
     month_fname = 'accidents_by_month.png'
 
-    bar_line_dual_plot(data, 'month_number', 'month',
+    bar_line_dual_plot(cube.total(['month']), month_conversion, None,
                        month_title, month_xlab, month_ylab, month_fname)
 
-    line_plot(data)
+    line_plot(cube.total(['day_of_week', 'hour_of_day']).rename(index=day_conversion, level='day_of_week'))
+    figures.wait()
 
 
-def bar_line_dual_plot(data, num_col, str_col, title, xlab, ylab, fname, align='center'):
-    fig, (ax1, ax2) = plt.subplots(nrows=1, ncols=2, figsize=(16, 8))
+def bar_line_dual_plot(counts, num_labels, text_labels, title, xlab, ylab, fname, align='center'):
+    """
+        counts: accident counts in calendar order, relabelled by num_labels for the line plot
+        and by text_labels for the bar plot (None keeps the cube's labels)
+    """
+    percent = (counts / counts.sum()) * 100.
+    data_num = percent.rename(index=num_labels) if num_labels else percent
+    data_text = percent.rename(index=text_labels) if text_labels else percent
+    data_text = data_text.sort_values(ascending=False)
 
-    data_num = data.groupby(num_col).size()
-    data_num = (data_num / data_num.sum()) * 100.
+    figures.render(draw_bar_line_dual_plot, f'visualizations/{fname}',
+                   data_num, data_text, title, xlab, ylab, align)
+
+
+def draw_bar_line_dual_plot(data_num, data_text, title, xlab, ylab, align):
+    fig, (ax1, ax2) = plt.subplots(nrows=1, ncols=2, figsize=(16, 8))
 
     data_num.plot(ax=ax1)
     ax1.set_xlabel(xlab, fontsize=16)
     ax1.set_ylabel(ylab, fontsize=16)
 
-    data_text = data.groupby(str_col).size().sort_values(ascending=False)
-    data_text = (data_text / data_text.sum()) * 100.
-
     data_text.plot.bar(ax=ax2, align=align)
     ax2.tick_params('x', labelrotation=60)
     ax2.set_xlabel(xlab, fontsize=16)
@@ -76,20 +84,21 @@ def bar_line_dual_plot(data, num_col, str_col, title, xlab, ylab, fname, align='
 
     fig.subplots_adjust(top=0.25)
     fig.suptitle(title, fontsize=20)
-    plt.show()
-    fig.savefig(f'visualizations/{fname}')
+    return fig
+
+
+def line_plot(counts):
+    data = (counts / counts.sum()) * 100.
+    figures.render(draw_line_plot, 'visualizations/accidents_by_weekday_hour.png', data)
 
 
-def line_plot(data):
-    data = data.groupby(['day_number', 'hour_of_day']).size()
-    data = (data / data.sum()) * 100.
+def draw_line_plot(data):
     ax = data.plot(figsize=(16, 8))
 
     ax.set_title('Percentage of Fatal Accidents by Day of Week & Hour of Day', fontsize=20)
     ax.set_xlabel('Day of Week & Hour of Day', fontsize=16)
     ax.set_ylabel('% of Fatal Accidents', fontsize=16)
-    plt.show()
-    ax.get_figure().savefig('visualizations/accidents_by_weekday_hour.png')
+    return ax.get_figure()
 
 
 if __name__ == '__main__':
@@ -1,44 +1,84 @@
 #!/usr/bin/env python3
 
+import argparse
 import numpy as np
 import pandas as pd
-from sklearn.utils import resample
+import transforms
+import storage
+import pipeline
+import schema
+import state_aggregates
+import instrument
+import temporal_cube
 
 
-def main():
+@instrument.timed('accidents/data_prep')
+def main(csv=False, stream=False, memory_budget=512, workers=1):
     path = '../data/accidents'
-    data_2015 = pd.read_csv(f'{path}/accident_driver_data_2015.csv', header=0)
-    data_2016 = pd.read_csv(f'{path}/accident_driver_data_2016.csv', header=0)
-
-    data_2015 = data_prep(data_2015)
-    data_2016 = data_prep(data_2016)
-
-    accident_data = pd.concat([data_2015, data_2016])
+    if stream:
+        stream_main(path, csv, memory_budget)
+        return
+
+    if workers == 1:
+        with instrument.stage('read_csv') as stage:
+            data_2015 = pd.read_csv(f'{path}/accident_driver_data_2015.csv', header=0)
+            data_2016 = pd.read_csv(f'{path}/accident_driver_data_2016.csv', header=0)
+            stage.rows = len(data_2015) + len(data_2016)
+
+        with instrument.stage('data_prep', rows=len(data_2015) + len(data_2016)):
+            data_2015 = data_prep(data_2015)
+            data_2016 = data_prep(data_2016)
+
+        accident_data = pd.concat([data_2015, data_2016])
+    else:
+        with instrument.stage('parallel_prep') as stage:
+            accident_data = pipeline.parallel_prep([f'{path}/accident_driver_data_2015.csv',
+                                                    f'{path}/accident_driver_data_2016.csv'],
+                                                   data_prep, workers)
+            stage.rows = len(accident_data)
     accident_data.reset_index(drop=True, inplace=True)
+
+    before = schema.memory(accident_data)
+    with instrument.stage('schema', rows=len(accident_data)):
+        accident_data = schema.apply(accident_data, schema.ACCIDENTS)
+    schema.print_memory('accident_data_clean', before, schema.memory(accident_data))
     accident_data.info()
 
-    accident_data.to_csv(f'{path}/accident_data_clean.csv', index=False)
+    storage.write(accident_data, f'{path}/accident_data_clean', csv=csv)
+    with instrument.stage('aggregates', rows=len(accident_data)):
+        state_aggregates.update('accidents', accident_data, f'{path}/accident_data_clean')
+        temporal_cube.update(accident_data, f'{path}/accident_data_clean')
+
+
+def stream_main(path, csv, memory_budget):
+    """
+        Same outputs as main, produced chunk by chunk within memory_budget (MB)
+    """
+    files = [f'{path}/accident_driver_data_2015.csv', f'{path}/accident_driver_data_2016.csv']
+    aggregator = state_aggregates.Aggregator('accidents')
+    cube = temporal_cube.Cube()
 
-    df_majority = accident_data[accident_data['multiple_fatalities'] == 0]
-    df_minority = accident_data[accident_data['multiple_fatalities'] == 1]
+    def prep(chunk):
+        data = data_prep(chunk)
+        with instrument.stage('schema', rows=len(data)):
+            data = schema.apply(data, schema.ACCIDENTS)
+        with instrument.stage('aggregates', rows=len(data)):
+            return cube.add(aggregator.add(data))
 
-    df_minority_resampled = resample(df_minority,
-                                     n_samples=len(df_majority),
-                                     replace=True,
-                                     random_state=2020)
-    balanced_data = pd.concat([df_majority, df_minority_resampled])
-    balanced_data.reset_index(drop=True, inplace=True)
-    balanced_data.to_csv(f'{path}/accident_data_clean_balanced.csv', index=False)
+    with storage.Writer(f'{path}/accident_data_clean', csv=csv) as writer:
+        pipeline.stream_prep(files, prep, writer, memory_budget)
+    with instrument.stage('aggregates', rows=writer.rows):
+        state_aggregates.update('accidents', aggregator, f'{path}/accident_data_clean')
+        temporal_cube.update(cube, f'{path}/accident_data_clean')
 
 
 def data_prep(data):
     # Replace Unknown and Not Reported values with NaN
-    data.replace({'Unknown': np.nan,
-                  'Not Reported': np.nan,
-                  'Trafficway Not in State Inventory': np.nan,
-                  'Not Reported (Since 2010)': np.nan,
-                  'Unknown Body Type': np.nan},
-                 inplace=True)
+    transforms.replace_with_nan(data, ['Unknown',
+                                       'Not Reported',
+                                       'Trafficway Not in State Inventory',
+                                       'Not Reported (Since 2010)',
+                                       'Unknown Body Type'])
 
     # Replace unknown hour values (hour = 99) with NaN
     data['hour_of_day'].replace({99: np.nan}, inplace=True)
@@ -55,48 +95,12 @@ def data_prep(data):
     data['speed_limit'].replace({98: np.nan, 99: np.nan}, inplace=True)
     data['vehicle_year'].replace({9998: np.nan, 9999: np.nan}, inplace=True)
 
-    data['body_type'].replace(r'Unknown', np.nan, regex=True, inplace=True)
+    transforms.set_nan(data, 'body_type', transforms.contains(data['body_type'], 'Unknown'))
 
     data.dropna(inplace=True)
 
     # Feature Engineering
 
-    def hour_category(x):
-        """
-            'night': 10PM - 4AM
-            'morning': 4AM - 10AM
-            'day': 10AM - 4PM
-            'evening': 4PM - 10PM
-        """
-        if x in [22, 23, 0, 1, 2, 3]:
-            return 'night'
-        elif x in [4, 5, 6, 7, 8, 9]:
-            return 'morning'
-        elif x in [10, 11, 12, 13, 14, 15]:
-            return 'day'
-        elif x in [16, 17, 18, 19, 20, 21]:
-            return 'evening'
-        else:
-            return np.nan
-
-    def binarize_col(x):
-        if x > 0:
-            return 1
-        else:
-            return 0
-
-    def speeding_binary(x):
-        if 'Yes' in x:
-            return 1
-        elif 'No' in x:
-            return 0
-
-    def vision_binary(x):
-        if x == 'No Obstruction Noted' or x == 'No Driver Present/Unknown if Driver Present':
-            return 0
-        else:
-            return 1
-
     # Refactor land_use column to binary (0: Urban; 1: Rural)
     data['land_use'].replace({'Urban': 1,
                               'Rural': 0},
@@ -104,32 +108,32 @@ def data_prep(data):
     data.rename(columns={'land_use': 'land_use_urban'}, inplace=True)
 
     # Create part of day categorical column
-    data['part_of_day'] = data['hour_of_day'].apply(hour_category)
+    data['part_of_day'] = hour_category(data['hour_of_day'])
 
     # Create binary class column: is_weekend (0: weekday, 1: weekend)
-    data['is_weekend'] = data['day_of_week'].apply(lambda x: 1 if x in ['Saturday', 'Sunday'] else 0)
+    data['is_weekend'] = data['day_of_week'].isin(['Saturday', 'Sunday']).astype(int)
 
     # Create binary class column: multiple_vehicles (0: single vehicle; 1: multiple vehicles)
-    data['multiple_vehicles'] = data['num_vehicles'].apply(lambda x: 1 if x > 1 else 0)
+    data['multiple_vehicles'] = (data['num_vehicles'] > 1).astype(int)
 
     # Create binary class column: nonmotorist_involed (0: no non-motorists; 1: non-motorist(s) involved)
-    data['nonmotorist_involved'] = data['num_nonmotorists'].apply(lambda x: 1 if x > 0 else 0)
+    data['nonmotorist_involved'] = (data['num_nonmotorists'] > 0).astype(int)
 
     # Create binary class column: multiple_motorists (0: single motorist; 1: multiple motorists)
-    data['multiple_motorists'] = data['num_motorists'].apply(lambda x: 1 if x > 1 else 0)
+    data['multiple_motorists'] = (data['num_motorists'] > 1).astype(int)
 
     # Create binary class column: drunk_driver_involved (0: no drunk driver; 1: drunk driver involved)
-    data['drunk_driver_involved'] = data['num_drunk_drivers'].apply(lambda x: 1 if x > 0 else 0)
+    data['drunk_driver_involved'] = (data['num_drunk_drivers'] > 0).astype(int)
 
     # Create binary class label column: multiple fatalities (0: single fatality accident; 1: multiple fatalities)
-    data['multiple_fatalities'] = data['num_fatalities'].apply(lambda x: 1 if x > 1 else 0)
+    data['multiple_fatalities'] = (data['num_fatalities'] > 1).astype(int)
 
-    data['rollover'] = data['rollover'].apply(lambda x: 0 if x == 'No Rollover' else 1)
+    data['rollover'] = (data['rollover'] != 'No Rollover').astype(int)
 
-    data['previous_dwi_convictions'] = data['previous_dwi_convictions'].apply(binarize_col)
-    data['previous_speeding_convictions'] = data['previous_speeding_convictions'].apply(binarize_col)
-    data['speeding_related'] = data['speeding_related'].apply(speeding_binary)
-    data['driver_vision_obscured'] = data['driver_vision_obscured'].apply(vision_binary)
+    data['previous_dwi_convictions'] = binarize_col(data['previous_dwi_convictions'])
+    data['previous_speeding_convictions'] = binarize_col(data['previous_speeding_convictions'])
+    data['speeding_related'] = speeding_binary(data['speeding_related'])
+    data['driver_vision_obscured'] = vision_binary(data['driver_vision_obscured'])
 
     # Reset columns types to integers
     cols = ['hour_of_day', 'national_highway_system', 'previous_dwi_convictions', 'vehicle_year',
@@ -142,5 +146,46 @@ def data_prep(data):
     return data
 
 
+# Part of day label for each hour 0-23
+PART_OF_DAY = np.array(['night'] * 4 + ['morning'] * 6 + ['day'] * 6 + ['evening'] * 6 + ['night'] * 2,
+                       dtype=object)
+
+
+def hour_category(hours):
+    """
+        'night': 10PM - 4AM
+        'morning': 4AM - 10AM
+        'day': 10AM - 4PM
+        'evening': 4PM - 10PM
+    """
+    valid = hours.isin(range(24)).to_numpy()
+    parts = np.full(len(hours), np.nan, dtype=object)
+    parts[valid] = PART_OF_DAY[hours.to_numpy()[valid].astype(int)]
+    return pd.Series(parts, index=hours.index)
+
+
+def binarize_col(col):
+    return (col > 0).astype(int)
+
+
+def speeding_binary(col):
+    def speeding(values):
+        return np.select([values.str.contains('Yes', regex=False),
+                          values.str.contains('No', regex=False)],
+                         [1, 0], default=np.nan)
+
+    return pd.Series(transforms.lookup(col, speeding), index=col.index)
+
+
+def vision_binary(col):
+    return (~col.isin(['No Obstruction Noted', 'No Driver Present/Unknown if Driver Present'])).astype(int)
+
+
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Clean the yearly accident extracts')
+    parser.add_argument('--csv', action='store_true', help='also write the clean data as CSV')
+    parser.add_argument('--stream', action='store_true', help='process the extracts in bounded-memory chunks')
+    parser.add_argument('--memory-budget', type=int, default=512, help='memory budget in MB for --stream')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='clean (year, state) partitions on this many processes (-1 for all cores)')
+    main(**vars(parser.parse_args()))
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import argparse
+import spatial
+
+
+def print_crashes(ids, dist):
+    years, numbers = spatial.split_crash_ids(ids)
+    for year, number, km in zip(years, numbers, dist):
+        print('    {:>4} {:>8}  {:6.2f} km'.format(year, number, km))
+    print()
+
+
+def main(near=None, radius=10.0, k=None, top=10, cell_deg=0.1, hotspot_deg=0.5):
+    path = '../data/accidents'
+    index = spatial.load_or_build(f'{path}/accident_data_clean', f'{path}/features/spatial_index.npz', cell_deg)
+
+    if near is not None:
+        lat, lon = near
+        ids, dist = index.radius(lat, lon, radius)
+        print(f'{len(ids)} fatal crashes within {radius:g} km of ({lat}, {lon}) (year, consecutive number)')
+        print_crashes(ids[:top], dist[:top])
+
+        if k is not None:
+            ids, dist = index.kneighbors(lat, lon, k)
+            print(f'{k} nearest fatal crashes to ({lat}, {lon})')
+            print_crashes(ids, dist)
+
+    print(f'Top {top} hotspots ({hotspot_deg:g} degree cells, by fatalities)')
+    print(index.hotspots(top, hotspot_deg).to_string(index=False))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query fatal crashes by location and list crash hotspots')
+    parser.add_argument('--near', type=float, nargs=2, metavar=('LAT', 'LON'), help='point to search around')
+    parser.add_argument('--radius', type=float, default=10.0, help='search radius in km')
+    parser.add_argument('--k', type=int, default=None, help='also list the k nearest crashes')
+    parser.add_argument('--top', type=int, default=10, help='number of crashes and hotspots to list')
+    parser.add_argument('--cell-deg', type=float, default=0.1, help='index grid cell size in degrees')
+    parser.add_argument('--hotspot-deg', type=float, default=0.5, help='hotspot cell size in degrees')
+    args = parser.parse_args()
+
+    main(args.near, args.radius, args.k, args.top, args.cell_deg, args.hotspot_deg)
@@ -1,15 +1,30 @@
 #!/usr/bin/env python3
 
-import pandas as pd
-from sklearn.preprocessing import OrdinalEncoder, StandardScaler
-from sklearn.model_selection import train_test_split, GridSearchCV
+import os
+import argparse
+from sklearn.model_selection import train_test_split
 from sklearn.neighbors import KNeighborsClassifier
 import utils
+import storage
+import schema
+import feature_store
+import knn
+import scheduler
+import instrument
 
 
-def main():
+@instrument.timed('accidents/knn_model')
+def main(cores=None):
+    scheduler.run(jobs(), cores)
+
+
+def jobs():
+    # The grid search parallelizes over its 5 folds
+    return [scheduler.Job('accidents/KNN', fit_knn, cwd=os.path.dirname(os.path.abspath(__file__)), max_cores=5)]
+
+
+def fit_knn(n_jobs=1):
     path = '../data/accidents'
-    data = pd.read_csv(f'{path}/accident_data_clean_balanced.csv', header=0)
 
     cat_cols = ['month', 'roadway_type', 'intersection', 'light_condition', 'atmospheric_conditions',
                 'manner_of_collision', 'body_type', 'vehicle_conditions', 'part_of_day']
@@ -18,16 +33,20 @@ def main():
                    'multiple_vehicles', 'nonmotorist_involved', 'multiple_motorists', 'drunk_driver_involved']
     numeric_cols = ['vehicle_year', 'speed_limit']
 
-    data[cat_cols] = data[cat_cols].apply(lambda x: x.astype('category'))
-
-    labels = data['multiple_fatalities']
-    features = data[cat_cols + binary_cols + numeric_cols]
-    feature_names = features.columns
+    cols = cat_cols + binary_cols + numeric_cols
 
     # oe = OrdinalEncoder()
     # features = oe.fit_transform(features)
 
-    features = pd.get_dummies(features, columns=cat_cols)
+    def build():
+        data = storage.read(f'{path}/accident_data_clean', dtypes=schema.ACCIDENTS)
+        return feature_store.encode_one_hot(data, cols, cat_cols, 'multiple_fatalities')
+
+    with instrument.stage('load_data') as stage:
+        features, labels, feature_names, _ = feature_store.load_or_build(
+            'one_hot', f'{path}/accident_data_clean', {'cols': cols, 'cat_cols': cat_cols, 'encoding': 'one_hot'},
+            build, store_dir=f'{path}/features')
+        stage.rows = len(labels)
 
     # scaler = StandardScaler()
     # features = scaler.fit_transform(features)
@@ -38,19 +57,26 @@ def main():
     print(y_test.value_counts())
     print()
 
-    model = GridSearchCV(estimator=KNeighborsClassifier(),
-                         param_grid={'n_neighbors': range(1, 20, 2)},
-                         cv=5, scoring='f1')
+    model = knn.NeighborGridSearch(estimator=KNeighborsClassifier(),
+                                   param_grid={'n_neighbors': range(1, 20, 2)},
+                                   cv=5, scoring='f1', n_jobs=n_jobs, balance=True)
     model.fit(X_train, y_train)
     print(model.best_params_)
     print()
 
-    y_pred = model.predict(X_test)
-    y_probs = model.predict_proba(X_test)[:, 1]
+    with instrument.stage('predict', rows=len(X_test)):
+        y_pred = model.predict(X_test)
+        y_probs = model.predict_proba(X_test)[:, 1]
 
-    utils.print_metrics(y_test, y_pred)
+    with instrument.stage('metrics', rows=len(X_test)):
+        utils.print_metrics(y_test, y_pred)
+        utils.print_best_threshold(y_test, y_probs)
     utils.roc_curve(y_test, y_probs, 'KNN', 'knn')
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Tune and score the KNN model on the accident data')
+    parser.add_argument('--cores', type=int, default=None, help='cores to use (default: all)')
+    args = parser.parse_args()
+
+    main(args.cores)
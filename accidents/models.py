@@ -1,16 +1,35 @@
 #!/usr/bin/env python3
 
+import os
+import argparse
 import utils
-import pandas as pd
-from sklearn.preprocessing import OrdinalEncoder, StandardScaler
+import storage
+import schema
+import feature_store
+import scheduler
+import serve
+import instrument
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegressionCV
 
+# Cores each model can use (LogisticRegressionCV parallelizes over its 5 folds)
+MAX_CORES = {'Random Forest': None, 'Logistic Regression': 5}
 
-def main():
+
+@instrument.timed('accidents/models')
+def main(cores=None):
+    scheduler.run(jobs(), cores)
+
+
+def jobs():
+    return [scheduler.Job(f'accidents/{name}', fit_model, (name,), cwd=os.path.dirname(os.path.abspath(__file__)),
+                          max_cores=max_cores)
+            for name, max_cores in MAX_CORES.items()]
+
+
+def load_data():
     path = '../data/accidents'
-    data = pd.read_csv(f'{path}/accident_data_clean_balanced.csv', header=0)
 
     # Feature columns
     cat_cols = ['roadway_type', 'intersection', 'light_condition', 'atmospheric_conditions',
@@ -20,54 +39,78 @@ def main():
                    'multiple_vehicles', 'nonmotorist_involved', 'multiple_motorists', 'drunk_driver_involved']
     numeric_cols = ['vehicle_year', 'speed_limit']
 
-    data[cat_cols] = data[cat_cols].apply(lambda x: x.astype('category'))
-
-    labels = data['multiple_fatalities']
-    features = data[cat_cols + binary_cols + numeric_cols]
+    cols = cat_cols + binary_cols + numeric_cols
 
     # features = pd.get_dummies(features, columns=cat_cols, drop_first=True)
     # features.rename(columns={'manner_of_collision_Not Collision with Motor Vehicle in Transport (Not Necessarily in Transport for\n2005-2009)': 'manner_of_collision_Not Collision with Motor Vehicle in Transport'},
     #                 inplace=True)
-    feature_names = features.columns
 
-    oe = OrdinalEncoder()
-    features = oe.fit_transform(features)
+    def build():
+        data = storage.read(f'{path}/accident_data_clean', dtypes=schema.ACCIDENTS)
+        return feature_store.encode_ordinal(data, cols, 'multiple_fatalities')
 
-    scaler = StandardScaler()
-    features = scaler.fit_transform(features)
+    features, labels, feature_names, transformers = feature_store.load_or_build(
+        'ordinal', f'{path}/accident_data_clean', {'cols': cols, 'encoding': 'ordinal'},
+        build, store_dir=f'{path}/features')
 
     X_train, X_test, y_train, y_test = train_test_split(features, labels,
                                                         test_size=0.2, random_state=2020)
-    print('Class Balance')
-    print(y_test.value_counts())
-    print()
+    return X_train, X_test, y_train, y_test, feature_names, transformers
 
-    models = {
+
+def models(n_jobs=1):
+    return {
         'Random Forest': (RandomForestClassifier(n_estimators=100,
                                                  min_samples_leaf=5,
+                                                 class_weight='balanced',
+                                                 n_jobs=n_jobs,
                                                  random_state=2020),
                           'rf'),
         'Logistic Regression': (LogisticRegressionCV(cv=5, scoring='f1',
+                                                     class_weight='balanced',
                                                      max_iter=1000,
+                                                     n_jobs=n_jobs,
                                                      random_state=2020),
                                 'lr')
     }
 
-    for name, (model, suffix) in models.items():
-        print(name)
-        print('-' * 20)
+
+def fit_model(name, n_jobs=1):
+    with instrument.stage('load_data') as stage:
+        X_train, X_test, y_train, y_test, feature_names, transformers = load_data()
+        stage.rows = len(X_train) + len(X_test)
+    print('Class Balance')
+    print(y_test.value_counts())
+    print()
+
+    model, suffix = models(n_jobs)[name]
+
+    print(name)
+    print('-' * 20)
+    with instrument.stage('fit', rows=len(X_train)):
         model.fit(X_train, y_train)
+    with instrument.stage('save'):
+        serve.save(f'../data/accidents/artifacts/{suffix}.joblib', f'accidents/{suffix}',
+                   model, transformers, feature_names, schema.ACCIDENTS)
 
+    with instrument.stage('predict', rows=len(X_test)):
         y_pred = model.predict(X_test)
         y_probs = model.predict_proba(X_test)[:, 1]
 
+    with instrument.stage('metrics', rows=len(X_test)):
         utils.print_metrics(y_test, y_pred)
-        utils.roc_curve(y_test, y_probs, name, suffix)
-        utils.feature_importance(model, feature_names, name, suffix)
-        utils.permutation_importances(model, X_test, y_test, feature_names, name, suffix)
-        utils.permutation_importances(model, X_train, y_train, feature_names, name, suffix, dataset='train')
-        print('#' * 50)
+        utils.print_best_threshold(y_test, y_probs)
+    utils.roc_curve(y_test, y_probs, name, suffix)
+    utils.feature_importance(model, feature_names, name, suffix)
+    utils.permutation_importances(model, X_test, y_test, feature_names, name, suffix, n_jobs=n_jobs)
+    utils.permutation_importances(model, X_train, y_train, feature_names, name, suffix, dataset='train',
+                                  n_jobs=n_jobs)
+    print('#' * 50)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Fit the classification models on the accident data')
+    parser.add_argument('--cores', type=int, default=None, help='cores to use (default: all)')
+    args = parser.parse_args()
+
+    main(args.cores)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""
+    Materialized oversampling (a balanced copy of the clean accident data, stored and encoded
+    for training) against balancing at training time: class weights for the Random Forest and
+    oversampled row indices for KNN. Reports stored size, peak traced memory and time.
+
+    Run from the repository root:
+        python -m benchmarks.bench_balancing [n_rows]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.utils import resample
+import schema
+import storage
+import feature_store
+import knn
+from benchmarks import synthetic
+from accidents import data_prep as accident_prep
+
+COLS = ['roadway_type', 'intersection', 'light_condition', 'atmospheric_conditions', 'manner_of_collision',
+        'body_type', 'vehicle_conditions', 'part_of_day', 'land_use_urban', 'national_highway_system',
+        'speeding_related', 'is_weekend', 'multiple_vehicles', 'vehicle_year', 'speed_limit']
+LABEL = 'multiple_fatalities'
+
+
+def measured(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2 ** 20
+
+
+def materialized(data, tmp):
+    # As accidents/data_prep used to: a stored balanced copy, encoded and fit as is
+    majority = data[data[LABEL] == 0]
+    minority = resample(data[data[LABEL] == 1], n_samples=len(majority), replace=True, random_state=2020)
+    balanced = pd.concat([majority, minority]).reset_index(drop=True)
+    storage.write(balanced, f'{tmp}/balanced')
+
+    features, labels, _, _ = feature_store.encode_ordinal(balanced, COLS, LABEL)
+    RandomForestClassifier(n_estimators=50, min_samples_leaf=5, random_state=2020).fit(features, labels)
+    KNeighborsClassifier().fit(features, labels)
+    return os.path.getsize(f'{tmp}/balanced.parquet')
+
+
+def at_training(data):
+    features, labels, _, _ = feature_store.encode_ordinal(data, COLS, LABEL)
+    RandomForestClassifier(n_estimators=50, min_samples_leaf=5, class_weight='balanced',
+                           random_state=2020).fit(features, labels)
+    labels = np.asarray(labels)
+    rows = knn.balanced_indices(labels)
+    KNeighborsClassifier().fit(features[rows], labels[rows])
+
+
+def main(n_rows=2000000):
+    data = schema.apply(accident_prep.data_prep(synthetic.accident_data(n_rows)), schema.ACCIDENTS)
+    print('{:,} clean rows, {:.1%} positive'.format(len(data), data[LABEL].mean()))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.write(data, f'{tmp}/clean')
+        clean_size = os.path.getsize(f'{tmp}/clean.parquet') / 2 ** 20
+        balanced_size, base, base_peak = measured(materialized, data, tmp)
+    _, elapsed, peak = measured(at_training, data)
+
+    print('    materialized  {:8.2f} s  peak {:8.1f} MiB  stored {:6.1f} MiB'.format(
+        base, base_peak, clean_size + balanced_size / 2 ** 20))
+    print('    at training   {:8.2f} s  peak {:8.1f} MiB  stored {:6.1f} MiB'.format(elapsed, peak, clean_size))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+"""
+    Row-wise vs vectorized data_prep on synthetic extracts.
+
+    Run from the repository root:
+        python -m benchmarks.bench_data_prep [n_rows]
+"""
+
+import sys
+import time
+from benchmarks import legacy, synthetic
+from accidents import data_prep as accident_prep
+from persons import data_prep as person_prep
+
+
+def timed(func, data):
+    start = time.perf_counter()
+    result = func(data.copy())
+    return result, time.perf_counter() - start
+
+
+def compare(name, reference, candidate, raw):
+    expected, ref_time = timed(reference, raw)
+    result, new_time = timed(candidate, raw)
+
+    identical = expected.to_csv(index=False) == result.to_csv(index=False)
+    print(f'{name}: {len(raw):,} rows')
+    print('    row-wise   {:8.2f} s  {:>12,.0f} rows/s'.format(ref_time, len(raw) / ref_time))
+    print('    vectorized {:8.2f} s  {:>12,.0f} rows/s'.format(new_time, len(raw) / new_time))
+    print('    speedup    {:8.1f}x'.format(ref_time / new_time))
+    print('    identical output: {}'.format(identical))
+    return identical
+
+
+def main(n_rows=1_000_000):
+    raw = synthetic.accident_data(n_rows)
+    ok = compare('accidents/data_prep', legacy.accident_data_prep, accident_prep.data_prep, raw)
+
+    raw = synthetic.person_data(n_rows)
+    ok &= compare('persons/data_prep', legacy.person_data_prep, person_prep.data_prep, raw)
+
+    if not ok:
+        sys.exit('FAILED: vectorized data_prep output differs from the row-wise reference '
+                 '(python -m benchmarks.check_data_prep shows the first difference)')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+"""
+    Start-up cost of utils: import time, and the first call of a metrics printer and of a
+    plotting helper, each measured in a fresh interpreter.
+
+    Run from the repository root:
+        python -m benchmarks.bench_import [repeats]
+"""
+
+import sys
+import subprocess
+import numpy as np
+
+SETUP = 'import time; start = time.perf_counter()\n'
+REPORT = '\nprint((time.perf_counter() - start) * 1000)'
+
+CASES = {
+    'import utils': 'import utils',
+    'print_metrics': 'import io, contextlib, utils\n'
+                     'with contextlib.redirect_stdout(io.StringIO()):\n'
+                     '    utils.print_metrics([0, 1, 1, 0], [0, 1, 0, 0])',
+    'first figure': 'import utils\n'
+                    'utils.figures.pyplot().figure()',
+}
+
+
+def main(repeats=5):
+    for name, code in CASES.items():
+        times = [float(subprocess.run([sys.executable, '-c', SETUP + code + REPORT], capture_output=True,
+                                      text=True, check=True).stdout.split()[-1])
+                 for _ in range(repeats)]
+        print('    {:15s} {:8.1f} ms  (median of {})'.format(name, np.median(times), repeats))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
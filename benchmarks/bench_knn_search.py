@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""
+    NeighborGridSearch against GridSearchCV on the encoded synthetic person data.
+
+    Run from the repository root:
+        python -m benchmarks.bench_knn_search [n_rows]
+"""
+
+import sys
+import time
+import numpy as np
+import schema
+import feature_store
+from sklearn.model_selection import GridSearchCV
+from sklearn.neighbors import KNeighborsClassifier
+import knn
+from benchmarks import synthetic
+from persons import data_prep as person_prep
+
+
+def main(n_rows=20000):
+    data = schema.apply(person_prep.data_prep(synthetic.person_data(n_rows)), schema.PERSONS)
+
+    cols = ['person_type', 'trafficway_type', 'manner_of_collision', 'body_type', 'seating_position',
+            'ejection', 'safety_equipment_use', 'sex', 'land_use_urban', 'rollover', 'air_bag_deployed', 'age']
+    features, labels, _, _ = feature_store.encode_ordinal(data, cols, 'fatality')
+    print(f'{len(labels)} rows, {features.shape[1]} features')
+
+    searches = {
+        'GridSearchCV': GridSearchCV(KNeighborsClassifier(), {'n_neighbors': range(1, 20, 2)}, cv=5, scoring='f1'),
+        'NeighborGridSearch': knn.NeighborGridSearch(KNeighborsClassifier(), {'n_neighbors': range(1, 20, 2)},
+                                                     cv=5, scoring='f1'),
+    }
+    results = {}
+    for name, search in searches.items():
+        start = time.perf_counter()
+        search.fit(features, labels)
+        elapsed = time.perf_counter() - start
+        results[name] = search
+        print('    {:20s} {:8.2f} s  best {}  score {:.4f}'.format(name, elapsed, search.best_params_,
+                                                                      search.best_score_))
+
+    grid, shared = results['GridSearchCV'], results['NeighborGridSearch']
+    print('identical scores:', np.array_equal(grid.cv_results_['mean_test_score'],
+                                              shared.cv_results_['mean_test_score']))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
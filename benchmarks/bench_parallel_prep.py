@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+"""
+    Scaling of the (year, state) partitioned data_prep from 1 to N worker processes, against
+    the sequential data_prep and concat it replaces.
+
+    Run from the repository root:
+        python -m benchmarks.bench_parallel_prep [n_rows_per_year] [max_workers]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import pandas as pd
+import pipeline
+from benchmarks import synthetic
+from accidents import data_prep as accident_prep
+from persons import data_prep as person_prep
+
+
+def sequential(paths, prep):
+    """
+        The single-process path of the data_prep scripts: each file cleaned whole, then concatenated
+    """
+    data = pd.concat([prep(pd.read_csv(path, header=0)) for path in paths])
+    data.reset_index(drop=True, inplace=True)
+    return data
+
+
+def scaling(name, paths, prep, max_workers):
+    print(name)
+    start = time.perf_counter()
+    expected = sequential(paths, prep)
+    base_time = time.perf_counter() - start
+    print('    sequential  {:8.2f} s'.format(base_time))
+
+    workers = 1
+    while True:
+        start = time.perf_counter()
+        result = pipeline.parallel_prep(paths, prep, workers)
+        elapsed = time.perf_counter() - start
+
+        identical = result.equals(expected)
+        print('    {:3d} workers {:8.2f} s  speedup {:5.2f}x  identical to sequential: {}'.format(
+            workers, elapsed, base_time / elapsed, identical))
+
+        if workers >= max_workers:
+            break
+        workers = min(workers * 2, max_workers)
+
+def main(n_rows=500_000, max_workers=os.cpu_count()):
+    with tempfile.TemporaryDirectory() as tmp:
+        accident_paths, person_paths = [], []
+        for year in (2015, 2016):
+            accident_paths.append(f'{tmp}/accident_driver_data_{year}.csv')
+            synthetic.accident_data(n_rows, year=year, seed=year).to_csv(accident_paths[-1], index=False)
+            person_paths.append(f'{tmp}/person_data_{year}.csv')
+            synthetic.person_data(n_rows, year=year, seed=year).to_csv(person_paths[-1], index=False)
+
+        scaling('accidents/data_prep', accident_paths, accident_prep.data_prep, max_workers)
+        scaling('persons/data_prep', person_paths, person_prep.data_prep, max_workers)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
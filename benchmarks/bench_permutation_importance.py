@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+"""
+    sklearn permutation_importance against utils.permutation_importance on the encoded
+    synthetic accident data, with a fitted Random Forest.
+
+    Run from the repository root:
+        python -m benchmarks.bench_permutation_importance [n_rows] [n_jobs]
+"""
+
+import sys
+import time
+import numpy as np
+import schema
+import feature_store
+import utils
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.inspection import permutation_importance
+from benchmarks import synthetic
+from accidents import data_prep as accident_prep
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(n_rows=50000, n_jobs=1):
+    data = schema.apply(accident_prep.data_prep(synthetic.accident_data(n_rows)), schema.ACCIDENTS)
+    cols = ['roadway_type', 'intersection', 'light_condition', 'atmospheric_conditions', 'manner_of_collision',
+            'body_type', 'vehicle_conditions', 'part_of_day', 'land_use_urban', 'national_highway_system',
+            'speeding_related', 'is_weekend', 'multiple_vehicles', 'vehicle_year', 'speed_limit']
+    features, labels, _, _ = feature_store.encode_ordinal(data, cols, 'multiple_fatalities')
+    model = RandomForestClassifier(n_estimators=100, min_samples_leaf=5, random_state=2020).fit(features, labels)
+    print(f'{len(labels)} rows, {features.shape[1]} features')
+
+    expected, base_time = timed(permutation_importance, model, features, labels, n_repeats=10,
+                                random_state=2020, n_jobs=n_jobs)
+    print('    sklearn              {:8.2f} s'.format(base_time))
+
+    runs = {'batched': {}, 'batched, 25% rows': {'max_samples': 0.25}, 'batched, tol=0.002': {'tol': 0.002}}
+    for name, kwargs in runs.items():
+        result, elapsed = timed(utils.permutation_importance, model, features, labels, n_repeats=10,
+                                random_state=2020, n_jobs=n_jobs, **kwargs)
+        diff = np.abs(result.importances_mean - expected.importances_mean).max()
+        print('    {:20s} {:8.2f} s  speedup {:5.2f}x  max |mean diff| {:.4f}'.format(name, elapsed,
+                                                                                     base_time / elapsed, diff))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
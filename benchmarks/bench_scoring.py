@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""
+    sklearn metrics against the scoring engine: the print_metrics scores at one threshold,
+    and the same scores over a sweep of probability thresholds.
+
+    Run from the repository root:
+        python -m benchmarks.bench_scoring [n_rows] [n_thresholds]
+"""
+
+import sys
+import time
+import numpy as np
+from sklearn import metrics
+import scoring
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def sklearn_scores(labels, preds):
+    return (metrics.precision_recall_fscore_support(labels, preds), metrics.confusion_matrix(labels, preds),
+            metrics.accuracy_score(labels, preds))
+
+
+def sklearn_sweep(labels, probs, thresholds):
+    return [metrics.f1_score(labels, probs >= threshold) for threshold in thresholds]
+
+
+def main(n_rows=1000000, n_thresholds=200):
+    rng = np.random.default_rng(2020)
+    labels = rng.integers(0, 2, n_rows)
+    probs = np.clip(labels * 0.3 + rng.random(n_rows) * 0.7, 0, 1)
+    preds = (probs > 0.5).astype(int)
+    thresholds = np.linspace(0, 1, n_thresholds)
+    print(f'{n_rows:,} rows, {n_thresholds:,} thresholds')
+
+    (prfs, _, _), base = timed(sklearn_scores, labels, preds)
+    result, elapsed = timed(scoring.confusion, labels, preds)
+    print('    one threshold  sklearn {:8.3f} s  engine {:8.3f} s  speedup {:7.1f}x  same F1: {}'.format(
+        base, elapsed, base / elapsed, np.isclose(prfs[2][1], result.f1)))
+
+    expected, base = timed(sklearn_sweep, labels, probs, thresholds)
+    sweep, elapsed = timed(scoring.threshold_sweep, labels, probs, thresholds)
+    print('    sweep          sklearn {:8.3f} s  engine {:8.3f} s  speedup {:7.1f}x  same F1: {}'.format(
+        base, elapsed, base / elapsed, np.allclose(expected, sweep.f1)))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+"""
+    Scoring single records one predict call at a time against the serve.py micro-batcher,
+    with concurrent clients each sending one record per request.
+
+    Run from the repository root:
+        python -m benchmarks.bench_serving [n_requests] [n_clients]
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OrdinalEncoder, StandardScaler
+import serve
+
+DTYPES = {f'cat_{i}': 'category' for i in range(8)}
+
+
+def records(n_rows, seed=2020):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({col: rng.choice(['a', 'b', 'c', 'd', 'e'], n_rows) for col in DTYPES})
+    for i in range(8):
+        data[f'num_{i}'] = rng.integers(0, 100, n_rows)
+    data['label'] = (data['cat_0'].isin(['a', 'b']) & (data['num_0'] > 30)).astype(int)
+    return data
+
+
+def pipeline(data):
+    columns = [col for col in data if col != 'label']
+    model = Pipeline([('cast', serve.Cast(columns, DTYPES)),
+                      ('encoder', OrdinalEncoder()),
+                      ('scaler', StandardScaler()),
+                      ('model', RandomForestClassifier(n_estimators=100, min_samples_leaf=5, random_state=2020))])
+    return model.fit(data[columns], data['label'])
+
+
+def one_at_a_time(model, requests):
+    latencies = []
+    for request in requests:
+        start = time.perf_counter()
+        model.predict_proba(pd.DataFrame(request))
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def micro_batched(model, requests, n_clients):
+    batcher = serve.MicroBatcher(model)
+    with ThreadPoolExecutor(n_clients) as clients:
+        list(clients.map(batcher.score, requests))
+    return batcher.stats()
+
+
+def main(n_requests=2000, n_clients=32):
+    model = pipeline(records(20000))
+    requests = records(n_requests, seed=1).drop(columns='label').to_dict(orient='records')
+    requests = [[request] for request in requests]
+    print(f'{n_requests:,} single-record requests')
+
+    start = time.perf_counter()
+    latencies = np.array(one_at_a_time(model, requests)) * 1000
+    elapsed = time.perf_counter() - start
+    print('    one at a time  p50 {:7.2f} ms  p99 {:7.2f} ms  {:8,.0f} records/s'.format(
+        np.percentile(latencies, 50), np.percentile(latencies, 99), n_requests / elapsed))
+
+    stats = micro_batched(model, requests, n_clients)
+    print('    micro-batched  p50 {:7.2f} ms  p99 {:7.2f} ms  {:8,.0f} records/s  ({} clients, {} batches)'.format(
+        stats['p50_ms'], stats['p99_ms'], stats['records_per_s'], n_clients, stats['batches']))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
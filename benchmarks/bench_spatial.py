@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+"""
+    Radius and nearest-crash queries on the spatial grid index against a brute-force
+    great-circle scan of every crash, and hotspot binning of the whole set. The index built
+    from a multi-year clean accident dataset, whose consecutive numbers repeat across years,
+    is checked to hold every crash of every year.
+
+    Run from the repository root:
+        python -m benchmarks.bench_spatial [n_crashes] [n_queries]
+"""
+
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+import schema
+import storage
+import spatial
+from benchmarks import synthetic
+from accidents import data_prep as accident_prep
+
+RADIUS_KM = 25
+K = 10
+
+
+def brute_radius(lat, lon, lats, lons):
+    dist = spatial.haversine(lat, lon, lats, lons)
+    within = np.flatnonzero(dist <= RADIUS_KM)
+    return within[np.argsort(dist[within], kind='stable')]
+
+
+def brute_kneighbors(lat, lon, lats, lons):
+    return np.sort(spatial.haversine(lat, lon, lats, lons))[:K]
+
+
+def per_query_ms(func, queries):
+    start = time.perf_counter()
+    results = [func(lat, lon) for lat, lon in queries]
+    return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def multi_year(n_rows=20000, years=(2015, 2016, 2017)):
+    """
+        Crashes and fatalities in the index built from clean data over several years, against
+        the distinct (year, consecutive_number) crashes of that data
+    """
+    data = pd.concat([schema.apply(accident_prep.data_prep(synthetic.accident_data(n_rows, year=year, seed=i)),
+                                   schema.ACCIDENTS) for i, year in enumerate(years)], ignore_index=True)
+    crashes = data.drop_duplicates(['year', 'consecutive_number']).dropna(subset=['latitude', 'longitude'])
+    repeated = crashes['consecutive_number'].duplicated().sum()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.write(data, f'{tmp}/accident_data_clean')
+        index = spatial.load_or_build(f'{tmp}/accident_data_clean', f'{tmp}/spatial_index.npz')
+
+    expected = np.sort(spatial.crash_ids(crashes['year'], crashes['consecutive_number']))
+    same = np.array_equal(np.sort(index.ids_), expected) and \
+        np.isclose(index.weights_.sum(), crashes['num_fatalities'].sum())
+    print('    {} years, {:,} crashes ({:,} consecutive numbers repeated across years)  all indexed: {}'.format(
+        len(years), len(crashes), repeated, same))
+
+
+def main(n_crashes=2000000, n_queries=200):
+    # Crashes spread over the continental US, half of them around 200 city centers
+    rng = np.random.default_rng(2020)
+    centers = np.column_stack([rng.uniform(25, 49, 200), rng.uniform(-124, -67, 200)])
+    around = centers[rng.integers(0, 200, n_crashes // 2)] + rng.normal(0, 0.3, (n_crashes // 2, 2))
+    spread = np.column_stack([rng.uniform(25, 49, n_crashes - len(around)), rng.uniform(-124, -67, n_crashes - len(around))])
+    lats, lons = np.concatenate([around, spread]).T
+    queries = centers[rng.integers(0, 200, n_queries)] + rng.normal(0, 0.5, (n_queries, 2))
+    print(f'{n_crashes:,} crashes, {n_queries} queries')
+
+    start = time.perf_counter()
+    index = spatial.GridIndex(0.1).fit(lats, lons)
+    print('    build index          {:8.3f} s'.format(time.perf_counter() - start))
+
+    expected, base = per_query_ms(lambda lat, lon: brute_radius(lat, lon, lats, lons), queries)
+    found, elapsed = per_query_ms(lambda lat, lon: index.radius(lat, lon, RADIUS_KM)[0], queries)
+    same = all(np.array_equal(np.sort(e), np.sort(f)) for e, f in zip(expected, found))
+    print('    radius {} km  brute {:8.3f} ms  index {:8.3f} ms  speedup {:7.1f}x  same: {}'.format(
+        RADIUS_KM, base, elapsed, base / elapsed, same))
+
+    expected, base = per_query_ms(lambda lat, lon: brute_kneighbors(lat, lon, lats, lons), queries)
+    found, elapsed = per_query_ms(lambda lat, lon: index.kneighbors(lat, lon, K)[1], queries)
+    same = all(np.allclose(e, f) for e, f in zip(expected, found))
+    print('    {} nearest     brute {:8.3f} ms  index {:8.3f} ms  speedup {:7.1f}x  same: {}'.format(
+        K, base, elapsed, base / elapsed, same))
+
+    start = time.perf_counter()
+    index.hotspots(10, 0.5)
+    print('    hotspots (0.5 deg)   {:8.3f} s'.format(time.perf_counter() - start))
+
+    multi_year()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""
+    State means of the clean accident data by get_dummies and a groupby mean (the former
+    states/data_prep) against the per-(state, year) aggregate store: the cost of adding one
+    year to the store and of computing the means from it.
+
+    Run from the repository root:
+        python -m benchmarks.bench_state_aggregates [n_rows] [n_years]
+"""
+
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+import schema
+import storage
+import state_aggregates
+from benchmarks import synthetic
+from accidents import data_prep as accident_prep
+
+CAT_COLS = ['day_of_week', 'roadway_type', 'intersection', 'light_condition', 'atmospheric_conditions',
+            'manner_of_collision', 'body_type', 'vehicle_conditions', 'part_of_day']
+DROP = ['consecutive_number', 'vehicle_number', 'year', 'latitude', 'longitude', 'month']
+GROUP = ['state_name', 'state_number']
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def rescan(source):
+    data = storage.read(source, dtypes=schema.ACCIDENTS)
+    data = pd.get_dummies(data.drop(DROP, axis=1), columns=CAT_COLS)
+    return data.groupby(GROUP, observed=True).mean()
+
+
+def from_store(source, store_dir):
+    stats = state_aggregates.load('accidents', source, store_dir)
+    return state_aggregates.state_means(stats, GROUP, drop=DROP, cat_cols=CAT_COLS)
+
+
+def main(n_rows=4000000, n_years=4):
+    years = [schema.apply(accident_prep.data_prep(synthetic.accident_data(n_rows, year=2015 + i, seed=i)),
+                          schema.ACCIDENTS) for i in range(n_years)]
+    data = pd.concat(years, ignore_index=True)
+    print(f'{len(data):,} clean rows over {n_years} years')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = f'{tmp}/accident_data_clean'
+        storage.write(data, source)
+        state_aggregates.update('accidents', pd.concat(years[:-1], ignore_index=True), source, tmp)
+
+        expected, base = timed(rescan, source)
+        _, added = timed(state_aggregates.update, 'accidents', years[-1], source, tmp, True)
+        means, elapsed = timed(from_store, source, tmp)
+
+    same = list(expected.columns) == list(means.columns) and np.allclose(expected.to_numpy(), means.to_numpy())
+    print('    rescan with get_dummies  {:8.3f} s'.format(base))
+    print('    add one year to store    {:8.3f} s'.format(added))
+    print('    means from store         {:8.3f} s  speedup {:6.1f}x  same means: {}'.format(
+        elapsed, base / elapsed, same))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
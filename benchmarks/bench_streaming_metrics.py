@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+"""
+    sklearn ROC/AUC and regression metrics on full arrays against the streaming accumulators
+    fed in chunks: time, peak memory traced by numpy allocations, and the difference in AUC
+    and median absolute error.
+
+    Run from the repository root:
+        python -m benchmarks.bench_streaming_metrics [n_rows] [chunk_rows]
+"""
+
+import sys
+import time
+import tracemalloc
+import numpy as np
+from sklearn import metrics
+import scoring
+
+
+def chunks(n_rows, chunk_rows, seed=2020):
+    # Generated per chunk, so the streaming side never holds the whole set
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_rows, chunk_rows):
+        n = min(chunk_rows, n_rows - start)
+        labels = rng.integers(0, 2, n)
+        probs = np.clip(labels * 0.3 + rng.random(n) * 0.7, 0, 1)
+        y_true = rng.normal(10, 3, n)
+        yield labels, probs, y_true, y_true + rng.normal(0, 1, n)
+
+
+def measured(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2 ** 20
+
+
+def in_memory(n_rows, chunk_rows):
+    labels, probs, y_true, y_preds = (np.concatenate(arrays) for arrays in zip(*chunks(n_rows, chunk_rows)))
+    fpr, tpr, _ = metrics.roc_curve(labels, probs)
+    return metrics.auc(fpr, tpr), metrics.median_absolute_error(y_true, y_preds)
+
+
+def streaming(n_rows, chunk_rows):
+    roc, errors = scoring.ROCHistogram(), scoring.RegressionErrors()
+    for labels, probs, y_true, y_preds in chunks(n_rows, chunk_rows):
+        roc.update(labels, probs)
+        errors.update(y_true, y_preds)
+    return roc.auc(), errors.median_absolute_error
+
+
+def main(n_rows=5000000, chunk_rows=100000):
+    print(f'{n_rows:,} rows, chunks of {chunk_rows:,}')
+    (auc, median), base, base_peak = measured(in_memory, n_rows, chunk_rows)
+    (stream_auc, stream_median), elapsed, peak = measured(streaming, n_rows, chunk_rows)
+    print('    in memory  {:8.2f} s  peak {:8.1f} MiB'.format(base, base_peak))
+    print('    streaming  {:8.2f} s  peak {:8.1f} MiB'.format(elapsed, peak))
+    print('    AUC difference {:.2e}  median absolute error relative difference {:.2e}'.format(
+        abs(auc - stream_auc), abs(median - stream_median) / median))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+    Temporal breakdowns of accidents/data_exploration by reading the clean accident data and
+    grouping it (the former data_exploration) against the stored temporal cube: the cost of
+    adding one year to the cube and of every breakdown from it.
+
+    Run from the repository root:
+        python -m benchmarks.bench_temporal_cube [n_rows] [n_years]
+"""
+
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+import schema
+import storage
+import temporal_cube
+from benchmarks import synthetic
+from accidents import data_prep as accident_prep
+
+DAY_NUMBERS = {day: i + 1 for i, day in enumerate(temporal_cube.DAYS)}
+MONTH_NUMBERS = {month: i + 1 for i, month in enumerate(temporal_cube.MONTHS)}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def rescan(source):
+    data = storage.read(source, dtypes=schema.ACCIDENTS)
+    data['day_number'] = data['day_of_week'].map(DAY_NUMBERS).astype(int)
+    data['month_number'] = data['month'].map(MONTH_NUMBERS).astype(int)
+    return [data.groupby(col).size() for col in ['hour_of_day', 'day_number', 'month_number']] + \
+        [data.groupby(['day_number', 'hour_of_day']).size()]
+
+
+def from_cube(source, path):
+    cube = temporal_cube.load(source, path)
+    return [cube.total(['hour_of_day']),
+            cube.total(['day_of_week']).rename(index=DAY_NUMBERS),
+            cube.total(['month']).rename(index=MONTH_NUMBERS),
+            cube.total(['day_of_week', 'hour_of_day']).rename(index=DAY_NUMBERS, level='day_of_week')]
+
+
+def main(n_rows=4000000, n_years=4):
+    years = [schema.apply(accident_prep.data_prep(synthetic.accident_data(n_rows, year=2015 + i, seed=i)),
+                          schema.ACCIDENTS) for i in range(n_years)]
+    data = pd.concat(years, ignore_index=True)
+    print(f'{len(data):,} clean rows over {n_years} years')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source, path = f'{tmp}/accident_data_clean', f'{tmp}/temporal_cube.npz'
+        storage.write(data, source)
+        temporal_cube.update(pd.concat(years[:-1], ignore_index=True), source, path)
+
+        expected, base = timed(rescan, source)
+        _, added = timed(temporal_cube.update, years[-1], source, path, True)
+        totals, elapsed = timed(from_cube, source, path)
+
+    same = all(np.array_equal(e.to_numpy(), t.to_numpy()) and list(e.index) == list(t.index)
+               for e, t in zip(expected, totals))
+    print('    read and group rows      {:8.3f} s'.format(base))
+    print('    add one year to cube     {:8.3f} s'.format(added))
+    print('    breakdowns from cube     {:8.3f} s  speedup {:6.1f}x  same counts: {}'.format(
+        elapsed, base / elapsed, same))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+"""
+    Equivalence check of the vectorized data_prep against the row-wise reference in
+    benchmarks/legacy.py, on small synthetic extracts. Fails with the first difference.
+
+    Run from the repository root:
+        python -m benchmarks.check_data_prep [n_rows] [n_seeds]
+"""
+
+import sys
+import pandas as pd
+from benchmarks import legacy, synthetic
+from accidents import data_prep as accident_prep
+from persons import data_prep as person_prep
+
+CASES = [('accidents/data_prep', synthetic.accident_data, legacy.accident_data_prep, accident_prep.data_prep),
+         ('persons/data_prep', synthetic.person_data, legacy.person_data_prep, person_prep.data_prep)]
+
+
+def check(name, generate, reference, candidate, n_rows, seed):
+    raw = generate(n_rows, seed=seed)
+    expected = reference(raw.copy())
+    result = candidate(raw.copy())
+    try:
+        pd.testing.assert_frame_equal(result, expected)
+    except AssertionError as e:
+        raise AssertionError(f'{name} differs from the row-wise reference (seed {seed}): {e}') from None
+
+
+def main(n_rows=20000, n_seeds=3):
+    for name, generate, reference, candidate in CASES:
+        for seed in range(n_seeds):
+            check(name, generate, reference, candidate, n_rows, seed)
+        print(f'{name}: identical to the row-wise reference on {n_seeds} x {n_rows:,} rows')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
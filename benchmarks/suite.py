@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+"""
+    Benchmark suite for the whole pipeline on synthetic FARS-scale extracts.
+
+    For each scale, synthetic accident and person extracts with the columns of the query.py
+    outputs are generated in chunks and laid out in a scratch directory like data/, then the
+    pipeline runs on them stage by stage:
+        accidents and persons data_prep (streamed as with --stream, without the CSV parsing),
+        states/data_prep (the state means), accidents/data_exploration (the temporal breakdowns),
+        feature encoding, fit and predict of each model, and the utils metrics and permutation
+        importance helpers.
+    The model stages run on the first model_rows clean rows, as fitting on tens of millions of
+    rows is not what they are meant to measure.
+
+    Wall and CPU time per stage are printed with the change from the last run of the same
+    configuration and appended as one JSON line per scale to benchmarks/history.jsonl, with
+    the git commit, so regressions can be traced across commits.
+
+    Run from the repository root:
+        python -m benchmarks.suite [--rows 100000 1000000 ...] [--model-rows N] [--knn]
+"""
+
+import os
+import io
+import json
+import time
+import socket
+import argparse
+import platform
+import resource
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime, timezone
+import pandas as pd
+import schema
+import storage
+import figures
+import scoring
+import utils
+import state_aggregates
+import temporal_cube
+from benchmarks import synthetic
+from accidents import data_prep as accident_prep, models as accident_models, knn_model as accident_knn
+from persons import data_prep as person_prep, models as person_models
+from states import data_prep as state_prep
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY = os.path.join(REPO, 'benchmarks', 'history.jsonl')
+
+DATASETS = {'accidents': ('accident_data_clean', synthetic.accident_data, accident_prep.data_prep, schema.ACCIDENTS),
+            'persons': ('person_data_clean', synthetic.person_data, person_prep.data_prep, schema.PERSONS)}
+
+
+class Timings:
+    """
+        Wall time, CPU time and rows per named stage, summed over the blocks timed under a name
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=0):
+        entry = self.stages.setdefault(name, {'seconds': 0.0, 'cpu_seconds': 0.0, 'rows': 0})
+        wall, cpu = time.perf_counter(), time.process_time()
+        # The pipeline's own progress output would bury the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield entry
+        entry['seconds'] += time.perf_counter() - wall
+        entry['cpu_seconds'] += time.process_time() - cpu
+        entry['rows'] += rows
+
+
+def prep(name, n_rows, chunk_rows, timings):
+    """
+        Clean synthetic extracts of n_rows rows into ../data/{name}, as the data_prep scripts
+        do with --stream. Generating the extracts is not timed.
+    """
+    clean_name, generate, data_prep, dtypes = DATASETS[name]
+    source = f'../data/{name}/{clean_name}'
+    aggregator = state_aggregates.Aggregator(name)
+    cube = temporal_cube.Cube()
+
+    writer = storage.Writer(source)
+    for chunk in synthetic.chunks(generate, n_rows, chunk_rows):
+        with timings.stage(f'{name}/data_prep', rows=len(chunk)):
+            clean = aggregator.add(schema.apply(data_prep(chunk), dtypes))
+            if name == 'accidents':
+                cube.add(clean)
+            writer.write(clean)
+
+    with timings.stage(f'{name}/data_prep'):
+        writer.close()
+        state_aggregates.update(name, aggregator, source)
+        if name == 'accidents':
+            temporal_cube.update(cube, source)
+    return writer.rows
+
+
+def sample(name, model_rows):
+    """
+        The first model_rows clean rows of ../data/{name}, stored as the clean dataset of a
+        data/ tree of their own for the model scripts
+    """
+    clean_name = DATASETS[name][0]
+    # A batch ends at a Parquet row group, so it can hold fewer than model_rows rows
+    chunks, rows = [], 0
+    for chunk in storage.read_chunks(f'../data/{name}/{clean_name}', model_rows):
+        chunks.append(chunk.head(model_rows - rows))
+        rows += len(chunks[-1])
+        if rows == model_rows:
+            break
+    data = pd.concat(chunks, ignore_index=True)
+    os.makedirs(f'../model/data/{name}', exist_ok=True)
+    storage.write(data, f'../model/data/{name}/{clean_name}')
+    return len(data)
+
+
+def models(name, module, n_repeats, n_jobs, timings):
+    """
+        Encode features, then fit, predict and score each model of a models.py script the
+        way its fit_model does
+    """
+    with timings.stage(f'{name}/features') as entry:
+        X_train, X_test, y_train, y_test, _, _ = module.load_data()
+        entry['rows'] += len(X_train) + len(X_test)
+
+    for model_name, (model, suffix) in module.models(n_jobs).items():
+        with timings.stage(f'{name}/{suffix}/fit', rows=len(X_train)):
+            model.fit(X_train, y_train)
+
+        with timings.stage(f'{name}/{suffix}/predict', rows=len(X_test)):
+            y_pred = model.predict(X_test)
+            y_probs = model.predict_proba(X_test)[:, 1]
+
+        with timings.stage('utils/metrics', rows=len(X_test)):
+            utils.print_metrics(y_test, y_pred)
+            utils.print_best_threshold(y_test, y_probs)
+            roc = scoring.ROCHistogram().update(y_test, y_probs)
+            roc.auc()
+
+        with timings.stage('utils/permutation_importance', rows=len(X_test)):
+            utils.permutation_importance(model, X_test, y_test, n_repeats=n_repeats, random_state=2020, n_jobs=n_jobs)
+
+
+def run(n_rows, chunk_rows, model_rows, n_repeats, knn, n_jobs):
+    timings = Timings()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # The scripts read and write relative to their own directory, e.g. ../data/accidents
+        for directory in ['work', 'data/accidents', 'data/persons', 'data/states', 'model/work/visualizations']:
+            os.makedirs(os.path.join(tmp, directory))
+        os.chdir(os.path.join(tmp, 'work'))
+        try:
+            clean_rows = {name: prep(name, n_rows, chunk_rows, timings) for name in DATASETS}
+
+            with timings.stage('states/data_prep', rows=sum(clean_rows.values())):
+                state_prep.accident_data_prep()
+                state_prep.person_data_prep()
+
+            with timings.stage('accidents/data_exploration', rows=clean_rows['accidents']):
+                cube = temporal_cube.load('../data/accidents/accident_data_clean')
+                for by in [['hour_of_day'], ['day_of_week'], ['month'], ['day_of_week', 'hour_of_day']]:
+                    cube.total(by)
+
+            if model_rows:
+                for name in DATASETS:
+                    sample(name, model_rows)
+                os.chdir(os.path.join(tmp, 'model', 'work'))
+                models('accidents', accident_models, n_repeats, n_jobs, timings)
+                models('persons', person_models, n_repeats, n_jobs, timings)
+
+                if knn:
+                    figures.set_headless()
+                    with timings.stage('accidents/knn_model', rows=min(model_rows, clean_rows['accidents'])):
+                        accident_knn.fit_knn(n_jobs)
+                        figures.wait()
+        finally:
+            os.chdir(cwd)
+
+    return timings.stages, clean_rows
+
+
+def git_commit():
+    """
+        (commit hash, whether tracked files differ from it), or (None, None) outside a checkout
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_run(history, config):
+    for record in reversed(history):
+        if record['config'] == config:
+            return record
+    return None
+
+
+def print_results(record, previous):
+    print('{:<34} {:>12} {:>10} {:>10} {:>14} {:>9}'.format('stage', 'rows', 'wall s', 'cpu s', 'rows/s', 'change'))
+    for name, stage in record['stages'].items():
+        rate = '{:14,.0f}'.format(stage['rows'] / stage['seconds']) if stage['rows'] and stage['seconds'] else ''
+        change = ''
+        if previous is not None and name in previous['stages'] and previous['stages'][name]['seconds']:
+            change = '{:+8.1f}%'.format(100 * (stage['seconds'] / previous['stages'][name]['seconds'] - 1))
+        print('{:<34} {:>12,} {:10.3f} {:10.3f} {:>14} {:>9}'.format(name, stage['rows'], stage['seconds'],
+                                                                     stage['cpu_seconds'], rate, change))
+    print('peak RSS {:,.0f} MiB'.format(record['peak_rss_mb']))
+    if previous is not None:
+        print('change from {} run of {}'.format(previous['timestamp'], (previous['commit'] or 'unknown')[:10]))
+    print()
+
+
+def main(rows=(100000,), chunk_rows=1000000, model_rows=20000, n_repeats=5, knn=False, n_jobs=1, history=HISTORY):
+    commit, dirty = git_commit()
+    for n_rows in rows:
+        config = {'rows': n_rows, 'chunk_rows': chunk_rows, 'model_rows': model_rows, 'n_repeats': n_repeats,
+                  'knn': knn, 'n_jobs': n_jobs}
+        print(f'{n_rows:,} rows per dataset')
+        stages, clean_rows = run(n_rows, chunk_rows, model_rows, n_repeats, knn, n_jobs)
+
+        record = {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': commit,
+            'dirty': dirty,
+            'config': config,
+            'clean_rows': clean_rows,
+            'stages': stages,
+            # ru_maxrss is in KiB on Linux; it is the peak of the whole suite so far
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'machine': {'host': socket.gethostname(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                        'python': platform.python_version()},
+        }
+        print_results(record, previous_run(read_history(history), config))
+
+        if history:
+            with open(history, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the pipeline stages on synthetic extracts')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000],
+                        help='rows per synthetic dataset, one run per value (e.g. 100000 1000000 50000000)')
+    parser.add_argument('--chunk-rows', type=int, default=1000000, help='rows generated and cleaned at a time')
+    parser.add_argument('--model-rows', type=int, default=20000,
+                        help='clean rows the feature and model stages run on (0 to skip them)')
+    parser.add_argument('--repeats', type=int, default=5, help='permutation importance repeats')
+    parser.add_argument('--knn', action='store_true', help='also time the accidents KNN grid search')
+    parser.add_argument('--jobs', type=int, default=1, help='n_jobs for the models and permutation importance')
+    parser.add_argument('--history', default=HISTORY, help='JSON lines file the results are appended to ("" for none)')
+    args = parser.parse_args()
+
+    main(args.rows, args.chunk_rows, args.model_rows, args.repeats, args.knn, args.jobs, args.history)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+"""
+    Synthetic FARS-like extracts with the same columns as the query.py outputs
+"""
+
+import numpy as np
+import pandas as pd
+
+DAYS = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+STATES = {1: 'Alabama', 4: 'Arizona', 6: 'California', 12: 'Florida', 13: 'Georgia',
+          17: 'Illinois', 28: 'Mississippi', 36: 'New York', 48: 'Texas', 56: 'Wyoming'}
+
+LAND_USE = ['Urban', 'Rural', 'Unknown', 'Not Reported', 'Trafficway Not in State Inventory']
+ROADWAY_TYPE = ['Interstate', 'U.S. Highway', 'State Highway', 'County Road', 'Local Street - Municipality',
+                'Other', 'Unknown']
+INTERSECTION = ['Not an Intersection', 'Four-Way Intersection', 'T-Intersection', 'Y-Intersection',
+                'Roundabout', 'Not Reported']
+LIGHT_CONDITION = ['Daylight', 'Dark – Not Lighted', 'Dark – Lighted', 'Dawn', 'Dusk', 'Unknown']
+ATMOSPHERIC_CONDITIONS = ['Clear', 'Cloudy', 'Rain', 'Snow', 'Fog, Smog, Smoke', 'Not Reported']
+MANNER_OF_COLLISION = ['The First Harmful Event was Not a Collision with a Motor Vehicle in Transport',
+                       'Front-to-Rear', 'Front-to-Front', 'Angle', 'Sideswipe - Same Direction',
+                       'Sideswipe - Opposite Direction', 'Unknown']
+BODY_TYPE = ['4-door sedan, hardtop', 'Standard Pickup', 'Minivan (Chrysler Town and Country, Caravan)',
+             'Compact utility (Utility Vehicle Categories "Small" and "Midsize")',
+             'Motorcycle', 'Unknown Body Type', 'Unknown truck type (light/medium/heavy)']
+ROLLOVER = ['No Rollover', 'Rollover, Tripped by Object/Vehicle', 'Rollover, Untripped',
+            'Rollover, Unknown Type']
+VEHICLE_CONDITIONS = ['None', 'Tires', 'Brake System', 'Steering', 'Not Reported', 'Unknown']
+SPEEDING_RELATED = ['No', 'Yes, Too Fast for Conditions', 'Yes, Exceeded Speed Limit', 'Yes, Racing',
+                    'Yes, Specifics Unknown', 'Unknown']
+PERSON_TYPE = ['Driver of a Motor Vehicle In-Transport', 'Passenger of a Motor Vehicle In-Transport',
+               'Pedestrian', 'Bicyclist', 'Unknown Occupant Type in a Motor Vehicle In-Transport']
+INJURY_SEVERITY = ['Fatal Injury (K)', 'No Apparent Injury (O)', 'Suspected Serious Injury (A)',
+                   'Possible Injury (C)', 'Died Prior to Crash*', 'Unknown/Not Reported']
+SEATING_POSITION = ['Front Seat, Left Side', 'Front Seat, Right Side', 'Second Seat, Left Side',
+                    'Second Seat, Right Side', 'Not a Motor Vehicle Occupant', 'Unknown']
+EJECTION = ['Not Ejected', 'Totally Ejected', 'Partially Ejected', 'Not Applicable',
+            'Unknown if Ejected (Since 2009)']
+SAFETY_EQUIPMENT_USE = ['Shoulder and Lap Belt Used', 'None Used', 'DOT-Compliant Motorcycle Helmet',
+                        'Lap Belt Only Used', 'Unknown if Used', 'Not Reported']
+NON_MOTORIST_SAFETY_EQUIPMENT_USE = ['None Used', 'Helmet', 'Reflective Clothing', 'Unknown']
+AIR_BAG_DEPLOYED = ['Not Deployed', 'Deployed- Front', 'Deployed- Combination', 'Not Applicable',
+                    'Deployment Unknown']
+VISION = ['No Obstruction Noted', 'Rain, Snow, Fog, Smoke, Sand, Dust', 'Curve, Hill or Other Roadway Design Features',
+          'No Driver Present/Unknown if Driver Present', 'Unknown']
+
+
+def choice(rng, values, n, p=None):
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=n, p=p)]
+
+
+def accident_data(n_rows, year=2015, seed=2020):
+    """
+        Vehicle-level accident rows, as written by accidents/query.py
+    """
+    rng = np.random.default_rng(seed)
+    n_vehicles = rng.choice([1, 2, 3, 4], size=n_rows, p=[0.55, 0.35, 0.07, 0.03])
+    state_number = rng.choice(list(STATES), size=n_rows)
+
+    data = pd.DataFrame({
+        'state_number': state_number,
+        'consecutive_number': state_number * 10000 + rng.integers(1, 10000, size=n_rows),
+        'vehicle_number': rng.integers(1, n_vehicles + 1),
+        'state_name': pd.Series(state_number).map(STATES).to_numpy(),
+        'hour_of_day': rng.choice(list(range(24)) + [99], size=n_rows, p=[0.99 / 24] * 24 + [0.01]),
+        'day_of_week': choice(rng, DAYS, n_rows),
+        'month': choice(rng, MONTHS, n_rows),
+        'year': year,
+        'land_use': choice(rng, LAND_USE, n_rows, p=[0.5, 0.45, 0.02, 0.02, 0.01]),
+        'national_highway_system': rng.choice([0, 1, 9], size=n_rows, p=[0.6, 0.39, 0.01]),
+        'roadway_type': choice(rng, ROADWAY_TYPE, n_rows),
+        'intersection': choice(rng, INTERSECTION, n_rows),
+        'light_condition': choice(rng, LIGHT_CONDITION, n_rows),
+        'atmospheric_conditions': choice(rng, ATMOSPHERIC_CONDITIONS, n_rows),
+        'latitude': np.where(rng.random(n_rows) < 0.01, 77.7777, rng.uniform(25.0, 49.0, size=n_rows)),
+        'longitude': np.where(rng.random(n_rows) < 0.01, 777.7777, rng.uniform(-124.0, -67.0, size=n_rows)),
+        'manner_of_collision': choice(rng, MANNER_OF_COLLISION, n_rows),
+        'num_vehicles': n_vehicles,
+        'num_nonmotorists': rng.choice([0, 1, 2], size=n_rows, p=[0.85, 0.13, 0.02]),
+        'num_motorists': n_vehicles + rng.integers(0, 3, size=n_rows),
+        'num_fatalities': rng.choice([1, 2, 3], size=n_rows, p=[0.9, 0.08, 0.02]),
+        'num_drunk_drivers': rng.choice([0, 1, 2], size=n_rows, p=[0.7, 0.28, 0.02]),
+        'body_type': choice(rng, BODY_TYPE, n_rows),
+        'vehicle_year': rng.choice(list(range(1980, year + 2)) + [9998, 9999], size=n_rows),
+        'rollover': choice(rng, ROLLOVER, n_rows),
+        'vehicle_conditions': choice(rng, VEHICLE_CONDITIONS, n_rows),
+        'previous_dwi_convictions': rng.choice([0, 1, 2, 99, 998], size=n_rows, p=[0.9, 0.06, 0.02, 0.01, 0.01]),
+        'previous_speeding_convictions': rng.choice([0, 1, 2, 99, 998], size=n_rows,
+                                                    p=[0.8, 0.12, 0.06, 0.01, 0.01]),
+        'speeding_related': choice(rng, SPEEDING_RELATED, n_rows),
+        'speed_limit': rng.choice([25, 35, 45, 55, 65, 70, 75, 98, 99], size=n_rows),
+        'driver_vision_obscured': choice(rng, VISION, n_rows),
+    })
+    data.sort_values(['consecutive_number', 'vehicle_number'], inplace=True, kind='stable')
+    data.reset_index(drop=True, inplace=True)
+    return data
+
+
+def person_data(n_rows, year=2015, seed=2020):
+    """
+        Person-level rows, as written by persons/query.py
+    """
+    rng = np.random.default_rng(seed)
+    state_number = rng.choice(list(STATES), size=n_rows)
+    non_motorist = rng.random(n_rows) < 0.15
+
+    data = pd.DataFrame({
+        'state_number': state_number,
+        'consecutive_number': state_number * 10000 + rng.integers(1, 10000, size=n_rows),
+        'vehicle_number': np.where(non_motorist, 0, rng.integers(1, 4, size=n_rows)),
+        'person_number': rng.integers(1, 6, size=n_rows),
+        'year': year,
+        'person_type': np.where(non_motorist, choice(rng, PERSON_TYPE[2:4], n_rows),
+                                choice(rng, PERSON_TYPE[:2] + PERSON_TYPE[4:], n_rows)),
+        'age': rng.choice(list(range(1, 100)) + [998, 999], size=n_rows),
+        'sex': choice(rng, ['Male', 'Female', 'Unknown', 'Not Reported'], n_rows, p=[0.6, 0.38, 0.01, 0.01]),
+        'injury_severity': choice(rng, INJURY_SEVERITY, n_rows),
+        'land_use': choice(rng, LAND_USE, n_rows, p=[0.5, 0.45, 0.02, 0.02, 0.01]),
+        'trafficway_type': choice(rng, ROADWAY_TYPE, n_rows),
+        'manner_of_collision': choice(rng, MANNER_OF_COLLISION, n_rows),
+        'body_type': choice(rng, BODY_TYPE, n_rows),
+        'rollover': choice(rng, ROLLOVER, n_rows),
+        'seating_position': np.where(non_motorist, 'Not a Motor Vehicle Occupant',
+                                     choice(rng, SEATING_POSITION[:4] + SEATING_POSITION[5:], n_rows)),
+        'ejection': choice(rng, EJECTION, n_rows),
+        'safety_equipment_use': np.where(non_motorist, 'Not a Motor Vehicle Occupant',
+                                         choice(rng, SAFETY_EQUIPMENT_USE, n_rows)),
+        'air_bag_deployed': choice(rng, AIR_BAG_DEPLOYED, n_rows),
+        'non_motorist_safety_equipment_use': np.where(non_motorist,
+                                                      choice(rng, NON_MOTORIST_SAFETY_EQUIPMENT_USE, n_rows),
+                                                      None),
+    })
+    data.sort_values(['consecutive_number', 'vehicle_number', 'person_number'], inplace=True, kind='stable')
+    data.reset_index(drop=True, inplace=True)
+    return data
+
+
+def chunks(generate, n_rows, chunk_rows=1000000, years=(2015, 2016), seed=2020):
+    """
+        n_rows rows of generate (accident_data or person_data) split evenly over years, in
+        frames of at most chunk_rows rows, so that any scale can be generated within memory
+    """
+    for i, year in enumerate(years):
+        year_rows = n_rows // len(years) + (i < n_rows % len(years))
+        for start in range(0, year_rows, chunk_rows):
+            yield generate(min(chunk_rows, year_rows - start), year=year, seed=seed + i * 100003 + start // chunk_rows)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+    On-disk store of encoded feature matrices for the model scripts.
+
+    An entry holds the encoded (and scaled) features, the labels, the feature names and
+    the fitted encoders. It is keyed on a hash of the source dataset's contents and of
+    the column config, so it is rebuilt whenever the clean data or the column lists
+    change. Matrices are loaded back memory-mapped.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import OrdinalEncoder, StandardScaler
+import instrument
+
+
+def load_or_build(name, source, config, build, store_dir):
+    """
+        Features for config from the store, or from build() if there is no entry for the
+        current contents of the dataset source (storage path without extension).
+
+        build returns (features, labels, feature_names, transformers) and is only called on a miss.
+        Returns the same tuple, with features as a read-only memory map and labels as a Series.
+    """
+    key = hashlib.sha256('\n'.join([file_hash(source), json.dumps(config, sort_keys=True)]).encode()).hexdigest()
+    entry = os.path.join(store_dir, name, key)
+
+    if not os.path.exists(entry):
+        features, labels, feature_names, transformers = build()
+
+        # Built in a private directory and renamed into place, so concurrent jobs
+        # never see a partial entry
+        scratch = f'{entry}.{os.getpid()}.tmp'
+        os.makedirs(scratch)
+        np.save(os.path.join(scratch, 'features.npy'), np.asarray(features))
+        np.save(os.path.join(scratch, 'labels.npy'), np.asarray(labels))
+        joblib.dump({'feature_names': list(feature_names), 'label': labels.name, 'transformers': transformers},
+                    os.path.join(scratch, 'transformers.joblib'))
+        try:
+            os.rename(scratch, entry)
+        except OSError:
+            # Another job stored the same entry first
+            shutil.rmtree(scratch)
+
+        # Only the entry for the current data and config is kept
+        for old in os.listdir(os.path.join(store_dir, name)):
+            if old != key and not old.endswith('.tmp'):
+                shutil.rmtree(os.path.join(store_dir, name, old), ignore_errors=True)
+    else:
+        print(f'Loading {name} features from {entry}')
+
+    meta = joblib.load(os.path.join(entry, 'transformers.joblib'))
+    features = np.load(os.path.join(entry, 'features.npy'), mmap_mode='r')
+    labels = pd.Series(np.load(os.path.join(entry, 'labels.npy')), name=meta['label'])
+    return features, labels, pd.Index(meta['feature_names']), meta['transformers']
+
+
+def file_hash(source):
+    """
+        sha256 of the stored dataset. Remembered per file size and mtime, so an unchanged
+        file is not re-read on every run.
+    """
+    path = f'{source}.parquet' if os.path.exists(f'{source}.parquet') else f'{source}.csv'
+    stat = os.stat(path)
+    memo = f'{path}.sha256'
+    stamp = f'{stat.st_size}:{stat.st_mtime_ns}'
+
+    if os.path.exists(memo):
+        with open(memo) as f:
+            saved_stamp, digest = f.read().split()
+        if saved_stamp == stamp:
+            return digest
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            sha.update(block)
+    digest = sha.hexdigest()
+
+    with open(f'{memo}.{os.getpid()}', 'w') as f:
+        f.write(f'{stamp} {digest}')
+    os.replace(f'{memo}.{os.getpid()}', memo)
+    return digest
+
+
+@instrument.timed('encode_ordinal', rows=lambda result: len(result[1]))
+def encode_ordinal(data, cols, label):
+    """
+        Ordinal-encoded, standardized features of data[cols]
+    """
+    features = data[cols]
+
+    oe = OrdinalEncoder()
+    encoded = oe.fit_transform(features)
+
+    scaler = StandardScaler()
+    encoded = scaler.fit_transform(encoded)
+
+    return encoded, data[label], features.columns, {'encoder': oe, 'scaler': scaler}
+
+
+@instrument.timed('encode_one_hot', rows=lambda result: len(result[1]))
+def encode_one_hot(data, cols, cat_cols, label):
+    """
+        data[cols] with cat_cols one-hot encoded
+    """
+    features = pd.get_dummies(data[cols], columns=cat_cols)
+    return features.to_numpy(), data[label], features.columns, {'columns': list(features.columns)}
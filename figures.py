@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""
+    Figure rendering for the analysis scripts.
+
+    A figure is a module-level draw function that returns a matplotlib figure, its arguments
+    and the output path. By default figures are drawn, shown and saved in the calling process.
+
+    With the FIGURES_HEADLESS environment variable set (or set_headless()), figures are queued
+    to a pool of background processes using the Agg backend and the caller continues right away.
+    A figure is skipped when its output exists and was rendered from the same arguments and draw
+    code, as recorded in a hash manifest next to the images. wait() blocks until the queue is
+    rendered; it also runs at exit.
+"""
+
+import os
+import json
+import fcntl
+import atexit
+import pickle
+import inspect
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import instrument
+
+HEADLESS_ENV = 'FIGURES_HEADLESS'
+MANIFEST = '.figures.json'
+
+_pool = None
+_pending = []
+_styled = False
+
+
+def pyplot():
+    """
+        matplotlib.pyplot, imported and given the seaborn style when the first figure is drawn
+    """
+    global _styled
+    import matplotlib.pyplot as plt
+    if not _styled:
+        import seaborn as sns
+        sns.set()
+        _styled = True
+    return plt
+
+
+def headless():
+    return os.environ.get(HEADLESS_ENV, '') not in ('', '0')
+
+
+def set_headless(enabled=True):
+    """
+        Switch headless rendering on or off, for this process and the processes it starts
+    """
+    if enabled:
+        os.environ[HEADLESS_ENV] = '1'
+    else:
+        os.environ.pop(HEADLESS_ENV, None)
+
+
+@instrument.timed('render_figure')
+def render(draw, path, *args, **kwargs):
+    """
+        Save draw(*args, **kwargs) to path
+    """
+    if not headless():
+        fig = draw(*args, **kwargs)
+        pyplot().show()
+        fig.savefig(path)
+        return
+
+    global _pool
+    # Absolute, since the caller may change directory before the figure is written
+    path = os.path.abspath(path)
+    digest = figure_hash(draw, args, kwargs)
+    if os.path.exists(path) and read_manifest(os.path.dirname(path)).get(os.path.basename(path)) == digest:
+        return
+
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=min(4, os.cpu_count()), initializer=use_agg)
+    _pending.append((_pool.submit(render_figure, draw, path, args, kwargs), path, digest))
+
+
+def use_agg():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def render_figure(draw, path, args, kwargs):
+    fig = draw(*args, **kwargs)
+    fig.savefig(path)
+    pyplot().close(fig)
+
+
+@instrument.timed('wait_figures')
+def wait():
+    """
+        Block until every queued figure is written, record them in the manifests and stop
+        the pool (a process cannot exit while the pool's workers are alive)
+    """
+    global _pool
+    rendered = {}
+    try:
+        while _pending:
+            future, path, digest = _pending.pop(0)
+            future.result()
+            rendered.setdefault(os.path.dirname(path), {})[os.path.basename(path)] = digest
+    finally:
+        for directory, digests in rendered.items():
+            update_manifest(directory, digests)
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+atexit.register(wait)
+
+
+def figure_hash(draw, args, kwargs):
+    try:
+        source = inspect.getsource(draw)
+    except (OSError, TypeError):
+        source = ''
+    payload = pickle.dumps((draw.__module__, draw.__qualname__, source, args, kwargs))
+    return hashlib.sha256(payload).hexdigest()
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def update_manifest(directory, digests):
+    # Several processes may render into the same directory
+    with open(os.path.join(directory, f'{MANIFEST}.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = read_manifest(directory)
+        manifest.update(digests)
+        with open(os.path.join(directory, f'{MANIFEST}.tmp'), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(os.path.join(directory, f'{MANIFEST}.tmp'), os.path.join(directory, MANIFEST))
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+
+"""
+    Stage-level timing and memory instrumentation for the scripts.
+
+    Named stages are marked with the stage() context manager or the timed() decorator. Stages
+    nest: a stage opened inside another is recorded under its path. For each stage the wall
+    time, CPU time (of this process's threads and of the child processes it waited for, e.g. a
+    process pool shut down within the stage), peak RSS during the stage and optionally a row
+    count are recorded.
+
+    Nothing is recorded unless the PIPELINE_INSTRUMENT environment variable is set (or
+    set_enabled()): stage() then returns a shared no-op context manager and timed() functions
+    call straight through. When enabled, the run ends with a table of the stages summed by
+    path and a JSON trace in the Chrome trace event format (viewable in chrome://tracing or
+    Perfetto) written to the directory PIPELINE_INSTRUMENT names, or to traces/ if it is 1.
+
+    Peak RSS is per process. On Linux the high-water mark is reset at the start of each stage;
+    elsewhere it is the peak of the process up to the end of the stage. Stages recorded in pool
+    workers are returned to the parent with collect() and merge(), as scheduler jobs do.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+import threading
+import functools
+from datetime import datetime
+
+INSTRUMENT_ENV = 'PIPELINE_INSTRUMENT'
+TRACE_DIR = 'traces'
+
+_origin = time.perf_counter()
+_started = datetime.now()
+_events = []
+_local = threading.local()
+_reported = False
+_can_reset_peak = True
+
+
+def enabled():
+    return os.environ.get(INSTRUMENT_ENV, '') not in ('', '0')
+
+
+def set_enabled(enabled=True):
+    """
+        Switch instrumentation on or off, for this process and the processes it starts
+    """
+    if enabled:
+        os.environ.setdefault(INSTRUMENT_ENV, '1')
+    else:
+        os.environ.pop(INSTRUMENT_ENV, None)
+
+
+class Stage:
+    """
+        One timed block. rows can be set inside the block once they are known.
+    """
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        stack = _stack()
+        self.path = (stack[-1].path if stack else ()) + (self.name,)
+        if stack:
+            stack[-1].fold_peak(peak_rss())
+        reset_peak()
+        self.peak = 0
+        stack.append(self)
+
+        times = os.times()
+        self.children_cpu = times.children_user + times.children_system
+        self.cpu = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu
+        times = os.times()
+        cpu += times.children_user + times.children_system - self.children_cpu
+
+        self.discard()
+        _events.append({'name': self.name, 'path': list(self.path), 'pid': os.getpid(),
+                        'tid': threading.get_ident(), 'start': self.start, 'wall': wall, 'cpu': cpu,
+                        'peak_rss': self.peak, 'rows': self.rows, 'failed': exc_info[0] is not None})
+        _register_report()
+
+    def discard(self):
+        """
+            Close the stage without recording it
+        """
+        stack = _stack()
+        stack.pop()
+        self.fold_peak(peak_rss())
+        if stack:
+            stack[-1].fold_peak(self.peak)
+
+    def fold_peak(self, peak):
+        self.peak = max(self.peak, peak)
+
+
+class _NullStage:
+    """
+        Stand-in for Stage when instrumentation is off
+    """
+
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, rows=None):
+    """
+        Context manager timing the block as stage name
+    """
+    return Stage(name, rows) if enabled() else _NULL_STAGE
+
+
+def timed(name=None, rows=None):
+    """
+        Decorator timing each call as stage name (the function's name by default). rows is a
+        function of the result giving its row count, e.g. len.
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            with Stage(stage_name) as current:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    current.rows = rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def timed_iter(name, iterable, rows=None):
+    """
+        Yields the items of iterable, timing the production of each one (e.g. reading a chunk)
+        as stage name. rows is a function of an item giving its row count, e.g. len.
+    """
+    if not enabled():
+        yield from iterable
+        return
+
+    iterator = iter(iterable)
+    while True:
+        current = Stage(name).__enter__()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            current.discard()
+            return
+        except BaseException as e:
+            current.__exit__(type(e), e, e.__traceback__)
+            raise
+        if rows is not None:
+            current.rows = rows(item)
+        current.__exit__(None, None, None)
+        yield item
+
+
+def _stack():
+    # Forked workers start with a copy of the parent's open stages, which are not theirs to close
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.stack = []
+    return _local.stack
+
+
+def peak_rss():
+    """
+        Peak resident set size in bytes since the last reset_peak()
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def reset_peak():
+    global _can_reset_peak
+    if not _can_reset_peak:
+        return
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        _can_reset_peak = False
+
+
+def collect():
+    """
+        The stages recorded in this process (not inherited from a forked parent), removed from
+        its report, for merge() in the parent
+    """
+    pid = os.getpid()
+    own = [event for event in _events if event['pid'] == pid]
+    _events[:] = [event for event in _events if event['pid'] != pid]
+    return own
+
+
+def merge(events):
+    """
+        Add stages collected in another process, nested under the current stage
+    """
+    if not events or not enabled():
+        return
+    stack = _stack()
+    prefix = list(stack[-1].path) if stack else []
+    for event in events:
+        _events.append(dict(event, path=prefix + event['path']))
+    _register_report()
+
+
+def _register_report():
+    global _reported
+    if not _reported:
+        _reported = True
+        atexit.register(report)
+
+
+def summary(events):
+    """
+        Stages summed by path: path -> (calls, wall, cpu, peak RSS, rows), each stage followed
+        by the stages nested in it, in order of first start
+    """
+    totals = {}
+    for event in sorted(events, key=lambda event: event['start']):
+        calls, wall, cpu, peak, rows = totals.get(tuple(event['path']), (0, 0.0, 0.0, 0, None))
+        if event['rows'] is not None:
+            rows = (rows or 0) + event['rows']
+        totals[tuple(event['path'])] = (calls + 1, wall + event['wall'], cpu + event['cpu'],
+                                        max(peak, event['peak_rss']), rows)
+
+    children = {}
+    for path in totals:
+        parent = path[:-1] if path[:-1] in totals else ()
+        children.setdefault(parent, []).append(path)
+
+    ordered = {}
+
+    def visit(path):
+        ordered[path] = totals[path]
+        for child in children.get(path, []):
+            visit(child)
+
+    for root in children.get((), []):
+        visit(root)
+    return ordered
+
+
+def print_summary(events, trace_path=None):
+    print()
+    print('Stage timings' + (f' (trace: {trace_path})' if trace_path else ''))
+    print('{:48s} {:>6s} {:>10s} {:>10s} {:>10s} {:>12s} {:>12s}'.format(
+        'Stage', 'Calls', 'Wall (s)', 'CPU (s)', 'Peak (MB)', 'Rows', 'Rows/s'))
+    for path, (calls, wall, cpu, peak, rows) in summary(events).items():
+        label = '  ' * (len(path) - 1) + path[-1]
+        print('{:48s} {:6d} {:10.3f} {:10.3f} {:10.1f} {:>12s} {:>12s}'.format(
+            label[:48], calls, wall, cpu, peak / 2 ** 20,
+            '' if rows is None else f'{rows:,}',
+            '' if rows is None or wall == 0 else f'{rows / wall:,.0f}'))
+
+
+def write_trace(events, directory):
+    """
+        Write events as a Chrome trace to a new file in directory, and return its path
+    """
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0].lstrip('-') or 'python'
+    path = os.path.join(directory, f'{script}-{_started:%Y%m%d-%H%M%S}-{os.getpid()}.json')
+    trace = {
+        'traceEvents': [{'name': event['name'], 'cat': 'stage', 'ph': 'X',
+                         'ts': round((event['start'] - _origin) * 1e6), 'dur': round(event['wall'] * 1e6),
+                         'pid': event['pid'], 'tid': event['tid'],
+                         'args': {'path': '/'.join(event['path']), 'cpu_s': event['cpu'],
+                                  'peak_rss_mb': event['peak_rss'] / 2 ** 20, 'rows': event['rows'],
+                                  'failed': event['failed']}}
+                        for event in events],
+        'displayTimeUnit': 'ms',
+        'otherData': {'argv': sys.argv, 'cwd': os.getcwd(), 'started': _started.isoformat(timespec='seconds')},
+    }
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(trace, f)
+    return path
+
+
+def report():
+    """
+        Write the trace and print the summary of the stages recorded so far (runs at exit)
+    """
+    if not _events:
+        return
+    value = os.environ.get(INSTRUMENT_ENV, '')
+    directory = TRACE_DIR if value in ('', '0', '1') else value
+    try:
+        trace_path = write_trace(_events, directory)
+    except OSError as e:
+        print(f'Could not write the stage trace: {e}', file=sys.stderr)
+        trace_path = None
+    print_summary(_events, trace_path)
+    sys.stdout.flush()
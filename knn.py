@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+"""
+    KNN model selection that shares one neighbor graph across all candidate k.
+
+    GridSearchCV over n_neighbors refits and re-queries the model for every (k, fold) pair.
+    NeighborGridSearch queries each fold once at the largest k and votes every smaller k
+    from the same sorted neighbor lists.
+
+    IVFIndex and ApproximateKNeighborsClassifier are an approximate alternative for
+    datasets where exact neighbor queries are too slow.
+
+    KNN takes no class or sample weights, so imbalanced classes are balanced at fit time by
+    oversampling row indices (balanced_indices) rather than by storing a resampled dataset.
+"""
+
+import os
+import time
+import hashlib
+import numpy as np
+from joblib import Parallel, delayed
+from scipy.stats import rankdata
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.cluster import KMeans
+from sklearn.metrics import f1_score, accuracy_score
+from sklearn.model_selection import StratifiedKFold
+from sklearn.utils import resample
+import instrument
+
+SCORES = {'f1': f1_score, 'accuracy': accuracy_score}
+
+
+class NeighborGridSearch:
+    """
+        Drop-in for GridSearchCV(KNeighborsClassifier(), {'n_neighbors': [...]}, cv=..., scoring=...)
+        with the same fitted attributes: best_params_, best_score_, best_index_, cv_results_,
+        best_estimator_, predict and predict_proba.
+
+        With balance=True each training fold, and the final fit, oversamples the smaller classes
+        with balanced_indices. Test folds keep the original class balance.
+    """
+
+    def __init__(self, estimator, param_grid, cv=5, scoring='f1', n_jobs=None, balance=False):
+        if set(param_grid) != {'n_neighbors'}:
+            raise ValueError('NeighborGridSearch only searches over n_neighbors')
+        if estimator.get_params()['weights'] != 'uniform':
+            raise ValueError('NeighborGridSearch requires uniform neighbor weights')
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.balance = balance
+
+    @instrument.timed('grid_search')
+    def fit(self, X, y):
+        X = np.asarray(X)
+        y = np.asarray(y)
+        ks = list(self.param_grid['n_neighbors'])
+        folds = StratifiedKFold(n_splits=self.cv).split(X, y)
+        if self.balance:
+            folds = ((train[balanced_indices(y[train])], test) for train, test in folds)
+
+        scores = Parallel(n_jobs=self.n_jobs)(
+            delayed(fold_scores)(self.estimator, X[train], y[train], X[test], y[test], ks, SCORES[self.scoring])
+            for train, test in folds
+        )
+        scores = np.array(scores).T
+
+        # Same aggregation and ranking as GridSearchCV
+        means = np.average(scores, axis=1)
+        self.cv_results_ = {
+            'params': [{'n_neighbors': k} for k in ks],
+            'param_n_neighbors': np.array(ks),
+            'mean_test_score': means,
+            'std_test_score': np.sqrt(np.average((scores - means[:, np.newaxis]) ** 2, axis=1)),
+            'rank_test_score': rankdata(-means, method='min').astype(np.int32),
+        }
+        for i in range(scores.shape[1]):
+            self.cv_results_[f'split{i}_test_score'] = scores[:, i]
+
+        self.best_index_ = self.cv_results_['rank_test_score'].argmin()
+        self.best_params_ = self.cv_results_['params'][self.best_index_]
+        self.best_score_ = means[self.best_index_]
+        rows = balanced_indices(y) if self.balance else slice(None)
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X[rows], y[rows])
+        self.classes_ = self.best_estimator_.classes_
+        return self
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+    def predict_proba(self, X):
+        return self.best_estimator_.predict_proba(X)
+
+
+def balanced_indices(labels, random_state=2020):
+    """
+        Row positions that oversample every class to the size of the largest, with replacement.
+        The minority draw is the same as resample(minority, n_samples=n_majority, replace=True,
+        random_state=random_state) on a binary dataset.
+    """
+    labels = np.asarray(labels)
+    classes, counts = np.unique(labels, return_counts=True)
+    rows = []
+    for cls, count in zip(classes, counts):
+        positions = np.flatnonzero(labels == cls)
+        if count < counts.max():
+            positions = resample(positions, n_samples=counts.max(), replace=True, random_state=random_state)
+        rows.append(positions)
+    return np.concatenate(rows)
+
+
+def fold_scores(estimator, X_train, y_train, X_test, y_test, ks, score):
+    """
+        Score of every k in ks on one fold, from a single query at max(ks)
+    """
+    k_max = max(ks)
+    model = clone(estimator).set_params(n_neighbors=k_max).fit(X_train, y_train)
+    dist, ind = model.kneighbors(X_test)
+
+    # Running per-class vote counts over the sorted neighbors
+    classes, encoded = np.unique(y_train, return_inverse=True)
+    votes = np.cumsum(encoded[ind][:, :, np.newaxis] == np.arange(len(classes)), axis=1)
+
+    scores = []
+    for k in ks:
+        # argmax takes the lowest class on tied votes, as KNeighborsClassifier does
+        y_pred = classes[votes[:, k - 1].argmax(axis=1)]
+
+        # Where the k-th and (k+1)-th neighbors are equidistant, a k query may keep a different
+        # neighbor than the first k of the k_max query. Those rows are predicted by the real model.
+        if k < k_max:
+            tied = dist[:, k - 1] == dist[:, k]
+            if tied.any():
+                exact = clone(estimator).set_params(n_neighbors=k).fit(X_train, y_train)
+                y_pred[tied] = exact.predict(X_test[tied])
+
+        scores.append(score(y_test, y_pred))
+    return scores
+
+
+class IVFIndex:
+    """
+        Inverted-file approximate nearest-neighbor index.
+
+        The points are partitioned into n_lists k-means cells, and a query is only compared
+        against the points of its n_probe nearest cells. More probes trade speed for recall;
+        n_probe can be changed after the index is built.
+    """
+
+    def __init__(self, n_lists=256, n_probe=8, batch_size=4096, random_state=2020):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        n_lists = min(self.n_lists, len(X))
+
+        # Centroids are trained on a sample, then every point is assigned to its nearest one
+        rng = np.random.default_rng(self.random_state)
+        sample = X[rng.choice(len(X), min(len(X), 64 * n_lists), replace=False)]
+        kmeans = KMeans(n_clusters=n_lists, n_init=1, random_state=self.random_state).fit(sample)
+        self.centroids_ = kmeans.cluster_centers_
+        lists = kmeans.predict(X)
+
+        # Points sorted by list, so each list is a contiguous block
+        self.ids_ = np.argsort(lists, kind='stable')
+        self.points_ = X[self.ids_]
+        self.offsets_ = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=n_lists))])
+        self.fingerprint_ = fingerprint(X)
+        return self
+
+    def kneighbors(self, X, n_neighbors):
+        """
+            (distances, indices) of the approximate n_neighbors nearest points, nearest first
+        """
+        X = np.asarray(X, dtype=np.float64)
+        dist = np.empty((len(X), n_neighbors))
+        ind = np.empty((len(X), n_neighbors), dtype=np.int64)
+        for start in range(0, len(X), self.batch_size):
+            batch = slice(start, start + self.batch_size)
+            dist[batch], ind[batch] = self._search(X[batch], n_neighbors)
+        return dist, ind
+
+    def _search(self, X, k):
+        n_probe = min(self.n_probe, len(self.centroids_))
+        probes = np.argpartition(squared_distances(X, self.centroids_), n_probe - 1, axis=1)[:, :n_probe]
+
+        best_dist = np.full((len(X), k), np.inf)
+        best_ind = np.full((len(X), k), -1, dtype=np.int64)
+
+        # Each list is compared once against all the queries that probe it
+        for cell in np.unique(probes):
+            queries = np.flatnonzero((probes == cell).any(axis=1))
+            lo, hi = self.offsets_[cell], self.offsets_[cell + 1]
+            if lo == hi:
+                continue
+
+            dist = np.hstack([best_dist[queries], squared_distances(X[queries], self.points_[lo:hi])])
+            ind = np.hstack([best_ind[queries], np.broadcast_to(np.arange(lo, hi), (len(queries), hi - lo))])
+            top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+            best_dist[queries] = np.take_along_axis(dist, top, axis=1)
+            best_ind[queries] = np.take_along_axis(ind, top, axis=1)
+
+        order = np.argsort(best_dist, axis=1, kind='stable')
+        best_dist = np.sqrt(np.take_along_axis(best_dist, order, axis=1))
+        best_ind = np.take_along_axis(best_ind, order, axis=1)
+        return best_dist, np.where(best_ind >= 0, self.ids_[best_ind], -1)
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids_, ids=self.ids_, points=self.points_, offsets=self.offsets_,
+                 fingerprint=self.fingerprint_, params=[self.n_lists, self.batch_size, self.random_state])
+
+    @classmethod
+    def load(cls, path, n_probe=8):
+        with np.load(path) as saved:
+            n_lists, batch_size, random_state = saved['params']
+            index = cls(int(n_lists), n_probe, int(batch_size), int(random_state))
+            index.centroids_ = saved['centroids']
+            index.ids_ = saved['ids']
+            index.points_ = saved['points']
+            index.offsets_ = saved['offsets']
+            index.fingerprint_ = str(saved['fingerprint'])
+        return index
+
+
+class ApproximateKNeighborsClassifier(BaseEstimator, ClassifierMixin):
+    """
+        Uniform-weight KNN classifier on an IVFIndex. With index_path, the index is saved
+        there and reused by later fits on the same training matrix.
+    """
+
+    def __init__(self, n_neighbors=5, n_lists=256, n_probe=8, index_path=None):
+        self.n_neighbors = n_neighbors
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.index_path = index_path
+
+    def fit(self, X, y):
+        X = np.asarray(X)
+        self.classes_, self._y = np.unique(y, return_inverse=True)
+
+        index = None
+        if self.index_path is not None and os.path.exists(self.index_path):
+            index = IVFIndex.load(self.index_path, self.n_probe)
+            if index.n_lists != self.n_lists or index.fingerprint_ != fingerprint(X):
+                index = None
+            else:
+                print(f'Loading ANN index from {self.index_path}')
+
+        if index is None:
+            index = IVFIndex(self.n_lists, self.n_probe).fit(X)
+            if self.index_path is not None:
+                index.save(self.index_path)
+
+        self.index_ = index
+        return self
+
+    def kneighbors(self, X):
+        return self.index_.kneighbors(X, self.n_neighbors)
+
+    def predict_proba(self, X):
+        _, ind = self.kneighbors(X)
+        # Queries whose probed lists hold fewer than n_neighbors points vote with what was found
+        found = ind >= 0
+        votes = ((self._y[ind][:, :, np.newaxis] == np.arange(len(self.classes_))) & found[:, :, np.newaxis]).sum(axis=1)
+        return votes / found.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def ann_report(exact, approx, X, y, sample=2000, random_state=2020):
+    """
+        Neighbor recall, prediction agreement and score loss of an approximate KNN model
+        against the exact one, on a sample of X
+    """
+    rows = np.random.default_rng(random_state).permutation(len(X))[:sample]
+    X = np.asarray(X)[rows]
+    y = np.asarray(y)[rows]
+
+    start = time.perf_counter()
+    _, exact_ind = exact.kneighbors(X, approx.n_neighbors)
+    exact_pred = exact.predict(X)
+    exact_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, approx_ind = approx.kneighbors(X)
+    approx_pred = approx.predict(X)
+    approx_time = time.perf_counter() - start
+
+    recall = np.mean([len(np.intersect1d(e, a)) for e, a in zip(exact_ind, approx_ind)]) / approx.n_neighbors
+
+    print(f'ANN vs exact KNN on {len(X)} rows (n_lists={approx.n_lists}, n_probe={approx.n_probe})')
+    print('    Recall@{}: {:.3f}'.format(approx.n_neighbors, recall))
+    print('    Prediction agreement: {:.3f}'.format(np.mean(exact_pred == approx_pred)))
+    print('    F1 exact {:.3f}  approximate {:.3f}'.format(f1_score(y, exact_pred), f1_score(y, approx_pred)))
+    print('    Query time exact {:.2f} s  approximate {:.2f} s'.format(exact_time, approx_time))
+    print()
+
+
+def squared_distances(X, Y):
+    return np.maximum((X ** 2).sum(axis=1)[:, np.newaxis] - 2 * X @ Y.T + (Y ** 2).sum(axis=1), 0)
+
+
+def fingerprint(X):
+    return hashlib.sha256(np.ascontiguousarray(X, dtype=np.float64).tobytes()).hexdigest()
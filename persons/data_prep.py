@@ -1,55 +1,104 @@
 #!/usr/bin/env python3
 
+import argparse
+import functools
 import pandas as pd
 import numpy as np
+import transforms
+import storage
+import pipeline
+import schema
+import state_aggregates
+import instrument
 
 
-def main():
+@instrument.timed('persons/data_prep')
+def main(csv=False, stream=False, memory_budget=512, workers=1):
     path = '../data/persons'
-    data_2015 = pd.read_csv(f'{path}/person_data_2015.csv', header=0)
-    data_2016 = pd.read_csv(f'{path}/person_data_2016.csv', header=0)
-
-    data_2015 = data_prep(data_2015)
-    data_2016 = data_prep(data_2016)
-
-    accident_data = pd.concat([data_2015, data_2016])
+    files = {year: f'{path}/person_data_{year}.csv' for year in (2015, 2016)}
+    if stream:
+        aggregator = state_aggregates.Aggregator('persons')
+
+        def prep(chunk, year):
+            data = data_prep(chunk, year)
+            with instrument.stage('schema', rows=len(data)):
+                data = schema.apply(data, schema.PERSONS)
+            with instrument.stage('aggregates', rows=len(data)):
+                return aggregator.add(data)
+
+        with storage.Writer(f'{path}/person_data_clean', csv=csv) as writer:
+            for year, file in files.items():
+                pipeline.stream_prep([file], functools.partial(prep, year=year), writer, memory_budget)
+        with instrument.stage('aggregates', rows=writer.rows):
+            state_aggregates.update('persons', aggregator, f'{path}/person_data_clean')
+        return
+
+    if workers == 1:
+        with instrument.stage('read_csv') as stage:
+            data_2015 = pd.read_csv(files[2015], header=0)
+            data_2016 = pd.read_csv(files[2016], header=0)
+            stage.rows = len(data_2015) + len(data_2016)
+
+        with instrument.stage('data_prep', rows=len(data_2015) + len(data_2016)):
+            data_2015 = data_prep(data_2015, 2015)
+            data_2016 = data_prep(data_2016, 2016)
+
+        accident_data = pd.concat([data_2015, data_2016])
+    else:
+        with instrument.stage('parallel_prep') as stage:
+            # One pool per extract, as each needs its own year for extracts without the column
+            accident_data = pd.concat([pipeline.parallel_prep([file], functools.partial(data_prep, year=year), workers)
+                                       for year, file in files.items()])
+            stage.rows = len(accident_data)
     accident_data.reset_index(drop=True, inplace=True)
 
-    accident_data.to_csv(f'{path}/person_data_clean.csv', index=False)
-
-
-def data_prep(data):
-
-    def combine_safety(x, y):
-        if x == 'Not a Motor Vehicle Occupant':
-            return y
-        else:
-            return x
-
-    data['safety_equipment_use'] = data.apply(lambda row: combine_safety(row['safety_equipment_use'], row['non_motorist_safety_equipment_use']), axis=1)
+    before = schema.memory(accident_data)
+    with instrument.stage('schema', rows=len(accident_data)):
+        accident_data = schema.apply(accident_data, schema.PERSONS)
+    schema.print_memory('person_data_clean', before, schema.memory(accident_data))
+
+    storage.write(accident_data, f'{path}/person_data_clean', csv=csv)
+    with instrument.stage('aggregates', rows=len(accident_data)):
+        state_aggregates.update('persons', accident_data, f'{path}/person_data_clean')
+
+
+def data_prep(data, year=None):
+    """
+        Clean rows of a person extract. year fills the year column of extracts written before
+        query.py selected it.
+    """
+    if 'year' not in data.columns:
+        if year is None:
+            raise ValueError('The person extract has no year column; re-run persons/query.py or pass its year')
+        data.insert(data.columns.get_loc('person_number') + 1, 'year', year)
+
+    # Non-motorists take their safety equipment from the non-motorist column
+    data['safety_equipment_use'] = np.where(data['safety_equipment_use'] == 'Not a Motor Vehicle Occupant',
+                                            data['non_motorist_safety_equipment_use'],
+                                            data['safety_equipment_use'])
     data.drop('non_motorist_safety_equipment_use', axis=1, inplace=True)
 
-    data.replace({'Unknown': np.nan,
-                  'Not Reported': np.nan,
-                  'Trafficway Not in State Inventory': np.nan,
-                  'Unknown Body Type': np.nan,
-                  'Unknown if Ejected (Since 2009)': np.nan,
-                  'Unknown if Used': np.nan,
-                  'Unknown if Helmet Worn': np.nan,
-                  'Deployment Unknown': np.nan,
-                  'Unknown Location': np.nan,
-                  '': np.nan}, inplace=True)
+    transforms.replace_with_nan(data, ['Unknown',
+                                       'Not Reported',
+                                       'Trafficway Not in State Inventory',
+                                       'Unknown Body Type',
+                                       'Unknown if Ejected (Since 2009)',
+                                       'Unknown if Used',
+                                       'Unknown if Helmet Worn',
+                                       'Deployment Unknown',
+                                       'Unknown Location',
+                                       ''])
 
     data['age'].replace({998: np.nan,
                          999: np.nan}, inplace=True)
 
-    data['body_type'].replace(r'Unknown', np.nan, regex=True, inplace=True)
+    transforms.set_nan(data, 'body_type', transforms.contains(data['body_type'], 'Unknown'))
 
     data.dropna(inplace=True)
 
-    data['sex'] = data['sex'].apply(lambda x: 1 if x == 'Male' else 0)
+    data['sex'] = (data['sex'] == 'Male').astype(int)
 
-    data['fatality'] = data['injury_severity'].apply(lambda x: 1 if 'Fatal' in x or 'Died' in x else 0)
+    data['fatality'] = transforms.contains(data['injury_severity'], 'Fatal', 'Died').astype(int)
 
     # Refactor land_use column to binary (0: Urban; 1: Rural)
     data['land_use'].replace({'Urban': 1,
@@ -57,15 +106,9 @@ def data_prep(data):
                              inplace=True)
     data.rename(columns={'land_use': 'land_use_urban'}, inplace=True)
 
-    data['rollover'] = data['rollover'].apply(lambda x: 0 if x == 'No Rollover' else 1)
-
-    def airbag_bin(x):
-        if x == 'Not Deployed' or x == 'Not Applicable':
-            return 0
-        else:
-            return 1
+    data['rollover'] = (data['rollover'] != 'No Rollover').astype(int)
 
-    data['air_bag_deployed'] = data['air_bag_deployed'].apply(airbag_bin)
+    data['air_bag_deployed'] = (~data['air_bag_deployed'].isin(['Not Deployed', 'Not Applicable'])).astype(int)
 
     data['age'] = data['age'].astype(int)
 
@@ -75,4 +118,10 @@ def data_prep(data):
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Clean the yearly person extracts')
+    parser.add_argument('--csv', action='store_true', help='also write the clean data as CSV')
+    parser.add_argument('--stream', action='store_true', help='process the extracts in bounded-memory chunks')
+    parser.add_argument('--memory-budget', type=int, default=512, help='memory budget in MB for --stream')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='clean (year, state) partitions on this many processes (-1 for all cores)')
+    main(**vars(parser.parse_args()))
@@ -1,34 +1,50 @@
 #!/usr/bin/env python3
 
-import pandas as pd
-from sklearn.preprocessing import OrdinalEncoder, StandardScaler
-from sklearn.model_selection import train_test_split, GridSearchCV
+import os
+import argparse
+from sklearn.model_selection import train_test_split
 from sklearn.neighbors import KNeighborsClassifier
 import utils
+import storage
+import schema
+import feature_store
+import knn
+import scheduler
+import instrument
 
 
-def main():
+@instrument.timed('persons/knn_model')
+def main(ann=False, n_lists=256, n_probe=8, cores=None):
+    scheduler.run(jobs(ann, n_lists, n_probe), cores)
+
+
+def jobs(ann=False, n_lists=256, n_probe=8):
+    # The grid search parallelizes over its 5 folds
+    return [scheduler.Job('persons/KNN', fit_knn, (ann, n_lists, n_probe), cwd=os.path.dirname(os.path.abspath(__file__)),
+                          max_cores=5)]
+
+
+def fit_knn(ann=False, n_lists=256, n_probe=8, n_jobs=1):
     path = '../data/persons'
-    data = pd.read_csv(f'{path}/person_data_clean.csv', header=0)
 
     cat_cols = ['person_type', 'trafficway_type', 'manner_of_collision', 'body_type', 'seating_position',
                 'ejection', 'safety_equipment_use']
     binary_cols = ['sex', 'land_use_urban', 'rollover', 'air_bag_deployed']
     numeric_cols = ['age']
 
-    data[cat_cols] = data[cat_cols].apply(lambda x: x.astype('category'))
-
-    labels = data['fatality']
-    features = data[cat_cols + binary_cols + numeric_cols]
-    feature_names = features.columns
+    cols = cat_cols + binary_cols + numeric_cols
 
-    oe = OrdinalEncoder()
-    features = oe.fit_transform(features)
+    def build():
+        data = storage.read(f'{path}/person_data_clean', dtypes=schema.PERSONS)
+        return feature_store.encode_ordinal(data, cols, 'fatality')
 
     # features = pd.get_dummies(features, columns=cat_cols)
 
-    scaler = StandardScaler()
-    features = scaler.fit_transform(features)
+    with instrument.stage('load_data') as stage:
+        features, labels, feature_names, _ = feature_store.load_or_build(
+            'ordinal', f'{path}/person_data_clean', {'cols': cols, 'encoding': 'ordinal'},
+            build, store_dir=f'{path}/features')
+        stage.rows = len(labels)
 
     X_train, X_test, y_train, y_test = train_test_split(features, labels,
                                                         test_size=0.2, random_state=2020)
@@ -36,19 +52,32 @@ def main():
     print(y_test.value_counts())
     print()
 
-    model = GridSearchCV(estimator=KNeighborsClassifier(),
-                         param_grid={'n_neighbors': range(1, 20, 2)},
-                         cv=5, scoring='f1')
+    model = knn.NeighborGridSearch(estimator=KNeighborsClassifier(),
+                                   param_grid={'n_neighbors': range(1, 20, 2)},
+                                   cv=5, scoring='f1', n_jobs=n_jobs)
     model.fit(X_train, y_train)
     print(model.best_params_)
     print()
 
-    y_pred = model.predict(X_test)
-    y_probs = model.predict_proba(X_test)[:, 1]
+    if ann:
+        exact = model.best_estimator_
+        model = knn.ApproximateKNeighborsClassifier(n_neighbors=exact.n_neighbors, n_lists=n_lists, n_probe=n_probe,
+                                                    index_path=f'{path}/features/ivf_index.npz')
+        model.fit(X_train, y_train)
+        knn.ann_report(exact, model, X_test, y_test)
 
-    utils.print_metrics(y_test, y_pred)
-    utils.roc_curve(y_test, y_probs, 'KNN', 'knn')
+    with instrument.stage('score', rows=len(X_test)):
+        utils.score_classifier(model, X_test, y_test, 'KNN', 'knn', n_jobs=n_jobs)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Tune and score the KNN model on the person data')
+    parser.add_argument('--ann', action='store_true',
+                        help='score the test split with an approximate (IVF) index instead of exact KNN')
+    parser.add_argument('--n-lists', type=int, default=256, help='number of IVF partitions')
+    parser.add_argument('--n-probe', type=int, default=8,
+                        help='partitions searched per query (higher is slower but more accurate)')
+    parser.add_argument('--cores', type=int, default=None, help='cores to use (default: all)')
+    args = parser.parse_args()
+
+    main(args.ann, args.n_lists, args.n_probe, args.cores)
@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 
+import argparse
 import pandas as pd
-from google.cloud import bigquery
-from bq_helper import BigQueryHelper
+import query_backends
 
 
-def main():
+def main(backend='bigquery', fars_dir='../data/fars', cache_dir='../data/query_cache', refresh=False,
+         years=(2015, 2016), max_in_flight=4):
     path = '../data/persons'
-    bq_assistant = BigQueryHelper('bigquery-public-data', 'nhtsa_traffic_fatalities')
+    bq_assistant = query_backends.connect(backend, data_dir=fars_dir, cache_dir=cache_dir, refresh=refresh)
 
     QUERY = """
         SELECT
@@ -15,6 +16,7 @@ def main():
             p.consecutive_number,
             p.vehicle_number,
             p.person_number,
+            {0} AS year,
             person_type_name AS person_type,
             age,
             sex,
@@ -38,12 +40,21 @@ def main():
             consecutive_number, vehicle_number, person_number
     """
 
-    data_2015 = bq_assistant.query_to_pandas(QUERY.format(2015))
-    data_2016 = bq_assistant.query_to_pandas(QUERY.format(2016))
+    def write(year, data):
+        data.to_csv(f'{path}/person_data_{year}.csv', index=False)
 
-    data_2015.to_csv(f'{path}/person_data_2015.csv', index=False)
-    data_2016.to_csv(f'{path}/person_data_2016.csv', index=False)
+    query_backends.extract(bq_assistant, QUERY, years, write, max_in_flight)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Extract the yearly person-level data')
+    parser.add_argument('--backend', choices=query_backends.BACKENDS, default='bigquery',
+                        help='run the query on BigQuery or on local FARS tables with SQLite')
+    parser.add_argument('--fars-dir', default='../data/fars',
+                        help='directory with the raw FARS table CSVs for the sqlite backend')
+    parser.add_argument('--cache-dir', default='../data/query_cache',
+                        help='directory of the query result cache (empty to disable)')
+    parser.add_argument('--refresh', action='store_true', help='re-run the queries and replace cached results')
+    parser.add_argument('--years', type=int, nargs='+', default=[2015, 2016], help='years to extract')
+    parser.add_argument('--max-in-flight', type=int, default=4, help='maximum number of queries running at once')
+    main(**vars(parser.parse_args()))
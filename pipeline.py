@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""
+    Chunked, bounded-memory processing for the data_prep scripts
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import storage
+import instrument
+
+# Peak memory of cleaning a chunk, relative to the size of the raw chunk itself.
+# data_prep keeps a few full copies alive (replace, dropna, the derived columns).
+PREP_OVERHEAD = 4
+SAMPLE_ROWS = 10000
+
+# Original row position, carried through data_prep so partitions can be merged back in input order
+ROW_ORDER = '_row_order'
+
+
+def chunk_rows(path, memory_budget):
+    """
+        Number of CSV rows per chunk so that cleaning one chunk stays within memory_budget (MB)
+    """
+    sample = pd.read_csv(path, header=0, nrows=SAMPLE_ROWS)
+    row_bytes = sample.memory_usage(index=True, deep=True).sum() / max(len(sample), 1)
+    return max(int(memory_budget * 2 ** 20 / (row_bytes * PREP_OVERHEAD)), 1)
+
+
+def stored_chunk_rows(name, memory_budget):
+    """
+        Number of rows per chunk when re-reading the stored dataset name within memory_budget (MB)
+    """
+    if not os.path.exists(f'{name}.parquet') and os.path.exists(f'{name}.csv'):
+        return chunk_rows(f'{name}.csv', memory_budget)
+    n_rows, n_bytes = storage.size(name)
+    return max(int(memory_budget * 2 ** 20 * n_rows / (max(n_bytes, 1) * PREP_OVERHEAD)), 1)
+
+
+def stream_prep(paths, prep, writer, memory_budget):
+    """
+        Reads each CSV in paths in chunks sized to memory_budget (MB), cleans every chunk
+        with prep and appends the result to writer
+    """
+    for path in paths:
+        rows = chunk_rows(path, memory_budget)
+        for chunk in instrument.timed_iter('read_csv', pd.read_csv(path, header=0, chunksize=rows), rows=len):
+            with instrument.stage('data_prep', rows=len(chunk)):
+                clean = prep(chunk)
+            with instrument.stage('write', rows=len(clean)):
+                writer.write(clean)
+    return writer.rows
+
+
+def n_workers(workers):
+    """
+        Number of processes for a worker count option, where -1 means all cores
+    """
+    return os.cpu_count() if workers == -1 else max(workers, 1)
+
+
+def parallel_prep(paths, prep, workers=-1, partition_col='state_number'):
+    """
+        Cleans each CSV in paths split into one partition per (file, partition_col) value,
+        with the partitions spread over a pool of worker processes. The cleaned rows come
+        back in the same order as cleaning each file in turn.
+    """
+    offset = 0
+    with ProcessPoolExecutor(max_workers=n_workers(workers)) as pool:
+        futures = []
+        for path in paths:
+            with instrument.stage('read_csv') as stage:
+                data = pd.read_csv(path, header=0)
+                stage.rows = len(data)
+            data[ROW_ORDER] = np.arange(offset, offset + len(data))
+            offset += len(data)
+
+            for _, partition in data.groupby(partition_col, sort=True):
+                futures.append(pool.submit(prep, partition.reset_index(drop=True)))
+            del data
+
+        data = pd.concat([future.result() for future in futures])
+
+    data.sort_values(ROW_ORDER, inplace=True, kind='stable')
+    data.drop(ROW_ORDER, axis=1, inplace=True)
+    data.reset_index(drop=True, inplace=True)
+    return data
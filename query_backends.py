@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+"""
+    Backends that run the QUERY templates of the query.py scripts.
+
+    'bigquery' runs them against the public NHTSA dataset through BigQueryHelper.
+    'sqlite' runs them against raw FARS tables on disk, one CSV per table and year
+    (accident_2015.csv, vehicle_2015.csv, person_2015.csv, ...), loaded into an
+    embedded SQLite database the first time they are queried.
+"""
+
+import os
+import re
+import glob
+import time
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from query_cache import QueryCache, CachedBackend
+
+BACKENDS = ('bigquery', 'sqlite')
+
+# Columns the FARS tables are joined on, indexed in the local database
+JOIN_KEYS = ['consecutive_number', 'vehicle_number', 'person_number']
+
+
+def connect(backend, data_dir=None, pool_size=4, cache_dir=None, refresh=False):
+    """
+        Backend by name. With a cache_dir, results are cached there (see query_cache);
+        refresh re-runs the queries and replaces the cached results.
+    """
+    if backend == 'bigquery':
+        db = BigQueryBackend()
+    elif backend == 'sqlite':
+        db = SQLiteBackend(data_dir, pool_size=pool_size)
+    else:
+        raise ValueError(f'Unknown backend {backend}, expected one of {BACKENDS}')
+
+    if cache_dir:
+        return CachedBackend(db, QueryCache(cache_dir), refresh=refresh)
+    return db
+
+
+def extract(backend, query, years, write, max_in_flight=4):
+    """
+        Runs query.format(year) for every year concurrently, with at most max_in_flight
+        queries running at a time. Each result is passed to write(year, data) as soon as
+        it completes, on the calling thread.
+    """
+    def run(year):
+        start = time.perf_counter()
+        data = backend.query_to_pandas(query.format(year), year=year)
+        return data, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        futures = {pool.submit(run, year): year for year in years}
+        for future in as_completed(futures):
+            year = futures[future]
+            data, elapsed = future.result()
+            write(year, data)
+            print(f'{year}: {len(data)} rows in {elapsed:.2f} s')
+    print(f'{len(years)} queries in {time.perf_counter() - start:.2f} s')
+
+
+class BigQueryBackend:
+    name = 'bigquery'
+
+    def __init__(self, project='bigquery-public-data', dataset='nhtsa_traffic_fatalities'):
+        self.project = project
+        self.dataset = dataset
+        self.helper = None
+        self.lock = threading.Lock()
+
+    def cache_key(self):
+        return f'{self.name}:{self.project}.{self.dataset}'
+
+    def query_to_pandas(self, sql, year=None):
+        with self.lock:
+            if self.helper is None:
+                # Only needed, and only installed, where BigQuery is reachable
+                from bq_helper import BigQueryHelper
+                self.helper = BigQueryHelper(self.project, self.dataset)
+        return self.helper.query_to_pandas(sql)
+
+
+class SQLiteBackend:
+    name = 'sqlite'
+
+    def __init__(self, data_dir, pool_size=4, db_name='fars.sqlite'):
+        self.data_dir = data_dir
+        self.db_path = os.path.join(data_dir, db_name)
+        self.pool = queue.Queue()
+        for _ in range(pool_size):
+            self.pool.put(sqlite3.connect(self.db_path, check_same_thread=False))
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def csv_files(self):
+        return sorted(glob.glob(os.path.join(self.data_dir, '*.csv')))
+
+    def cache_key(self):
+        # Changes whenever a source table is added, removed or modified
+        files = ['{}:{}'.format(os.path.basename(path), os.path.getmtime(path)) for path in self.csv_files()]
+        return '{}:{}:{}'.format(self.name, os.path.abspath(self.data_dir), ','.join(files))
+
+    @contextmanager
+    def connection(self):
+        conn = self.pool.get()
+        try:
+            yield conn
+        finally:
+            self.pool.put(conn)
+
+    def load_tables(self):
+        """
+            Loads every CSV in data_dir that is new or has changed since it was last loaded
+        """
+        with self.connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS loaded_files (name TEXT PRIMARY KEY, mtime REAL)')
+            loaded = dict(conn.execute('SELECT name, mtime FROM loaded_files').fetchall())
+
+            for path in self.csv_files():
+                table = os.path.splitext(os.path.basename(path))[0]
+                mtime = os.path.getmtime(path)
+                if loaded.get(table) == mtime:
+                    continue
+
+                data = pd.read_csv(path, header=0)
+                data.to_sql(table, conn, if_exists='replace', index=False, chunksize=10000)
+                keys = [key for key in JOIN_KEYS if key in data.columns]
+                if keys:
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_keys" ON "{table}" ({", ".join(keys)})')
+                conn.execute('INSERT OR REPLACE INTO loaded_files VALUES (?, ?)', (table, mtime))
+                conn.commit()
+        self.loaded = True
+
+    def query_to_pandas(self, sql, year=None):
+        with self.lock:
+            if not self.loaded:
+                self.load_tables()
+        with self.connection() as conn:
+            return pd.read_sql_query(to_sqlite(sql), conn)
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get().close()
+
+
+# Quoted strings and identifiers, which the dialect rewrites below must leave alone
+QUOTED = re.compile(r"('[^']*'|\"[^\"]*\"|`[^`]*`)")
+DATE_PARTS = {'YEAR': '%Y', 'MONTH': '%m', 'DAY': '%d', 'HOUR': '%H'}
+
+
+def to_sqlite(sql):
+    """
+        Rewrites the BigQuery Standard SQL used by the QUERY templates for SQLite
+    """
+    quoted = []
+
+    def mask(match):
+        quoted.append(match.group(0))
+        return f'\0{len(quoted) - 1}\0'
+
+    def unmask(match):
+        text = quoted[int(match.group(1))]
+        # `project.dataset.table` -> "table"
+        return '"{}"'.format(text.strip('`').split('.')[-1]) if text.startswith('`') else text
+
+    sql = QUOTED.sub(mask, sql)
+
+    # EXTRACT(MONTH FROM ts) -> CAST(strftime('%m', ts) AS INTEGER)
+    sql = re.sub(r'EXTRACT\(\s*(YEAR|MONTH|DAY|HOUR)\s+FROM\s+([\w.]+)\s*\)',
+                 lambda m: "CAST(strftime('{}', {}) AS INTEGER)".format(DATE_PARTS[m.group(1).upper()], m.group(2)),
+                 sql, flags=re.IGNORECASE)
+    # BigQuery allows a trailing comma at the end of the select list
+    sql = re.sub(r',(\s*FROM\b)', r'\1', sql, flags=re.IGNORECASE)
+    # '/' is always floating point division in BigQuery
+    sql = sql.replace('/', '* 1.0 /')
+    # BigQuery resolves ORDER BY names against the output names of qualified select
+    # items (a.consecutive_number); SQLite only does so for explicit aliases
+    sql = re.sub(r'(\bSELECT\b)(.*?)(\bFROM\b)',
+                 lambda m: m.group(1) + alias_columns(m.group(2)) + m.group(3),
+                 sql, count=1, flags=re.IGNORECASE | re.DOTALL)
+
+    return re.sub(r'\0(\d+)\0', unmask, sql)
+
+
+def alias_columns(select_list):
+    """
+        Adds 'AS col' to every bare 'table.col' item of a select list
+    """
+    items, depth, start = [], 0, 0
+    for i, char in enumerate(select_list):
+        depth += {'(': 1, ')': -1}.get(char, 0)
+        if char == ',' and depth == 0:
+            items.append(select_list[start:i])
+            start = i + 1
+    items.append(select_list[start:])
+
+    return ','.join(re.sub(r'^(\s*)(\w+)\.(\w+)(\s*)$', r'\1\2.\3 AS \3\4', item) for item in items)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""
+    Content-addressed cache of query.py results.
+
+    Entries are keyed on a hash of the rendered SQL, the backend (including the state
+    of its source data) and the year, and stored as Parquet files in cache_dir.
+    Entries older than ttl seconds are treated as misses, and the least recently used
+    ones are evicted once the cache grows beyond max_bytes.
+"""
+
+import os
+import time
+import hashlib
+import storage
+
+
+class QueryCache:
+
+    def __init__(self, cache_dir, max_bytes=2 * 2 ** 30, ttl=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, sql, backend, year):
+        content = '\n'.join([backend.cache_key(), str(year), sql])
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.parquet')
+
+    def get(self, key):
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+
+        mtime = os.path.getmtime(path)
+        if self.ttl is not None and time.time() - mtime > self.ttl:
+            os.remove(path)
+            return None
+
+        # The access time orders entries for eviction; keep the write time for the TTL
+        os.utime(path, (time.time(), mtime))
+        return storage.read(os.path.join(self.cache_dir, key))
+
+    def put(self, key, data):
+        storage.write(data, os.path.join(self.cache_dir, key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.parquet'):
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Another query may have evicted it already
+            if os.path.exists(os.path.join(self.cache_dir, name)):
+                os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+
+
+class CachedBackend:
+    """
+        Wraps a query backend so results are served from a QueryCache when the same
+        query has already been run. refresh=True re-runs every query and overwrites
+        its entry.
+    """
+
+    def __init__(self, backend, cache, refresh=False):
+        self.backend = backend
+        self.cache = cache
+        self.refresh = refresh
+        self.name = backend.name
+
+    def cache_key(self):
+        return self.backend.cache_key()
+
+    def query_to_pandas(self, sql, year=None):
+        key = self.cache.key(sql, self.backend, year)
+        data = None if self.refresh else self.cache.get(key)
+
+        if data is None:
+            data = self.backend.query_to_pandas(sql, year=year)
+            self.cache.put(key, data)
+        return data
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+    Runs model training jobs from the analysis scripts under one CPU core budget.
+
+    Jobs run concurrently on a process pool (outer parallelism). When a job starts it is
+    given a share of the free cores, which it receives as n_jobs for its estimators (inner
+    parallelism). Each job's output is printed as one block when it finishes, followed by a
+    table of per-job wall and CPU time. A failed job does not stop the others; the run
+    raises once all jobs have finished.
+"""
+
+import io
+import os
+import time
+import resource
+import traceback
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from joblib import parallel_backend
+from threadpoolctl import threadpool_limits
+import figures
+import instrument
+
+
+class Job:
+    """
+        func(*args, n_jobs=n) run from directory cwd. max_cores caps the cores the job is
+        given, for fits that cannot use more (e.g. one per CV fold).
+    """
+
+    def __init__(self, name, func, args=(), cwd='.', max_cores=None):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.cwd = os.path.abspath(cwd)
+        self.max_cores = max_cores
+
+
+def run(jobs, cores=None):
+    """
+        Run jobs with at most cores cores busy (all cores by default) and print their timings
+    """
+    cores = cores or os.cpu_count()
+    pending = list(jobs)
+    running = {}
+    timings = []
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, min(len(pending), cores))) as pool:
+        free = cores
+        while pending or running:
+            # Free cores are shared out over the jobs still waiting to start, rounding up so
+            # none are left idle
+            while pending and (free > 0 or not running):
+                share = max(1, min(pending[0].max_cores or cores, -(-free // len(pending))))
+                job = pending.pop(0)
+                running[pool.submit(run_job, job, share)] = (job, share)
+                free -= share
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, share = running.pop(future)
+                free += share
+                output, wall, cpu, failed, stages = future.result()
+                instrument.merge(stages)
+                print(f'[{job.name}]')
+                print(output)
+                timings.append((job.name, share, wall, cpu, failed))
+
+    print_timings(timings, cores, time.perf_counter() - start)
+
+    failed = [name for name, _, _, _, job_failed in timings if job_failed]
+    if failed:
+        raise RuntimeError(f'{len(failed)} job(s) failed: {", ".join(failed)}')
+
+
+def run_job(job, n_jobs):
+    """
+        Worker side of a job. Inner parallelism uses joblib threads and BLAS threads,
+        limited to n_jobs, so the job's CPU time is all in this process.
+    """
+    os.chdir(job.cwd)
+    output = io.StringIO()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+
+    failed = False
+    with contextlib.redirect_stdout(output), threadpool_limits(n_jobs), parallel_backend('threading', n_jobs=n_jobs):
+        try:
+            with instrument.stage(job.name):
+                job.func(*job.args, n_jobs=n_jobs)
+                # Pool workers exit without running atexit, so queued figures are finished here
+                figures.wait()
+        except Exception:
+            print(traceback.format_exc())
+            failed = True
+
+    wall = time.perf_counter() - start
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (end_usage.ru_utime - usage.ru_utime) + (end_usage.ru_stime - usage.ru_stime)
+    # Stages recorded in the worker are reported by the parent
+    return output.getvalue(), wall, cpu, failed, instrument.collect()
+
+
+def print_timings(timings, cores, total_wall):
+    print(f'Job timings ({cores} cores)')
+    print('{:40s} {:>5s} {:>10s} {:>10s} {:>6s}'.format('Job', 'Cores', 'Wall (s)', 'CPU (s)', 'CPU/s'))
+    for name, share, wall, cpu, failed in timings:
+        print('{:40s} {:5d} {:10.2f} {:10.2f} {:6.2f}{}'.format(name, share, wall, cpu, cpu / wall,
+                                                                '  FAILED' if failed else ''))
+    total_cpu = sum(cpu for _, _, _, cpu, _ in timings)
+    print('{:40s} {:>5s} {:10.2f} {:10.2f} {:6.2f}'.format('Total', '', total_wall, total_cpu,
+                                                           total_cpu / total_wall))
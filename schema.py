@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""
+    Compact dtypes for the clean accident and person tables.
+
+    String fields are categoricals, 0/1 flags are int8 and small counts/codes use the
+    smallest integer type that holds their valid range. Columns not listed keep
+    their default dtype (e.g. latitude/longitude stay float64).
+"""
+
+import numpy as np
+
+ACCIDENTS = {
+    'state_number': 'int8',
+    'consecutive_number': 'int32',
+    'vehicle_number': 'int16',
+    'state_name': 'category',
+    'hour_of_day': 'int8',
+    'day_of_week': 'category',
+    'month': 'category',
+    'year': 'int16',
+    'land_use_urban': 'int8',
+    'national_highway_system': 'int8',
+    'roadway_type': 'category',
+    'intersection': 'category',
+    'light_condition': 'category',
+    'atmospheric_conditions': 'category',
+    'manner_of_collision': 'category',
+    'num_vehicles': 'int16',
+    'num_nonmotorists': 'int16',
+    'num_motorists': 'int16',
+    'num_fatalities': 'int16',
+    'num_drunk_drivers': 'int8',
+    'body_type': 'category',
+    'vehicle_year': 'int16',
+    'rollover': 'int8',
+    'vehicle_conditions': 'category',
+    'previous_dwi_convictions': 'int8',
+    'previous_speeding_convictions': 'int8',
+    'speeding_related': 'int8',
+    'speed_limit': 'int8',
+    'driver_vision_obscured': 'int8',
+    'part_of_day': 'category',
+    'is_weekend': 'int8',
+    'multiple_vehicles': 'int8',
+    'nonmotorist_involved': 'int8',
+    'multiple_motorists': 'int8',
+    'drunk_driver_involved': 'int8',
+    'multiple_fatalities': 'int8',
+}
+
+PERSONS = {
+    'state_number': 'int8',
+    'consecutive_number': 'int32',
+    'vehicle_number': 'int16',
+    'person_number': 'int16',
+    'year': 'int16',
+    'person_type': 'category',
+    'age': 'int8',
+    'sex': 'int8',
+    'injury_severity': 'category',
+    'land_use_urban': 'int8',
+    'trafficway_type': 'category',
+    'manner_of_collision': 'category',
+    'body_type': 'category',
+    'rollover': 'int8',
+    'seating_position': 'category',
+    'ejection': 'category',
+    'safety_equipment_use': 'category',
+    'air_bag_deployed': 'int8',
+    'fatality': 'int8',
+}
+
+
+def apply(data, dtypes):
+    """
+        Casts the columns of data listed in dtypes. Raises ValueError if an integer column
+        holds values outside the range of its compact type, instead of letting them wrap.
+    """
+    casts = {}
+    for col, dtype in dtypes.items():
+        if col not in data.columns or data[col].dtype == dtype:
+            continue
+
+        if dtype != 'category' and len(data) > 0:
+            info = np.iinfo(dtype)
+            low, high = data[col].min(), data[col].max()
+            if low < info.min or high > info.max:
+                raise ValueError(f'{col} has values in [{low}, {high}], outside the range of {dtype}')
+        casts[col] = dtype
+
+    return data.astype(casts) if casts else data
+
+
+def memory(data):
+    return data.memory_usage(index=True, deep=True).sum()
+
+
+def print_memory(name, before, after):
+    print('{}: {:.1f} MB -> {:.1f} MB ({:.0%} of default dtypes)'.format(
+        name, before / 2 ** 20, after / 2 ** 20, after / max(before, 1)))
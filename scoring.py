@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+"""
+    Binary classification metrics derived from confusion counts.
+
+    confusion() counts a set of predictions in one pass. threshold_sweep() gives the same
+    metrics for many probability thresholds at once, from one sort and cumulative sum of the
+    predict_proba scores, so operating points can be compared without predicting again.
+    The positive class is 1.
+
+    ConfusionCounts, ROCHistogram and RegressionErrors are streaming versions for prediction
+    sets too large to hold at once: each is update()d chunk by chunk in fixed memory, and the
+    accumulators of separate workers are combined with merge().
+"""
+
+import math
+from collections import Counter
+import numpy as np
+
+
+class BinaryMetrics:
+    """
+        Confusion counts and the scores derived from them. With a threshold sweep every
+        field is an array with one entry per threshold.
+    """
+
+    def __init__(self, tp, fp, fn, tn, thresholds=None):
+        self.tp, self.fp, self.fn, self.tn = tp, fp, fn, tn
+        self.thresholds = thresholds
+
+        self.n_positive = tp + fn
+        self.n_negative = tn + fp
+        self.accuracy = ratio(tp + tn, self.n_positive + self.n_negative)
+        self.precision = ratio(tp, tp + fp)
+        self.recall = ratio(tp, self.n_positive)
+        self.f1 = f1(self.precision, self.recall)
+        # Scores of the negative class, as in the classification report
+        self.negative_precision = ratio(tn, tn + fn)
+        self.specificity = ratio(tn, self.n_negative)
+        self.negative_f1 = f1(self.negative_precision, self.specificity)
+        self.fpr = ratio(fp, self.n_negative)
+
+    def best(self, metric='f1'):
+        """
+            Threshold and metrics of the sweep entry that maximizes metric
+        """
+        i = int(np.argmax(getattr(self, metric)))
+        return self.thresholds[i], BinaryMetrics(self.tp[i], self.fp[i], self.fn[i], self.tn[i])
+
+
+def confusion(labels, preds):
+    """
+        BinaryMetrics of 0/1 predictions
+    """
+    return ConfusionCounts().update(labels, preds).result()
+
+
+def threshold_sweep(labels, probs, thresholds=None):
+    """
+        BinaryMetrics for predicting positive when probs >= threshold, for every threshold
+        in thresholds (by default every distinct score, highest first)
+    """
+    labels = np.asarray(labels, dtype=np.intp)
+    probs = np.asarray(probs, dtype=np.float64)
+
+    order = np.argsort(-probs, kind='mergesort')
+    sorted_probs = probs[order]
+    # True positives among the k highest scores, for k = 0..n
+    tps = np.concatenate([[0], np.cumsum(labels[order])])
+
+    if thresholds is None:
+        # Last position of each run of equal scores
+        ends = np.concatenate([np.flatnonzero(np.diff(sorted_probs)), [len(probs) - 1]]) if len(probs) else []
+        thresholds = sorted_probs[ends]
+        k = np.asarray(ends, dtype=np.intp) + 1
+    else:
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        k = np.searchsorted(-sorted_probs, -thresholds, side='right')
+
+    tp = tps[k]
+    fp = k - tp
+    n_positive = tps[-1]
+    return BinaryMetrics(tp, fp, n_positive - tp, len(probs) - n_positive - fp, thresholds)
+
+
+class ConfusionCounts:
+    """
+        Streaming confusion counts of 0/1 predictions
+    """
+
+    def __init__(self):
+        # tn, fp, fn, tp
+        self.counts = np.zeros(4, dtype=np.int64)
+
+    def update(self, labels, preds):
+        codes = 2 * np.asarray(labels, dtype=np.intp) + np.asarray(preds, dtype=np.intp)
+        if codes.size and (codes.min() < 0 or codes.max() > 3):
+            raise ValueError('labels and predictions must be 0 or 1')
+        self.counts += np.bincount(codes, minlength=4)
+        return self
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def result(self):
+        tn, fp, fn, tp = (int(count) for count in self.counts)
+        return BinaryMetrics(tp, fp, fn, tn)
+
+
+class ROCHistogram:
+    """
+        Streaming ROC curve of scores in [0, 1].
+
+        Scores are counted per class in n_bins equal-width bins, bin i holding the scores in
+        [i / n_bins, (i + 1) / n_bins) and a last bin for 1.0, so memory does not grow with the
+        number of predictions. The curve is exact at the bin edges (predicting positive for
+        probs >= edge), and so is the AUC when all the scores within a bin are equal.
+    """
+
+    def __init__(self, n_bins=1000):
+        self.n_bins = n_bins
+        self.edges = np.arange(n_bins + 1) / n_bins
+        self.positive = np.zeros(n_bins + 1, dtype=np.int64)
+        self.negative = np.zeros(n_bins + 1, dtype=np.int64)
+
+    def update(self, labels, probs):
+        labels = np.asarray(labels, dtype=np.intp)
+        probs = np.asarray(probs, dtype=np.float64)
+        if probs.size and (probs.min() < 0 or probs.max() > 1):
+            raise ValueError('scores must be within [0, 1]')
+        bins = np.searchsorted(self.edges, probs, side='right') - 1
+        self.positive += np.bincount(bins[labels == 1], minlength=self.n_bins + 1)
+        self.negative += np.bincount(bins[labels == 0], minlength=self.n_bins + 1)
+        return self
+
+    def merge(self, other):
+        if other.n_bins != self.n_bins:
+            raise ValueError(f'Cannot merge ROC histograms of {self.n_bins} and {other.n_bins} bins')
+        self.positive += other.positive
+        self.negative += other.negative
+        return self
+
+    def sweep(self):
+        """
+            BinaryMetrics at the lower edge of every non-empty bin, highest first, as
+            threshold_sweep gives for every distinct score
+        """
+        occupied = np.flatnonzero(self.positive + self.negative)[::-1]
+        # Scores at or above each bin's lower edge
+        tp = np.cumsum(self.positive[::-1])[::-1][occupied]
+        fp = np.cumsum(self.negative[::-1])[::-1][occupied]
+        n_positive, n_negative = int(self.positive.sum()), int(self.negative.sum())
+        return BinaryMetrics(tp, fp, n_positive - tp, n_negative - fp, self.edges[occupied])
+
+    def curve(self):
+        """
+            (fpr, tpr, thresholds) as sklearn.metrics.roc_curve gives them, starting from the
+            point (0, 0) at an infinite threshold
+        """
+        sweep = self.sweep()
+        return (np.concatenate([[0], sweep.fpr]), np.concatenate([[0], sweep.recall]),
+                np.concatenate([[np.inf], sweep.thresholds]))
+
+    def auc(self):
+        fpr, tpr, _ = self.curve()
+        return float(np.trapz(tpr, fpr))
+
+
+class RegressionErrors:
+    """
+        Streaming regression errors.
+
+        MSE, MAE and R^2 come from running sums, with the variance of the targets merged as in
+        Chan et al. so they match the in-memory values to rounding. The median absolute error
+        comes from a sketch of the absolute errors in logarithmic bins, which is within
+        relative_accuracy of the exact median and holds one count per occupied bin.
+    """
+
+    def __init__(self, relative_accuracy=0.001):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.count = 0
+        self.mean = 0.0
+        # Sum of squared deviations of the targets from their mean
+        self.m2 = 0.0
+        self.squared_error = 0.0
+        self.absolute_error = 0.0
+        self.zeros = 0
+        self.bins = Counter()
+
+    def update(self, y_true, y_preds):
+        y_true = np.asarray(y_true, dtype=np.float64)
+        errors = np.abs(y_true - np.asarray(y_preds, dtype=np.float64))
+        if not y_true.size:
+            return self
+
+        chunk = RegressionErrors(self.relative_accuracy)
+        chunk.count = y_true.size
+        chunk.mean = float(y_true.mean())
+        chunk.m2 = float(((y_true - chunk.mean) ** 2).sum())
+        chunk.squared_error = float((errors ** 2).sum())
+        chunk.absolute_error = float(errors.sum())
+
+        nonzero = errors[errors > 0]
+        chunk.zeros = errors.size - nonzero.size
+        keys, counts = np.unique(np.ceil(np.log(nonzero) / math.log(self.gamma)).astype(np.int64),
+                                 return_counts=True)
+        chunk.bins.update(dict(zip(keys.tolist(), counts.tolist())))
+        return self.merge(chunk)
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches of different relative accuracy')
+        count = self.count + other.count
+        if count:
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+            self.mean += delta * other.count / count
+        self.count = count
+        self.squared_error += other.squared_error
+        self.absolute_error += other.absolute_error
+        self.zeros += other.zeros
+        self.bins.update(other.bins)
+        return self
+
+    @property
+    def mse(self):
+        return ratio(self.squared_error, self.count)
+
+    @property
+    def rmse(self):
+        return math.sqrt(self.mse)
+
+    @property
+    def mae(self):
+        return ratio(self.absolute_error, self.count)
+
+    @property
+    def median_absolute_error(self):
+        # As sklearn, the mean of the two middle ranks when the count is even
+        if not self.count:
+            return 0.0
+        middle = self.count // 2
+        if self.count % 2:
+            return self.error_at(middle)
+        return (self.error_at(middle - 1) + self.error_at(middle)) / 2
+
+    def error_at(self, rank):
+        """
+            Absolute error of the given rank in ascending order, at the midpoint of its bin
+        """
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 0.0
+
+    @property
+    def r2(self):
+        # As sklearn scores constant targets
+        if self.m2 == 0:
+            return 1.0 if self.squared_error == 0 else 0.0
+        return 1 - self.squared_error / self.m2
+
+
+def f1(precision, recall):
+    # From precision and recall, as sklearn computes it, so printed values round the same way
+    return ratio(2 * np.multiply(precision, recall), np.add(precision, recall))
+
+
+def ratio(numerator, denominator):
+    """
+        numerator / denominator, 0 where the denominator is 0 (as sklearn reports it)
+    """
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    result = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+    return result.item() if result.ndim == 0 else result
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+"""
+    Scoring of new crash and person records with the trained classifiers.
+
+    The model scripts save each fitted classifier as a pipeline artifact (dtype cast, ordinal
+    encoder, scaler, model) under data/<dataset>/artifacts. This script loads artifacts once
+    and keeps them in memory. Records are scored through a micro-batcher, which groups the
+    requests that arrive within a few milliseconds into one predict_proba call.
+
+    Score a CSV of records:
+        python serve.py data/accidents/artifacts/rf.joblib --input records.csv --output scores.csv
+
+    Or serve on localhost; POST a JSON record or list of records to /score/<name> (e.g.
+    /score/accidents/rf) and GET /stats for latency percentiles and throughput:
+        python serve.py data/*/artifacts/*.joblib --port 8000
+"""
+
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.pipeline import Pipeline
+
+
+class Cast(BaseEstimator, TransformerMixin):
+    """
+        Selects the feature columns of a frame of records in training order, with the dtypes
+        of the clean tables
+    """
+
+    def __init__(self, columns, dtypes):
+        self.columns = columns
+        self.dtypes = dtypes
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        missing = [col for col in self.columns if col not in X]
+        if missing:
+            raise ValueError(f'Missing feature columns: {", ".join(missing)}')
+        return X[self.columns].astype({col: self.dtypes[col] for col in self.columns if col in self.dtypes})
+
+
+def save(path, name, model, transformers, columns, dtypes):
+    """
+        Save model with the feature_store.encode_ordinal transformers it was trained on as one
+        pipeline artifact, scoring raw records
+    """
+    pipeline = Pipeline([('cast', Cast(list(columns), dtypes)),
+                         ('encoder', transformers['encoder']),
+                         ('scaler', transformers['scaler']),
+                         ('model', model)])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written aside and renamed, so a running server never loads a partial file
+    joblib.dump({'name': name, 'pipeline': pipeline}, f'{path}.{os.getpid()}.tmp')
+    os.replace(f'{path}.{os.getpid()}.tmp', path)
+
+
+def load(path):
+    """
+        (name, pipeline) of a saved artifact
+    """
+    artifact = joblib.load(path)
+    return artifact['name'], artifact['pipeline']
+
+
+class MicroBatcher:
+    """
+        Scores requests of one or more records on a background thread. Requests queued within
+        max_wait seconds of the first are scored together, up to max_batch records per call.
+        A batch that fails is retried request by request, so one bad record only fails its own
+        request.
+    """
+
+    def __init__(self, pipeline, max_batch=512, max_wait=0.002, history=100000):
+        self.pipeline = pipeline
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        # Latencies of the most recent requests, for the percentiles
+        self.latencies = deque(maxlen=history)
+        self.n_requests = self.n_rows = self.n_batches = 0
+        self.started = None
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, records):
+        """
+            Future of the scores of records (a DataFrame, or a list of dicts)
+        """
+        future = Future()
+        self.requests.put((pd.DataFrame(records), future, time.perf_counter()))
+        return future
+
+    def score(self, records):
+        return self.submit(records).result()
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            n_rows = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while n_rows < self.max_batch:
+                try:
+                    request = self.requests.get(timeout=max(0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                batch.append(request)
+                n_rows += len(request[0])
+            self.score_batch(batch)
+
+    def score_batch(self, batch):
+        try:
+            probs = self.pipeline.predict_proba(pd.concat([records for records, _, _ in batch], ignore_index=True))
+        except Exception as e:
+            if len(batch) > 1:
+                for request in batch:
+                    self.score_batch([request])
+            else:
+                batch[0][1].set_exception(e)
+            return
+
+        classes = self.pipeline.classes_
+        done = time.perf_counter()
+        if self.started is None:
+            self.started = min(start for _, _, start in batch)
+        self.n_batches += 1
+
+        offset = 0
+        for records, future, start in batch:
+            rows = probs[offset:offset + len(records)]
+            offset += len(records)
+            future.set_result({'predictions': classes[rows.argmax(axis=1)].tolist(),
+                               'probabilities': rows[:, 1].tolist()})
+            self.latencies.append(done - start)
+            self.n_requests += 1
+            self.n_rows += len(records)
+
+    def stats(self):
+        latencies = np.array(self.latencies)
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0
+        return {'requests': self.n_requests,
+                'records': self.n_rows,
+                'batches': self.n_batches,
+                'p50_ms': float(np.percentile(latencies, 50) * 1000) if len(latencies) else None,
+                'p99_ms': float(np.percentile(latencies, 99) * 1000) if len(latencies) else None,
+                'records_per_s': self.n_rows / elapsed if elapsed else None}
+
+
+def print_stats(name, stats):
+    print(name)
+    print('    {} requests, {} records in {} batches'.format(stats['requests'], stats['records'], stats['batches']))
+    if stats['requests']:
+        print('    Latency p50 {:.2f} ms  p99 {:.2f} ms'.format(stats['p50_ms'], stats['p99_ms']))
+        print('    Throughput {:,.0f} records/s'.format(stats['records_per_s']))
+
+
+def score_file(batcher, input_path, output_path, request_rows=None):
+    """
+        Score a CSV of records, submitted request_rows records per request (a full batch by default)
+    """
+    records = pd.read_csv(input_path)
+    request_rows = request_rows or batcher.max_batch
+    futures = [batcher.submit(records.iloc[start:start + request_rows])
+               for start in range(0, len(records), request_rows)]
+    scores = [future.result() for future in futures]
+
+    records['prediction'] = np.concatenate([score['predictions'] for score in scores])
+    records['probability'] = np.concatenate([score['probabilities'] for score in scores])
+    records.to_csv(output_path, index=False)
+
+
+class Server(ThreadingHTTPServer):
+    # Room for many concurrent clients; the default backlog of 5 resets connections under load
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def handler(batchers):
+    class ScoreHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            name = self.path[len('/score/'):]
+            if not self.path.startswith('/score/') or name not in batchers:
+                return self.reply(404, {'error': f'Unknown model, expected one of: {", ".join(batchers)}'})
+            try:
+                records = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                if isinstance(records, dict):
+                    records = [records]
+                self.reply(200, batchers[name].score(records))
+            except Exception as e:
+                self.reply(400, {'error': str(e)})
+
+        def do_GET(self):
+            if self.path != '/stats':
+                return self.reply(404, {'error': 'Not found'})
+            self.reply(200, {name: batcher.stats() for name, batcher in batchers.items()})
+
+        def reply(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoreHandler
+
+
+def main(artifacts, port=8000, input_path=None, output_path=None, max_batch=512, max_wait=0.002):
+    batchers = {}
+    for path in artifacts:
+        name, pipeline = load(path)
+        batchers[name] = MicroBatcher(pipeline, max_batch, max_wait)
+
+    try:
+        if input_path is not None:
+            if len(batchers) != 1:
+                raise ValueError('Scoring a file takes exactly one artifact')
+            score_file(next(iter(batchers.values())), input_path, output_path)
+        else:
+            server = Server(('127.0.0.1', port), handler(batchers))
+            print(f'Serving {", ".join(batchers)} on http://127.0.0.1:{port}')
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                server.server_close()
+    finally:
+        for name, batcher in batchers.items():
+            print_stats(name, batcher.stats())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score records with saved classifier pipelines')
+    parser.add_argument('artifacts', nargs='+', help='pipeline artifacts saved by the model scripts')
+    parser.add_argument('--port', type=int, default=8000, help='localhost port to serve on')
+    parser.add_argument('--input', help='csv of records to score instead of serving')
+    parser.add_argument('--output', default='scores.csv', help='where to write the scored records')
+    parser.add_argument('--max-batch', type=int, default=512, help='most records scored per model call')
+    parser.add_argument('--max-wait', type=float, default=0.002,
+                        help='seconds to wait for more requests before scoring a batch')
+    args = parser.parse_args()
+
+    main(args.artifacts, args.port, args.input, args.output, args.max_batch, args.max_wait)
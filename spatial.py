@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+"""
+    Grid index over crash coordinates for radius, nearest-crash and hotspot queries.
+
+    Crashes are bucketed into cells of cell_deg degrees of latitude and longitude and sorted by
+    cell, so every row of cells is a contiguous block. A radius query only computes great-circle
+    distances for the crashes in the cells covering the circle's bounding box. Nearest-crash
+    queries widen the radius until it holds k crashes.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import storage
+import feature_store
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+# consecutive_number (state number * 10000 + case number) repeats across years, so a crash is
+# identified by year * CRASH_ID_BASE + consecutive_number
+CRASH_ID_BASE = 10 ** 6
+
+
+def haversine(lat, lon, lats, lons):
+    """
+        Great-circle distances in km from (lat, lon) to each of (lats, lons)
+    """
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def crash_ids(years, consecutive_numbers):
+    return np.asarray(years, dtype=np.int64) * CRASH_ID_BASE + np.asarray(consecutive_numbers, dtype=np.int64)
+
+
+def split_crash_ids(ids):
+    """
+        (years, consecutive_numbers) of crash_ids
+    """
+    return np.divmod(ids, CRASH_ID_BASE)
+
+
+class GridIndex:
+    """
+        Crash coordinates bucketed into a regular latitude/longitude grid. ids are returned by
+        the queries in place of row positions (e.g. consecutive_number).
+    """
+
+    def __init__(self, cell_deg=0.1):
+        self.cell_deg = cell_deg
+
+    def fit(self, lats, lons, ids=None, weights=None):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        self.origin_ = np.array([lats.min(), lons.min()])
+        self.shape_ = (int((lats.max() - self.origin_[0]) // self.cell_deg) + 1,
+                       int((lons.max() - self.origin_[1]) // self.cell_deg) + 1)
+
+        cells = self.cells(lats, lons)
+        order = np.argsort(cells, kind='stable')
+        self.lats_ = lats[order]
+        self.lons_ = lons[order]
+        self.ids_ = (np.arange(len(lats)) if ids is None else np.asarray(ids))[order]
+        self.weights_ = np.ones(len(lats)) if weights is None else np.asarray(weights, dtype=np.float64)[order]
+        # Points of cell c are lats_[offsets_[c]:offsets_[c + 1]]
+        self.offsets_ = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=self.shape_[0] * self.shape_[1]))])
+        return self
+
+    def cells(self, lats, lons):
+        rows = ((lats - self.origin_[0]) // self.cell_deg).astype(np.int64)
+        cols = ((lons - self.origin_[1]) // self.cell_deg).astype(np.int64)
+        return rows * self.shape_[1] + cols
+
+    def candidates(self, lat, lon, radius_km):
+        """
+            Positions of the points in the cells covering the bounding box of the circle
+        """
+        dlat = radius_km / KM_PER_DEGREE
+        # Longitude degrees shrink with latitude; near the poles the box spans every column
+        cos_lat = np.cos(np.radians(min(abs(lat) + dlat, 90)))
+        dlon = radius_km / (KM_PER_DEGREE * cos_lat) if cos_lat > 1e-9 else 360
+
+        n_rows, n_cols = self.shape_
+        row_lo, row_hi = self.span(lat - dlat, lat + dlat, self.origin_[0], n_rows)
+        col_lo, col_hi = self.span(lon - dlon, lon + dlon, self.origin_[1], n_cols)
+        if row_lo > row_hi or col_lo > col_hi:
+            return np.empty(0, dtype=np.int64)
+
+        # Cells col_lo..col_hi of a grid row are one contiguous block of points
+        starts = self.offsets_[np.arange(row_lo, row_hi + 1) * n_cols + col_lo]
+        ends = self.offsets_[np.arange(row_lo, row_hi + 1) * n_cols + col_hi + 1]
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+    def span(self, lo, hi, origin, n):
+        return max(int((lo - origin) // self.cell_deg), 0), min(int((hi - origin) // self.cell_deg), n - 1)
+
+    def radius(self, lat, lon, radius_km):
+        """
+            (ids, distances in km) of the points within radius_km of (lat, lon), nearest first
+        """
+        positions = self.candidates(lat, lon, radius_km)
+        dist = haversine(lat, lon, self.lats_[positions], self.lons_[positions])
+        within = dist <= radius_km
+        positions, dist = positions[within], dist[within]
+        order = np.argsort(dist, kind='stable')
+        return self.ids_[positions[order]], dist[order]
+
+    def kneighbors(self, lat, lon, k=1):
+        """
+            (ids, distances in km) of the k points nearest to (lat, lon), nearest first
+        """
+        # Every point within the searched radius is found, so once it holds k points they are the k nearest
+        radius_km = self.cell_deg * KM_PER_DEGREE
+        while True:
+            ids, dist = self.radius(lat, lon, radius_km)
+            if len(ids) >= k or radius_km >= np.pi * EARTH_RADIUS_KM:
+                return ids[:k], dist[:k]
+            radius_km *= 2
+
+    def hotspots(self, top=10, cell_deg=None):
+        """
+            The top cells by total weight (crashes, or e.g. fatalities), at the index resolution
+            or coarser cells of cell_deg degrees
+        """
+        factor = max(1, int(round((cell_deg or self.cell_deg) / self.cell_deg)))
+        cell_deg = factor * self.cell_deg
+        cells = self.cells(self.lats_, self.lons_)
+        rows, cols = cells // self.shape_[1], cells % self.shape_[1]
+
+        n_cols = -(-self.shape_[1] // factor)
+        cells = (rows // factor) * n_cols + cols // factor
+        totals = np.bincount(cells, weights=self.weights_)
+        crashes = np.bincount(cells)
+        best = np.argsort(-totals, kind='stable')[:top]
+        best = best[totals[best] > 0]
+
+        return pd.DataFrame({
+            'latitude': self.origin_[0] + (best // n_cols + 0.5) * cell_deg,
+            'longitude': self.origin_[1] + (best % n_cols + 0.5) * cell_deg,
+            'crashes': crashes[best],
+            'weight': totals[best],
+        })
+
+    def save(self, path, **metadata):
+        np.savez(path, origin=self.origin_, shape=self.shape_, lats=self.lats_, lons=self.lons_, ids=self.ids_,
+                 weights=self.weights_, offsets=self.offsets_, cell_deg=self.cell_deg, **metadata)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            index = cls(float(saved['cell_deg']))
+            index.origin_ = saved['origin']
+            index.shape_ = tuple(int(n) for n in saved['shape'])
+            index.lats_ = saved['lats']
+            index.lons_ = saved['lons']
+            index.ids_ = saved['ids']
+            index.weights_ = saved['weights']
+            index.offsets_ = saved['offsets']
+        return index
+
+
+def load_or_build(source, path, cell_deg=0.1):
+    """
+        GridIndex of the crashes in the clean accident dataset source (one point per crash,
+        weighted by its fatalities, with crash_ids as ids), saved at path and rebuilt when
+        source changes
+    """
+    digest = feature_store.file_hash(source)
+    if os.path.exists(path):
+        with np.load(path) as saved:
+            # Indexes saved before crash_ids were keyed by consecutive_number alone
+            current = str(saved['source']) == digest and float(saved['cell_deg']) == cell_deg and \
+                'crash_id_base' in saved and int(saved['crash_id_base']) == CRASH_ID_BASE
+        if current:
+            print(f'Loading spatial index from {path}')
+            return GridIndex.load(path)
+
+    data = storage.read(source, columns=['year', 'consecutive_number', 'latitude', 'longitude', 'num_fatalities'])
+    # The clean data has one row per vehicle
+    data = data.drop_duplicates(['year', 'consecutive_number']).dropna(subset=['latitude', 'longitude'])
+    index = GridIndex(cell_deg).fit(data['latitude'], data['longitude'],
+                                    ids=crash_ids(data['year'], data['consecutive_number']),
+                                    weights=data['num_fatalities'])
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Saved aside and renamed, so concurrent readers never load a partial file
+    scratch = f'{path}.{os.getpid()}.tmp.npz'
+    index.save(scratch, source=digest, crash_id_base=CRASH_ID_BASE)
+    os.replace(scratch, path)
+    return index
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+"""
+    Per-(state, year) sufficient statistics of the clean accident and person tables, for the
+    state-level means of states/data_prep.
+
+    For every (state, year) group the store keeps the number of rows and, for each numeric
+    column, its sum and non-null count. For each categorical column it keeps the count of every
+    category, i.e. the sums of the one-hot columns pd.get_dummies would build. The counts come
+    straight from the category codes, without building the dummy matrix. Means over all years
+    are then sums / counts.
+
+    Statistics are stored per year. update() replaces the store with the statistics of the
+    whole clean dataset, as data_prep rewrites it; with append it replaces only the years
+    present in the data it is given, so adding a year costs one pass over that year's rows.
+    load() rebuilds the store unless it was recorded for the current contents of the dataset
+    and the rows and years recorded with it match the dataset's Parquet metadata.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import storage
+import pipeline
+import feature_store
+
+STORE_DIR = '../data/states/aggregates'
+
+# Group keys of each dataset; state_name is kept where the state means are indexed by it
+KEYS = {'accidents': ['state_name', 'state_number', 'year'],
+        'persons': ['state_number', 'year']}
+
+ROWS = 'rows'
+
+
+def partition_stats(data, keys):
+    """
+        Statistics of data per keys group: ROWS, then 'sum:col' and 'count:col' for numeric
+        columns and 'cat:col:category' for categorical ones, in column order
+    """
+    groups = data.groupby(keys, observed=True, sort=True)
+    group_ids = groups.ngroup().to_numpy()
+    n_groups = groups.ngroups
+
+    stats = {ROWS: np.bincount(group_ids, minlength=n_groups)}
+    for col in data.columns:
+        if col in keys:
+            continue
+        values = data[col]
+        if values.dtype == object:
+            values = values.astype('category')
+
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # One bincount over (group, category) pairs gives every dummy column's group sums
+            codes = values.cat.codes.to_numpy().astype(np.intp)
+            n_categories = len(values.cat.categories)
+            valid = codes >= 0
+            counts = np.bincount(group_ids[valid] * n_categories + codes[valid],
+                                 minlength=n_groups * n_categories).reshape(n_groups, n_categories)
+            for i, category in enumerate(values.cat.categories):
+                if counts[:, i].any():
+                    stats[f'cat:{col}:{category}'] = counts[:, i]
+        else:
+            valid = values.notna().to_numpy()
+            numbers = values.to_numpy(dtype=np.float64, na_value=0)
+            stats[f'sum:{col}'] = np.bincount(group_ids, weights=numbers, minlength=n_groups)
+            stats[f'count:{col}'] = np.bincount(group_ids[valid], minlength=n_groups)
+
+    index = groups.size().index
+    return pd.DataFrame(stats, index=index)
+
+
+class Aggregator:
+    """
+        Accumulates the statistics of a dataset over chunks of its rows (which may split a
+        group between chunks) for update()
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stats = None
+
+    def add(self, data):
+        stats = partition_stats(data, KEYS[self.name])
+        self.stats = stats if self.stats is None else combine([self.stats, stats])
+        return data
+
+
+def combine(frames):
+    """
+        Sum of statistics frames, with columns in order of first appearance
+    """
+    columns = list(dict.fromkeys(col for frame in frames for col in frame.columns))
+    data = pd.concat(frames).fillna(0)
+    return data.groupby(level=list(range(data.index.nlevels)), observed=True, sort=True).sum()[columns]
+
+
+def update(name, data, source, store_dir=STORE_DIR, append=False):
+    """
+        Store the statistics of data (all rows of the clean dataset source, or an Aggregator of
+        them) and record the source they now match. With append, data holds all rows of only
+        the years being added or replaced, and the stored statistics of other years are kept.
+    """
+    stats = data.stats if isinstance(data, Aggregator) else partition_stats(data, KEYS[name])
+    if stats is None:
+        return
+    stored = read(name, store_dir) if append else None
+    if stored is not None:
+        years = stats.index.get_level_values('year').unique()
+        kept = stored[~stored.index.get_level_values('year').isin(years)]
+        stats = combine([kept, stats]) if len(kept) else stats
+    write(name, stats, feature_store.file_hash(source), store_dir)
+
+
+def load(name, source, store_dir=STORE_DIR, memory_budget=512):
+    """
+        Statistics of the clean dataset source. If the store was not updated from the current
+        contents of source, or does not cover its years and rows, it is rebuilt from source in
+        chunks within memory_budget (MB).
+    """
+    digest = feature_store.file_hash(source)
+    meta = read_meta(name, store_dir)
+    if meta is None or meta.get('source') != digest or not covers(meta, source):
+        print(f'Rebuilding {name} state aggregates from {source}')
+        aggregator = Aggregator(name)
+        rows = pipeline.stored_chunk_rows(source, memory_budget)
+        for chunk in storage.read_chunks(source, rows):
+            aggregator.add(chunk)
+        write(name, aggregator.stats, digest, store_dir)
+    return read(name, store_dir)
+
+
+def covers(meta, source):
+    """
+        Whether the rows and years recorded with the store match the clean dataset source, by
+        the Parquet metadata of source. A source stored only as CSV cannot be checked without a
+        scan, so the store is rebuilt for it.
+    """
+    if not os.path.exists(f'{source}.parquet'):
+        return False
+    years = meta.get('years') or []
+    return meta.get('rows') == storage.size(source)[0] and \
+        storage.value_range(source, 'year') == ((years[0], years[-1]) if years else None)
+
+
+def state_means(stats, group, drop=(), cat_cols=()):
+    """
+        Means per group over all years, as
+            pd.get_dummies(data.drop(drop, axis=1), columns=cat_cols).groupby(group).mean()
+        gives them for the rows the statistics were built from
+    """
+    stats = stats.groupby(level=group, observed=True, sort=True).sum()
+
+    means = {}
+    for col in stats.columns:
+        if col.startswith('sum:') and col[4:] not in drop:
+            means[col[4:]] = stats[col] / stats[f'count:{col[4:]}']
+    for cat_col in cat_cols:
+        prefix = f'cat:{cat_col}:'
+        categories = sorted(col[len(prefix):] for col in stats.columns if col.startswith(prefix))
+        for category in categories:
+            means[f'{cat_col}_{category}'] = stats[prefix + category] / stats[ROWS]
+    return pd.DataFrame(means, index=stats.index)
+
+
+def read(name, store_dir=STORE_DIR):
+    if not os.path.exists(os.path.join(store_dir, f'{name}.parquet')):
+        return None
+    data = storage.read(os.path.join(store_dir, name))
+    return data.set_index(KEYS[name])
+
+
+def read_meta(name, store_dir=STORE_DIR):
+    """
+        The source hash, rows and years recorded with the store, or None if there is none
+    """
+    try:
+        with open(os.path.join(store_dir, f'{name}.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write(name, stats, source_hash, store_dir=STORE_DIR):
+    # Written aside and renamed, so a reader never sees a partial store
+    os.makedirs(store_dir, exist_ok=True)
+    scratch = os.path.join(store_dir, f'{name}.{os.getpid()}.tmp')
+    storage.write(stats.reset_index(), scratch)
+    os.replace(f'{scratch}.parquet', os.path.join(store_dir, f'{name}.parquet'))
+    with open(f'{scratch}.json', 'w') as f:
+        json.dump({'source': source_hash, 'rows': int(stats[ROWS].sum()),
+                   'years': sorted(int(year) for year in stats.index.get_level_values('year').unique())}, f)
+    os.replace(f'{scratch}.json', os.path.join(store_dir, f'{name}.json'))
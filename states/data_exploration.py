@@ -4,12 +4,15 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.graph_objects as go
+import figures
+import instrument
 
 sns.set()
 pd.set_option('display.max_rows', None)
 pd.set_option('display.max_columns', None)
 
 
+@instrument.timed('states/data_exploration')
 def main():
     path = '../data/states'
     data = pd.read_csv(f'{path}/state_mean_accident_data.csv', header=0)
@@ -40,8 +43,7 @@ def main():
     scatter_plot(data, 'body_type_Standard Pickup')
     scatter_plot(data, 'light_condition_Dark – Lighted')
     scatter_plot(data, 'body_type_Minivan')
-
-    plt.show()
+    figures.wait()
 
 
 def choropleth_map(location_series, data_series, title, legend_title):
@@ -73,19 +75,24 @@ def choropleth_map(location_series, data_series, title, legend_title):
         )
     )
 
-    fig.show()
+    # Opens a browser, so only shown interactively
+    if not figures.headless():
+        fig.show()
     # fig.write_image('visualizations/choropleth_accidents_by_state.png')
 
 
 def scatter_plot(df, x, y='accidents_per_100k'):
+    figures.render(draw_scatter_plot, f'visualizations/{y}_vs_{x}.png', df[[x, y]], x, y)
+
+
+def draw_scatter_plot(df, x, y):
     ax = df.plot.scatter(x=x, y=y, figsize=(16, 8), s=120, linewidth=0)
 
     for k, v in df.iterrows():
         ax.annotate(k[1], (v[x], v[y]),
                     xytext=(10, -5), textcoords='offset points',
                     family='sans-serif', fontsize=14, color='darkslategrey')
-    ax.get_figure().savefig(f'visualizations/{y}_vs_{x}.png')
-    plt.show()
+    return ax.get_figure()
 
 
 if __name__ == '__main__':
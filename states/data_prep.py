@@ -1,16 +1,20 @@
 #!/usr/bin/env python3
 
 import pandas as pd
+import state_aggregates
+import instrument
 
 
+@instrument.timed('states/data_prep')
 def main():
     pd.set_option('display.max_columns', None)
 
     path = '../data/states'
 
-    population_data = pd.read_excel(f'{path}/state_populations.xlsx', header=0, index_col='state_name')
-    accident_fatality_data_2015 = pd.read_csv(f'{path}/accident_fatalities_2015.csv', header=0, index_col='state_name')
-    accident_fatality_data_2016 = pd.read_csv(f'{path}/accident_fatalities_2016.csv', header=0, index_col='state_name')
+    with instrument.stage('read_csv'):
+        population_data = pd.read_excel(f'{path}/state_populations.xlsx', header=0, index_col='state_name')
+        accident_fatality_data_2015 = pd.read_csv(f'{path}/accident_fatalities_2015.csv', header=0, index_col='state_name')
+        accident_fatality_data_2016 = pd.read_csv(f'{path}/accident_fatalities_2016.csv', header=0, index_col='state_name')
 
     us_state_codes = {'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR', 'California': 'CA',
                       'Colorado': 'CO', 'Connecticut': 'CT', 'Delaware': 'DE', 'Florida': 'FL', 'Georgia': 'GA',
@@ -51,10 +55,10 @@ def main():
     data.to_csv(f'{path}/state_mean_accident_data.csv', index=False)
 
 
+@instrument.timed('accident_means', rows=len)
 def accident_data_prep():
     path = '../data/accidents'
-    data = pd.read_csv(f'{path}/accident_data_clean.csv', header=0)
-    data.drop(['consecutive_number', 'vehicle_number', 'year', 'latitude', 'longitude', 'month'], axis=1, inplace=True)
+    stats = state_aggregates.load('accidents', f'{path}/accident_data_clean')
 
     cat_cols = ['day_of_week', 'roadway_type', 'intersection', 'light_condition', 'atmospheric_conditions',
                 'manner_of_collision', 'body_type', 'vehicle_conditions', 'part_of_day']
@@ -64,9 +68,11 @@ def accident_data_prep():
                    'multiple_fatalities']
     numeric_cols = ['hour_of_day', 'vehicle_year', 'speed_limit']
 
-    data = pd.get_dummies(data, columns=cat_cols)
-
-    data = data.groupby(['state_name', 'state_number']).mean()
+    # Same columns as get_dummies and a groupby mean over the clean rows
+    data = state_aggregates.state_means(stats, ['state_name', 'state_number'],
+                                        drop=['consecutive_number', 'vehicle_number', 'year', 'latitude', 'longitude',
+                                              'month'],
+                                        cat_cols=cat_cols)
 
     # Remove columns where column mean value is below 0.01
     data = data.loc[:, data.mean() > 0.01]
@@ -74,20 +80,20 @@ def accident_data_prep():
     return data
 
 
+@instrument.timed('person_means', rows=len)
 def person_data_prep():
     path = '../data/persons'
-    data = pd.read_csv(f'{path}/person_data_clean.csv', header=0)
-
-    data.drop(['consecutive_number', 'vehicle_number', 'person_number', 'land_use_urban',
-               'trafficway_type', 'manner_of_collision', 'body_type', 'rollover'], axis=1, inplace=True)
+    stats = state_aggregates.load('persons', f'{path}/person_data_clean')
 
     cat_cols = ['person_type', 'injury_severity', 'seating_position', 'ejection', 'safety_equipment_use']
     binary_cols = ['sex', 'land_use_urban', 'air_bag_deployed', 'fatality']
     numeric_cols = ['age']
 
-    data = pd.get_dummies(data, columns=cat_cols)
-
-    data = data.groupby('state_number').mean()
+    data = state_aggregates.state_means(stats, 'state_number',
+                                        drop=['consecutive_number', 'vehicle_number', 'person_number', 'year',
+                                              'land_use_urban', 'trafficway_type', 'manner_of_collision', 'body_type',
+                                              'rollover'],
+                                        cat_cols=cat_cols)
 
     # Remove columns where column mean value is below 0.01
     data = data.loc[:, data.mean() > 0.01]
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import os
+import argparse
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
@@ -7,12 +9,26 @@ import sklearn.feature_selection as fs
 from sklearn.linear_model import LinearRegression, RidgeCV, ElasticNetCV
 from sklearn.svm import LinearSVR
 import utils
+import scheduler
+import instrument
 
 pd.set_option('display.max_rows', None)
 pd.set_option('display.max_columns', None)
 
 
-def main():
+@instrument.timed('states/models')
+def main(cores=None):
+    scheduler.run(jobs(), cores)
+
+
+def jobs():
+    # One row per state, so the fits are too small to gain from more than one core each
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    return [scheduler.Job('states/Feature Scores', feature_scores, cwd=cwd, max_cores=1)] + \
+           [scheduler.Job(f'states/{name}', fit_model, (name,), cwd=cwd, max_cores=1) for name in models()]
+
+
+def load_data():
     path = '../data/states'
     data = pd.read_csv(f'{path}/state_mean_accident_data.csv', header=0, index_col='state_name')
 
@@ -21,7 +37,11 @@ def main():
 
     labels = data['accidents_per_100k']
     features = data.drop(non_feature_cols, axis=1)
-    feature_names = features.columns
+    return features, labels
+
+
+def feature_scores(n_jobs=1):
+    features, labels = load_data()
 
     scores_df = features.corrwith(labels, axis=0,
                                   method='pearson').to_frame('r_coef')
@@ -31,16 +51,9 @@ def main():
     scores_df.sort_values('p_value', inplace=True)
     print(scores_df)
 
-    # feature_subset_cols = scores_df[scores_df['p_value'] < 0.05].index.tolist()
-    # features = features[feature_subset_cols]
-
-    scaler = StandardScaler()
-    features = scaler.fit_transform(features)
-
-    # X_train, X_test, y_train, y_test = train_test_split(features, labels,
-    #                                                     test_size=0.2, random_state=2020)
 
-    models = {
+def models():
+    return {
         'Linear Regression': (LinearRegression(),
                               'linreg'),
         'Ridge': (RidgeCV(alphas=[0.01, 0.1, 1.0, 10.0],
@@ -55,23 +68,44 @@ def main():
                        'svr')
     }
 
-    for name, (model, suffix) in models.items():
-        print(name)
-        print('-' * 20)
+
+def fit_model(name, n_jobs=1):
+    features, labels = load_data()
+    feature_names = features.columns
+
+    # feature_subset_cols = scores_df[scores_df['p_value'] < 0.05].index.tolist()
+    # features = features[feature_subset_cols]
+
+    scaler = StandardScaler()
+    features = scaler.fit_transform(features)
+
+    # X_train, X_test, y_train, y_test = train_test_split(features, labels,
+    #                                                     test_size=0.2, random_state=2020)
+
+    model, suffix = models()[name]
+
+    print(name)
+    print('-' * 20)
+    with instrument.stage('fit', rows=len(features)):
         model.fit(features, labels)
 
+    with instrument.stage('predict', rows=len(features)):
         y_pred = model.predict(features)
 
-        utils.print_regression_metrics(labels, y_pred)
+    utils.print_regression_metrics(labels, y_pred)
 
-        utils.hist_resids(labels, y_pred, name, suffix)
-        utils.resid_qq(labels, y_pred, name, suffix)
-        utils.resid_plot(labels, y_pred, name, suffix)
+    utils.hist_resids(labels, y_pred, name, suffix)
+    utils.resid_qq(labels, y_pred, name, suffix)
+    utils.resid_plot(labels, y_pred, name, suffix)
 
-        utils.feature_importance_regression(model, feature_names, name, suffix)
-        utils.permutation_importances(model, features, labels, feature_names, name, suffix)
-        print('#' * 50)
+    utils.feature_importance_regression(model, feature_names, name, suffix)
+    utils.permutation_importances(model, features, labels, feature_names, name, suffix, n_jobs=n_jobs)
+    print('#' * 50)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Fit the regression models on the state-level data')
+    parser.add_argument('--cores', type=int, default=None, help='cores to use (default: all)')
+    args = parser.parse_args()
+
+    main(args.cores)
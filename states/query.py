@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 
+import argparse
 import pandas as pd
-from google.cloud import bigquery
-from bq_helper import BigQueryHelper
+import query_backends
 
 
-def main():
+def main(backend='bigquery', fars_dir='../data/fars', cache_dir='../data/query_cache', refresh=False,
+         years=(2015, 2016), max_in_flight=4):
     path = '../data/states'
-    bq_assistant = BigQueryHelper('bigquery-public-data', 'nhtsa_traffic_fatalities')
+    bq_assistant = query_backends.connect(backend, data_dir=fars_dir, cache_dir=cache_dir, refresh=refresh)
 
     """
     Per State Overview
@@ -29,14 +30,22 @@ def main():
         ORDER BY fatalities_per_accident DESC
     """
 
-    accident_fatalities_2015 = bq_assistant.query_to_pandas(QUERY.format(2015))
-    accident_fatalities_2015['year'] = 2015
-    accident_fatalities_2016 = bq_assistant.query_to_pandas(QUERY.format(2016))
-    accident_fatalities_2016['year'] = 2016
+    def write(year, accident_fatalities):
+        accident_fatalities['year'] = year
+        accident_fatalities.to_csv(f'{path}/accident_fatalities_{year}.csv', index=False)
 
-    accident_fatalities_2015.to_csv(f'{path}/accident_fatalities_2015.csv', index=False)
-    accident_fatalities_2016.to_csv(f'{path}/accident_fatalities_2016.csv', index=False)
+    query_backends.extract(bq_assistant, QUERY, years, write, max_in_flight)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Extract the yearly per-state accident and fatality counts')
+    parser.add_argument('--backend', choices=query_backends.BACKENDS, default='bigquery',
+                        help='run the query on BigQuery or on local FARS tables with SQLite')
+    parser.add_argument('--fars-dir', default='../data/fars',
+                        help='directory with the raw FARS table CSVs for the sqlite backend')
+    parser.add_argument('--cache-dir', default='../data/query_cache',
+                        help='directory of the query result cache (empty to disable)')
+    parser.add_argument('--refresh', action='store_true', help='re-run the queries and replace cached results')
+    parser.add_argument('--years', type=int, nargs='+', default=[2015, 2016], help='years to extract')
+    parser.add_argument('--max-in-flight', type=int, default=4, help='maximum number of queries running at once')
+    main(**vars(parser.parse_args()))
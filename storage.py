@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+"""
+    Typed columnar storage for the clean datasets.
+
+    Datasets are addressed by their path without extension, e.g.
+    '../data/accidents/accident_data_clean', and stored as compressed Parquet.
+    String columns are dictionary encoded, so they load back as pandas categoricals
+    and keep their numeric dtypes, without re-parsing text.
+"""
+
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pandas as pd
+import schema
+import instrument
+
+COMPRESSION = 'zstd'
+
+
+def write(data, name, csv=False):
+    """
+        Writes data to name.parquet, and to name.csv as well if csv is True
+    """
+    with instrument.stage('write', rows=len(data)):
+        pq.write_table(to_table(data), f'{name}.parquet', compression=COMPRESSION)
+
+        if csv:
+            data.to_csv(f'{name}.csv', index=False)
+
+
+@instrument.timed('read', rows=len)
+def read(name, columns=None, dtypes=None):
+    """
+        Loads name.parquet through a memory map. Falls back to name.csv for datasets
+        that have not been written in the columnar format yet. Columns listed in dtypes
+        are cast with schema.apply if they were stored with a different type.
+    """
+    if not os.path.exists(f'{name}.parquet') and os.path.exists(f'{name}.csv'):
+        data = pd.read_csv(f'{name}.csv', header=0, usecols=columns)
+    else:
+        data = pq.read_table(f'{name}.parquet', columns=columns, memory_map=True).to_pandas()
+        sort_categories(data)
+
+    return schema.apply(data, dtypes) if dtypes else data
+
+
+def sort_categories(data):
+    """
+        Arrow dictionaries keep values in order of first appearance. Sort them, in place,
+        as astype('category') would, so dummy columns and groupby output keep their order.
+    """
+    for col in data.select_dtypes(include='category').columns:
+        categories = data[col].cat.categories
+        if not categories.is_monotonic_increasing:
+            data[col] = data[col].cat.reorder_categories(categories.sort_values())
+
+
+def size(name):
+    """
+        Number of rows and uncompressed size in bytes of name.parquet
+    """
+    metadata = pq.ParquetFile(f'{name}.parquet').metadata
+    return metadata.num_rows, sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+
+
+def value_range(name, column):
+    """
+        (min, max) of column in name.parquet from the row group statistics, without reading
+        the column. None if it has no rows or a row group has no statistics.
+    """
+    metadata = pq.ParquetFile(f'{name}.parquet').metadata
+    position = metadata.schema.names.index(column)
+    lows, highs = [], []
+    for i in range(metadata.num_row_groups):
+        statistics = metadata.row_group(i).column(position).statistics
+        if statistics is None or not statistics.has_min_max:
+            return None
+        lows.append(statistics.min)
+        highs.append(statistics.max)
+    return (min(lows), max(highs)) if lows else None
+
+
+def read_chunks(name, rows, columns=None):
+    """
+        Iterates over name.parquet in frames of at most rows rows. Falls back to name.csv as
+        read does.
+    """
+    if not os.path.exists(f'{name}.parquet') and os.path.exists(f'{name}.csv'):
+        yield from pd.read_csv(f'{name}.csv', header=0, usecols=columns, chunksize=rows)
+        return
+
+    parquet_file = pq.ParquetFile(f'{name}.parquet', memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=rows, columns=columns):
+        data = batch.to_pandas()
+        sort_categories(data)
+        yield data
+
+
+class Writer:
+    """
+        Appends frames to name.parquet (and name.csv) one chunk at a time, so a dataset
+        can be written without holding all of it in memory.
+    """
+
+    def __init__(self, name, csv=False):
+        self.name = name
+        self.csv = csv
+        self.rows = 0
+        self.schema = None
+        self.writer = None
+
+    def write(self, data):
+        if len(data) == 0:
+            return
+
+        table = to_table(data)
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = pq.ParquetWriter(f'{self.name}.parquet', self.schema, compression=COMPRESSION)
+        else:
+            table = table.cast(self.schema)
+        self.writer.write_table(table)
+
+        if self.csv:
+            data.to_csv(f'{self.name}.csv', index=False, mode='w' if self.rows == 0 else 'a', header=self.rows == 0)
+        self.rows += len(data)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def to_table(data):
+    table = pa.Table.from_pandas(data, preserve_index=False)
+
+    for i, field in enumerate(table.schema):
+        if pa.types.is_string(field.type):
+            table = table.set_column(i, field.name, table.column(i).dictionary_encode())
+        elif pa.types.is_dictionary(field.type):
+            # Categoricals come in with the smallest index type that fits; keep one type per column
+            table = table.set_column(i, field.name, table.column(i).cast(pa.dictionary(pa.int32(), field.type.value_type)))
+
+    return table
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""
+    Fatal accident counts of the clean accident table by year x state x month x day of week x
+    hour of day, for the temporal breakdowns of accidents/data_exploration.
+
+    The cube is a dense array of counts (one cell per combination, a few MB for many years), so
+    any breakdown is a sum over its axes instead of a groupby over the rows. Counts are stored
+    per year. update() replaces the cube with the counts of the whole clean dataset, as
+    data_prep rewrites it; with append it replaces only the years present in the data it is
+    given, so appending a year costs one pass over that year's rows. load() rebuilds the cube
+    unless it was recorded for the current contents of the dataset and its rows and years
+    match the dataset's Parquet metadata.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import storage
+import pipeline
+import feature_store
+
+CUBE_PATH = '../data/accidents/aggregates/temporal_cube.npz'
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June',
+          'July', 'August', 'September', 'October', 'November', 'December']
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+HOURS = list(range(24))
+# State FIPS codes run from 1 to 56
+STATES = list(range(57))
+
+AXES = ['year', 'state_number', 'month', 'day_of_week', 'hour_of_day']
+
+
+class Cube:
+    """
+        Counts indexed [year, state_number, month, day_of_week, hour_of_day], with months and
+        days in calendar order. Accumulates over chunks of rows (which may split a year
+        between chunks) for update().
+    """
+
+    def __init__(self, years=(), counts=None):
+        self.years = np.asarray(years, dtype=np.int64)
+        shape = (len(self.years), len(STATES), len(MONTHS), len(DAYS), len(HOURS))
+        self.counts = np.zeros(shape, dtype=np.int64) if counts is None else counts
+
+    def add(self, data):
+        years = np.union1d(self.years, data['year'].unique())
+        if len(years) > len(self.years):
+            self.counts = self.reindex(years).counts
+            self.years = years
+
+        index = [np.searchsorted(self.years, data['year'].to_numpy()),
+                 data['state_number'].to_numpy(dtype=np.int64),
+                 positions(data['month'], MONTHS),
+                 positions(data['day_of_week'], DAYS),
+                 data['hour_of_day'].to_numpy(dtype=np.int64)]
+        cells = np.ravel_multi_index(index, self.counts.shape)
+        self.counts += np.bincount(cells, minlength=self.counts.size).reshape(self.counts.shape)
+        return data
+
+    def reindex(self, years):
+        counts = np.zeros((len(years),) + self.counts.shape[1:], dtype=np.int64)
+        counts[np.searchsorted(years, self.years)] = self.counts
+        return Cube(years, counts)
+
+    def select(self, years=None, states=None):
+        """
+            Sub-cube of the given years and state numbers (all if None)
+        """
+        counts = self.counts
+        if years is not None:
+            counts = counts[np.isin(self.years, years)]
+        if states is not None:
+            counts = counts[:, np.isin(STATES, states)]
+        return counts
+
+    def total(self, by, years=None, states=None):
+        """
+            Counts summed over every axis not in by, as a Series indexed by the by axes. Empty
+            cells are dropped, as a groupby over the rows would not have them.
+        """
+        counts = self.select(years, states)
+        counts = counts.sum(axis=tuple(i for i, axis in enumerate(AXES) if axis not in by))
+        kept = [axis for axis in AXES if axis in by]
+        counts = np.moveaxis(counts, [kept.index(axis) for axis in by], list(range(len(by))))
+
+        labels = {'year': self.years if years is None else self.years[np.isin(self.years, years)],
+                  'state_number': STATES if states is None else [s for s in STATES if s in states],
+                  'month': MONTHS, 'day_of_week': DAYS, 'hour_of_day': HOURS}
+        if len(by) == 1:
+            index = pd.Index(labels[by[0]], name=by[0])
+        else:
+            index = pd.MultiIndex.from_product([labels[axis] for axis in by], names=by)
+        totals = pd.Series(counts.ravel(), index=index)
+        return totals[totals > 0]
+
+
+def positions(values, labels):
+    """
+        Position of each value in labels, looked up once per distinct value
+    """
+    codes, uniques = pd.factorize(values)
+    table = pd.Index(labels).get_indexer(uniques)
+    if (table < 0).any() or (codes < 0).any():
+        raise ValueError(f'Unexpected values: {sorted(set(uniques[table < 0]))}')
+    return table[codes]
+
+
+def update(data, source, path=CUBE_PATH, append=False):
+    """
+        Store the counts of data (all rows of the clean dataset source, or a Cube of them) and
+        record the source they now match. With append, data holds all rows of only the years
+        being added or replaced, and the stored counts of other years are kept.
+    """
+    cube = data
+    if not isinstance(data, Cube):
+        cube = Cube()
+        cube.add(data)
+    stored = read(path) if append else None
+    if stored is not None:
+        kept = stored.years[~np.isin(stored.years, cube.years)]
+        years = np.union1d(kept, cube.years)
+        merged = cube.reindex(years)
+        merged.counts[np.searchsorted(years, kept)] = stored.counts[np.isin(stored.years, kept)]
+        cube = merged
+    write(cube, feature_store.file_hash(source), path)
+
+
+def load(source, path=CUBE_PATH, memory_budget=512):
+    """
+        Cube of the clean dataset source. If it was not updated from the current contents of
+        source, or does not cover its years and rows, it is rebuilt from source in chunks within
+        memory_budget (MB).
+    """
+    digest = feature_store.file_hash(source)
+    cube = read(path, digest)
+    if cube is None or not covers(cube, source):
+        print(f'Rebuilding temporal cube from {source}')
+        cube = Cube()
+        for chunk in storage.read_chunks(source, pipeline.stored_chunk_rows(source, memory_budget), columns=AXES):
+            cube.add(chunk)
+        write(cube, digest, path)
+    return cube
+
+
+def covers(cube, source):
+    """
+        Whether cube holds the same years and number of rows as the clean dataset source, by
+        the Parquet metadata of source. A source stored only as CSV cannot be checked without a
+        scan, so the cube is rebuilt for it.
+    """
+    if not os.path.exists(f'{source}.parquet'):
+        return False
+    years = (int(cube.years[0]), int(cube.years[-1])) if len(cube.years) else None
+    return cube.counts.sum() == storage.size(source)[0] and storage.value_range(source, 'year') == years
+
+
+def read(path=CUBE_PATH, source_hash=None):
+    """
+        The stored cube, or None if there is none or it was built from other than source_hash
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as saved:
+        if source_hash is not None and str(saved['source']) != source_hash:
+            return None
+        return Cube(saved['years'], saved['counts'])
+
+
+def write(cube, source_hash, path=CUBE_PATH):
+    # Saved aside and renamed, so a reader never loads a partial cube
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    scratch = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez_compressed(scratch, years=cube.years, counts=cube.counts, source=source_hash)
+    os.replace(scratch, path)
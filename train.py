@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+"""
+    Fit every model of the accident, person and state analyses under one core budget.
+
+    Run from the repository root after the data_prep scripts:
+        python train.py [--cores N]
+"""
+
+import argparse
+import scheduler
+import figures
+import instrument
+from accidents import models as accident_models, knn_model as accident_knn
+from persons import models as person_models, knn_model as person_knn
+from states import models as state_models
+
+
+@instrument.timed('train')
+def main(cores=None, ann=False, headless=False):
+    if headless:
+        figures.set_headless()
+
+    # Longest jobs first, so the short ones fill in around them
+    scheduler.run(accident_knn.jobs() + person_knn.jobs(ann) + accident_models.jobs() + person_models.jobs() +
+                  state_models.jobs(), cores)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit all models under one core budget')
+    parser.add_argument('--cores', type=int, default=None, help='cores to use (default: all)')
+    parser.add_argument('--ann', action='store_true', help='score persons KNN with the approximate index')
+    parser.add_argument('--headless', action='store_true',
+                        help='render figures in the background without showing them')
+    args = parser.parse_args()
+
+    main(args.cores, args.ann, args.headless)
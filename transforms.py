@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+"""
+    Vectorized column transforms shared by the data_prep scripts. Each one works on
+    a whole column at once instead of calling a Python function per row.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def replace_with_nan(data, values):
+    """
+        Sets every string cell equal to one of values to NaN, in place
+    """
+    for col in data.select_dtypes(include='object').columns:
+        set_nan(data, col, data[col].isin(values))
+
+
+def set_nan(data, col, mask):
+    values = data[col].to_numpy(copy=True)
+    values[np.asarray(mask)] = np.nan
+    data[col] = values
+
+
+def lookup(col, func, na_value=np.nan):
+    """
+        Evaluates func once per distinct value of col and broadcasts the results back to every row
+    """
+    codes, uniques = pd.factorize(col)
+    # NaN rows get code -1, which picks na_value from the end of the table
+    table = np.append(np.asarray(func(pd.Series(uniques))), na_value)
+    return table[codes]
+
+
+def contains(col, *substrings):
+    """
+        Boolean mask of rows whose string value contains any of substrings (False for NaN)
+    """
+    def any_substring(values):
+        mask = np.zeros(len(values), dtype=bool)
+        for substring in substrings:
+            mask |= values.str.contains(substring, regex=False).to_numpy(dtype=bool)
+        return mask
+
+    return lookup(col, any_substring, False)
@@ -2,38 +2,111 @@
 
 import sys
 import math
+import numbers
 import numpy as np
-import scipy.stats as ss
-from sklearn import metrics
-from sklearn.inspection import permutation_importance
-import matplotlib.pyplot as plt
-import seaborn as sns
+import figures
+import scoring
+import instrument
 
-sns.set()
+# sklearn, scipy.stats, matplotlib and seaborn are imported by the functions that use them,
+# so that importing utils for the metrics printers stays fast
+
+# sklearn.metrics functions by scoring name
+PREDICTION_SCORES = {'accuracy': 'accuracy_score',
+                     'f1': 'f1_score',
+                     'precision': 'precision_score',
+                     'recall': 'recall_score'}
 
 
 def print_metrics(labels, preds):
     """
         Prints confusion matrix and metrics scores for a binary classification
     """
-    scores = metrics.precision_recall_fscore_support(labels, preds)
-    conf = metrics.confusion_matrix(labels, preds)
+    return print_confusion(scoring.confusion(labels, preds))
+
+
+def print_confusion(result):
+    """
+        Prints the confusion matrix and metrics scores of a scoring.BinaryMetrics
+    """
     print(' ' * 4 + 'Confusion Matrix')
     print(' ' * 17 + 'Predict Positive    Predict Negative')
-    print('Actual Positive         {}                 {}'.format(conf[1, 1], conf[1, 0]))
-    print('Actual Negative         {}                 {}'.format(conf[0, 1], conf[0, 0]))
+    print('Actual Positive         {}                 {}'.format(result.tp, result.fn))
+    print('Actual Negative         {}                 {}'.format(result.fp, result.tn))
     print()
-    print('Accuracy: {:.3f}'.format(metrics.accuracy_score(labels, preds)))
+    print('Accuracy: {:.3f}'.format(result.accuracy))
     print()
     print(' ' * 4 + 'Classification Report')
     print(' ' * 11 + 'Positive    Negative')
-    print('Num cases    {}      {}'.format(scores[3][1], scores[3][0]))
-    print('Precision    {:.2f}       {:.2f}'.format(scores[0][1], scores[0][0]))
-    print('Recall       {:.2f}       {:.2f}'.format(scores[1][1], scores[1][0]))
-    print('F1 Score     {:.2f}       {:.2f}'.format(scores[2][1], scores[2][0]))
+    print('Num cases    {}      {}'.format(result.n_positive, result.n_negative))
+    print('Precision    {:.2f}       {:.2f}'.format(result.precision, result.negative_precision))
+    print('Recall       {:.2f}       {:.2f}'.format(result.recall, result.specificity))
+    print('F1 Score     {:.2f}       {:.2f}'.format(result.f1, result.negative_f1))
+    return result
+
+
+def print_best_threshold(labels, probs, metric='f1'):
+    """
+        Prints the probability threshold that maximizes metric and the scores at it
+    """
+    return print_sweep_best(scoring.threshold_sweep(labels, probs), metric)
+
+
+def print_sweep_best(sweep, metric='f1'):
+    threshold, result = sweep.best(metric)
+    print()
+    print('Best {} threshold: {:.3f}'.format(metric, threshold))
+    print('Precision {:.2f}  Recall {:.2f}  F1 Score {:.2f}  Accuracy {:.3f}'.format(
+        result.precision, result.recall, result.f1, result.accuracy))
+    return threshold, result
+
+
+def score_classifier(model, X, y, name, suffix, chunk_rows=None, n_bins=1000, n_jobs=None):
+    """
+        Prints the metrics, best threshold and ROC curve of a binary classifier on X, as
+        print_metrics, print_best_threshold and roc_curve do.
+
+        With chunk_rows, for test sets too large to predict at once, X is predicted in chunks
+        of chunk_rows so only one chunk of predictions per worker is in memory. Chunks are
+        scored on n_jobs workers and their accumulators merged. The threshold and curve are
+        then at the edges of n_bins score bins (see scoring.ROCHistogram).
+    """
+    if chunk_rows is None:
+        y_pred = model.predict(X)
+        y_probs = model.predict_proba(X)[:, 1]
+        result = print_metrics(y, y_pred)
+        print_best_threshold(y, y_probs)
+        roc_curve(y, y_probs, name, suffix)
+        return result
+
+    from joblib import Parallel, delayed
+
+    y = np.asarray(y)
+    chunks = Parallel(n_jobs=n_jobs)(
+        delayed(score_chunk)(model, X[start:start + chunk_rows], y[start:start + chunk_rows], n_bins)
+        for start in range(0, len(y), chunk_rows)
+    )
+
+    counts, roc = scoring.ConfusionCounts(), scoring.ROCHistogram(n_bins)
+    for chunk_counts, chunk_roc in chunks:
+        counts.merge(chunk_counts)
+        roc.merge(chunk_roc)
+
+    result = print_confusion(counts.result())
+    print_sweep_best(roc.sweep())
+    binned_roc_curve(roc, name, suffix)
+    return result
+
+
+def score_chunk(model, X, y, n_bins):
+    counts = scoring.ConfusionCounts().update(y, model.predict(X))
+    roc = scoring.ROCHistogram(n_bins).update(y, model.predict_proba(X)[:, 1])
+    return counts, roc
 
 
 def print_regression_metrics(y_true, y_preds):
+    from sklearn import metrics
+
     print('Mean Square Error      = {:.3f}'.format(metrics.mean_squared_error(y_true, y_preds)))
     print('Root Mean Square Error = {:.3f}'.format(math.sqrt(metrics.mean_squared_error(y_true, y_preds))))
     print('Mean Absolute Error    = {:.3f}'.format(metrics.mean_absolute_error(y_true, y_preds)))
@@ -41,9 +114,33 @@ def print_regression_metrics(y_true, y_preds):
     print('R^2                    = {:.3f}'.format(metrics.r2_score(y_true, y_preds)))
 
 
+def print_regression_errors(errors):
+    """
+        print_regression_metrics from a scoring.RegressionErrors accumulator, for predictions
+        scored in chunks (the median is approximate, within errors.relative_accuracy)
+    """
+    print('Mean Square Error      = {:.3f}'.format(errors.mse))
+    print('Root Mean Square Error = {:.3f}'.format(errors.rmse))
+    print('Mean Absolute Error    = {:.3f}'.format(errors.mae))
+    print('Median Absolute Error  = {:.3f}'.format(errors.median_absolute_error))
+    print('R^2                    = {:.3f}'.format(errors.r2))
+
+
 def roc_curve(labels, probs, name, suffix):
+    from sklearn import metrics
+
     fpr, tpr, thresholds = metrics.roc_curve(labels, probs)
     roc_auc = metrics.auc(fpr, tpr)
+    figures.render(draw_roc_curve, f'visualizations/roc_curve_{suffix}.png', fpr, tpr, roc_auc, name)
+
+
+def binned_roc_curve(roc, name, suffix):
+    fpr, tpr, _ = roc.curve()
+    figures.render(draw_roc_curve, f'visualizations/roc_curve_{suffix}.png', fpr, tpr, roc.auc(), name)
+
+
+def draw_roc_curve(fpr, tpr, roc_auc, name):
+    plt = figures.pyplot()
 
     fig, ax = plt.subplots(figsize=(16, 8))
     ax.plot(fpr, tpr, label=f'ROC curve (AUC = {roc_auc:.2f})')
@@ -55,8 +152,7 @@ def roc_curve(labels, probs, name, suffix):
     plt.xlabel('False Positive Rate (1 - Specificity)')
     plt.ylabel('True Positive Rate (Sensitivity)')
     plt.legend(loc='lower right')
-    plt.show()
-    fig.savefig(f'visualizations/roc_curve_{suffix}.png')
+    return fig
 
 
 def feature_importance(model, feature_names, name, suffix, n_features=15):
@@ -71,76 +167,204 @@ def feature_importance(model, feature_names, name, suffix, n_features=15):
             print(ae)
             sys.exit(1)
 
-    y_ticks = np.arange(0, len(feature_importances))
-    fig, ax = plt.subplots(figsize=(12, 8))
-    ax.barh(y_ticks, feature_importances[sorted_idx])
-    ax.set_yticklabels(feature_names[sorted_idx])
-    ax.set_yticks(y_ticks)
-    ax.set_title(f'{name} Feature Importances', fontsize=16)
-    ax.tick_params(axis='both', which='major', labelsize=14)
-    plt.show()
-    fig.savefig(f'visualizations/feature_importances_{suffix}.png')
+    figures.render(draw_importances, f'visualizations/feature_importances_{suffix}.png',
+                   feature_importances[sorted_idx], feature_names[sorted_idx], name)
 
 
 def feature_importance_regression(model, feature_names, name, suffix, n_features=15):
     feature_importances = model.coef_
     sorted_idx = abs(feature_importances).argsort()[-n_features:]
 
-    y_ticks = np.arange(0, n_features)
+    figures.render(draw_importances, f'visualizations/feature_importances_{suffix}.png',
+                   feature_importances[sorted_idx], feature_names[sorted_idx], name)
+
+
+def draw_importances(importances, feature_names, name):
+    plt = figures.pyplot()
+
+    y_ticks = np.arange(0, len(importances))
     fig, ax = plt.subplots(figsize=(12, 8))
-    ax.barh(y_ticks, feature_importances[sorted_idx])
-    ax.set_yticklabels(feature_names[sorted_idx])
+    ax.barh(y_ticks, importances)
     ax.set_yticks(y_ticks)
+    ax.set_yticklabels(feature_names)
     ax.set_title(f'{name} Feature Importances', fontsize=16)
     ax.tick_params(axis='both', which='major', labelsize=14)
-    plt.show()
-    fig.savefig(f'visualizations/feature_importances_{suffix}.png')
+    return fig
 
 
-def permutation_importances(model, X, y, feature_names, name, suffix, dataset='test', n_features=15):
-    result = permutation_importance(model, X, y, n_repeats=10, random_state=2020)
+def permutation_importances(model, X, y, feature_names, name, suffix, dataset='test', n_features=15,
+                            n_jobs=None, max_samples=1.0, tol=None):
+    result = permutation_importance(model, X, y, n_repeats=10, random_state=2020,
+                                    n_jobs=n_jobs, max_samples=max_samples, tol=tol)
     sorted_idx = result.importances_mean.argsort()[-n_features:]
 
+    # Features stopped early by tol have fewer repeats
+    importances = [imp[~np.isnan(imp)] for imp in result.importances[sorted_idx]]
+    figures.render(draw_permutation_importances, f'visualizations/permutation_importances_{suffix}_{dataset}.png',
+                   importances, feature_names[sorted_idx], name, dataset)
+
+
+def draw_permutation_importances(importances, feature_names, name, dataset):
+    plt = figures.pyplot()
+
     fig, ax = plt.subplots(figsize=(12, 8))
-    ax.boxplot(result.importances[sorted_idx].T,
-               vert=False, labels=feature_names[sorted_idx])
+    ax.boxplot(importances, vert=False, labels=feature_names)
     ax.set_title(f'{name} Permutation Importances ({dataset} set)', fontsize=16)
     ax.tick_params(axis='both', which='major', labelsize=14)
-    plt.show()
-    fig.savefig(f'visualizations/permutation_importances_{suffix}_{dataset}.png')
+    return fig
+
+
+@instrument.timed('permutation_importance')
+def permutation_importance(model, X, y, n_repeats=10, random_state=None, n_jobs=None, max_samples=1.0,
+                           tol=None, batch_bytes=2 ** 28):
+    """
+        Same result as sklearn.inspection.permutation_importance with the default scorer
+        (same permutations from the same random_state), but the baseline is scored once and
+        the permuted copies of X for a feature are scored in batches of one predict call.
+
+        Features run in parallel on n_jobs. max_samples subsamples the rows per feature.
+        With tol, a feature stops once the 95% confidence half-width of its mean importance
+        is within tol (checked after each batch of at most 5 repeats); its remaining repeats
+        are NaN in result.importances.
+    """
+    from joblib import Parallel, delayed
+    from sklearn.utils import Bunch, check_random_state
+
+    X = np.asarray(X)
+    y = np.asarray(y)
+    if not isinstance(max_samples, numbers.Integral):
+        max_samples = int(max_samples * X.shape[0])
+    score = prediction_score(model)
+
+    # Copies of X per predict call, within batch_bytes
+    batch_size = int(min(n_repeats, max(1, batch_bytes // max(1, max_samples * X.shape[1] * X.itemsize))))
+    if tol is not None:
+        # Small enough batches for the early stop to save work
+        batch_size = min(batch_size, 5)
+
+    seed = check_random_state(random_state).randint(np.iinfo(np.int32).max + 1)
+    baseline = score(y, model.predict(X))
+
+    importances = Parallel(n_jobs=n_jobs)(
+        delayed(feature_importances)(model, X, y, col, seed, n_repeats, score, max_samples, baseline,
+                                     batch_size, tol)
+        for col in range(X.shape[1])
+    )
+    importances = np.array(importances)
+    return Bunch(importances_mean=np.nanmean(importances, axis=1),
+                 importances_std=np.nanstd(importances, axis=1),
+                 importances=importances)
+
+
+def feature_importances(model, X, y, col, seed, n_repeats, score, max_samples, baseline, batch_size, tol):
+    """
+        Importances of column col over n_repeats permutations
+    """
+    from sklearn.utils import check_random_state
+    from sklearn.utils.random import sample_without_replacement
+
+    random_state = check_random_state(seed)
+    if max_samples < X.shape[0]:
+        rows = sample_without_replacement(X.shape[0], max_samples, random_state=random_state)
+        X, y = X[rows], y[rows]
+    n_rows = X.shape[0]
+
+    # Each permutation is applied to the previous one, as in sklearn
+    column = X[:, col].copy()
+    shuffling_idx = np.arange(n_rows)
+    stacked = np.tile(X, (batch_size, 1))
+
+    importances = np.full(n_repeats, np.nan)
+    done = 0
+    while done < n_repeats:
+        batch = min(batch_size, n_repeats - done)
+        for i in range(batch):
+            random_state.shuffle(shuffling_idx)
+            column = column[shuffling_idx]
+            stacked[i * n_rows:(i + 1) * n_rows, col] = column
+
+        preds = model.predict(stacked[:batch * n_rows])
+        for i in range(batch):
+            importances[done + i] = baseline - score(y, preds[i * n_rows:(i + 1) * n_rows])
+        done += batch
+
+        if tol is not None and done >= 3 and done < n_repeats:
+            half_width = 1.96 * np.std(importances[:done], ddof=1) / np.sqrt(done)
+            if half_width <= tol:
+                break
+    return importances
+
+
+def prediction_score(model):
+    """
+        Metric of (y_true, y_pred) that matches model.score
+    """
+    from sklearn import metrics
+    from sklearn.base import is_classifier
+    from sklearn.linear_model import LogisticRegressionCV
+
+    if not is_classifier(model):
+        return metrics.r2_score
+    # LogisticRegressionCV scores with its own CV metric
+    if isinstance(model, LogisticRegressionCV) and model.scoring is not None:
+        if model.scoring not in PREDICTION_SCORES:
+            raise ValueError(f'Unsupported scoring for permutation importance: {model.scoring}')
+        return getattr(metrics, PREDICTION_SCORES[model.scoring])
+    return metrics.accuracy_score
 
 
 def hist_resids(y_true, y_preds, name, suffix):
     # Compute vector of residuals
     resids = np.subtract(y_true, y_preds)
+    figures.render(draw_hist_resids, f'visualizations/residuals_hist_{suffix}.png', resids, name)
+
+
+def draw_hist_resids(resids, name):
+    import seaborn as sns
+    plt = figures.pyplot()
+
+    fig = plt.figure()
     # Make residuals histogram
     sns.distplot(resids)
     plt.title(f'{name}: Histogram of residuals')
     plt.xlabel('Residual value')
     plt.ylabel('Count')
-    plt.show()
-    plt.savefig(f'visualizations/residuals_hist_{suffix}.png')
+    return fig
 
 
 def resid_qq(y_true, y_preds, name, suffix):
     # Compute vector of residuals
     resids = np.subtract(y_true, y_preds)
+    figures.render(draw_resid_qq, f'visualizations/residuals_qq_{suffix}.png', resids, name)
+
+
+def draw_resid_qq(resids, name):
+    import scipy.stats as ss
+    plt = figures.pyplot()
+
+    fig = plt.figure()
     # Make residuals quantile-quantile plot
     ss.probplot(resids, plot=plt)
     plt.title(f'{name}: Residuals vs. Predicted values')
     plt.xlabel('Predicted value')
     plt.ylabel('Residual')
-    plt.show()
-    plt.savefig(f'visualizations/residuals_qq_{suffix}.png')
+    return fig
 
 
 def resid_plot(y_true, y_preds, name, suffix):
     # Compute vector of residuals
     resids = np.subtract(y_true, y_preds)
+    figures.render(draw_resid_plot, f'visualizations/residuals_scatter_{suffix}.png', y_preds, resids, name)
+
+
+def draw_resid_plot(y_preds, resids, name):
+    import seaborn as sns
+    plt = figures.pyplot()
+
+    fig = plt.figure()
     # Make residuals scatter plot
-    sns.regplot(y_preds, resids, fit_reg=False)
+    sns.regplot(x=y_preds, y=resids, fit_reg=False)
     plt.title(f'{name}: Residuals vs. Predicted values')
     plt.xlabel('Predicted value')
     plt.ylabel('Residual')
-    plt.show()
-    plt.savefig(f'visualizations/residuals_scatter_{suffix}.png')
+    return fig